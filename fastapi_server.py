@@ -1,9 +1,19 @@
+import asyncio
+import json
+import os
+import sys
 import time
 import logging
 from fastapi import FastAPI, HTTPException, Response
 from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from jobs import FINISHED, JobQueueFull, job_manager
+import http_session
+
+# The bot's streaming Lighthouse extractor (stdlib only); appended so same-named root modules win
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sloelux-perfbot'))
+from lighthouse import AuditExtractor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +37,17 @@ request_latency = Histogram('request_latency_seconds', 'Request latency in secon
 performance_score = Gauge('performance_score', 'Current performance score')
 lcp_gauge = Gauge('largest_contentful_paint_seconds', 'Largest Contentful Paint in seconds')
 tbt_gauge = Gauge('total_blocking_time_seconds', 'Total Blocking Time in seconds')
+jobs_submitted = Counter('jobs_submitted_total', 'Background jobs accepted', ['kind'])
+jobs_rejected = Counter('jobs_rejected_total', 'Background jobs refused because the queue was full', ['kind'])
+job_queue_depth = Gauge('job_queue_depth', 'Background jobs waiting for a worker')
+job_queue_depth.set_function(lambda: job_manager.stats()['queued'])
+
+# Seconds between keep-alive comments on idle job event streams
+JOB_EVENTS_HEARTBEAT = 15
+
+# PageSpeed Insights, for /analyze; without a key the audit job returns demo figures
+PSI_API_URL = os.getenv('PSI_API_URL', 'https://www.googleapis.com/pagespeedonline/v5/runPagespeed')
+PSI_KEY = os.getenv('PSI_KEY')
 
 # Simulated performance data (replace with real data in production)
 PERFORMANCE_DATA = {
@@ -54,7 +75,7 @@ async def get_performance():
     http_requests_total.labels(method='GET', endpoint='/performance').inc()
     start_time = time.time()
     # Simulate fetching performance data (replace with real logic in production)
-    time.sleep(0.1)  # Simulate delay
+    await asyncio.sleep(0.1)  # Simulate delay without blocking the event loop
     request_latency.labels(method='GET', endpoint='/performance').observe(time.time() - start_time)
     return PERFORMANCE_DATA
 
@@ -73,38 +94,152 @@ async def update_metrics(data: dict):
     request_latency.labels(method='POST', endpoint='/update-metrics').observe(time.time() - start_time)
     return {"status": "success", "message": "Metrics updated"}
 
-@app.post("/optimize")
-async def optimize(data: dict):
-    """Endpoint to handle optimization requests."""
-    http_requests_total.labels(method='POST', endpoint='/optimize').inc()
-    start_time = time.time()
-    
-    optimization_type = data.get('type')
-    if not optimization_type:
-        raise HTTPException(status_code=400, detail="Optimization type is required")
-    
-    # Simulate optimization process
-    time.sleep(1)  # Simulate processing time
+def submit_job(kind, func, params):
+    """Queue a background job and answer 202 with where to follow it, or 429 when saturated"""
+    try:
+        job = job_manager.submit(kind, func, params)
+    except JobQueueFull as e:
+        jobs_rejected.labels(kind=kind).inc()
+        raise HTTPException(status_code=429, detail=f"Job queue is full ({e})",
+                            headers={"Retry-After": str(job_manager.retry_after())})
+    jobs_submitted.labels(kind=kind).inc()
+    return JSONResponse(status_code=202, content={
+        **job.to_dict(),
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    })
+
+async def run_optimization(job, issue_type):
+    """Simulated optimisation (replace with real theme patching in production)"""
+    for step in range(1, 5):
+        await asyncio.sleep(0.25)  # Simulate processing time
+        job.update(step / 5, f"Optimizing {issue_type} ({step}/4)")
     
     # Update performance metrics after optimization
-    if optimization_type == 'images':
+    if issue_type == 'images':
         PERFORMANCE_DATA['score'] = min(100, PERFORMANCE_DATA['score'] + 2)
         PERFORMANCE_DATA['lcp'] = max(0.1, PERFORMANCE_DATA['lcp'] - 0.2)
-    elif optimization_type == 'css':
+    elif issue_type == 'css':
         PERFORMANCE_DATA['score'] = min(100, PERFORMANCE_DATA['score'] + 1)
         PERFORMANCE_DATA['tbt'] = max(0.1, PERFORMANCE_DATA['tbt'] - 0.1)
-    elif optimization_type == 'js':
+    elif issue_type == 'js':
         PERFORMANCE_DATA['score'] = min(100, PERFORMANCE_DATA['score'] + 1)
         PERFORMANCE_DATA['tbt'] = max(0.1, PERFORMANCE_DATA['tbt'] - 0.1)
     
+    return {
+        "message": f"Optimization completed for {issue_type}",
+        "new_metrics": dict(PERFORMANCE_DATA)
+    }
+
+def pagespeed_audit(url):
+    """One mobile PageSpeed Insights run, reduced to the metrics /performance reports (seconds)"""
+    extractor = AuditExtractor(url, ('largest-contentful-paint', 'total-blocking-time'))
+    with http_session.get(PSI_API_URL, params={
+        'url': url, 'strategy': 'mobile', 'category': 'performance', 'key': PSI_KEY
+    }, timeout=120, stream=True) as response:
+        response.raise_for_status()
+        # Only the audits we read are decoded while the multi-megabyte body streams in
+        for chunk in response.iter_content(1 << 16):
+            extractor.feed(chunk)
+    report = extractor.finish()
+    if report.performance_score is None:
+        raise RuntimeError(f"PageSpeed Insights returned no Lighthouse result for {url}")
+    return {
+        'score': round(report.performance_score * 100),
+        'lcp': round(report.numeric('largest-contentful-paint') / 1000, 3),
+        'tbt': round(report.numeric('total-blocking-time') / 1000, 3),
+        'inp': report.field_inp_ms / 1000 if report.field_inp_ms is not None else None
+    }
+
+async def run_analysis(job, urls):
+    """PageSpeed Insights audit of each URL; demo figures, labelled as such, when PSI_KEY is not set"""
+    results = []
+    for i, url in enumerate(urls, start=1):
+        if PSI_KEY:
+            try:
+                results.append({"url": url, "source": "pagespeed", **await asyncio.to_thread(pagespeed_audit, url)})
+            except Exception as e:
+                logger.warning("PageSpeed audit of %s failed: %s", url, e)
+                results.append({"url": url, "source": "pagespeed", "error": str(e)})
+        else:
+            await asyncio.sleep(0.5)  # Simulate an audit
+            results.append({"url": url, "source": "demo", **PERFORMANCE_DATA})
+        job.update(i / len(urls), f"Audited {url} ({i}/{len(urls)})")
+    if not PSI_KEY:
+        return {"demo": True, "message": "PSI_KEY is not set: these are demo figures, not audits of the URLs",
+                "results": results}
+    return {"results": results}
+
+@app.post("/optimize", status_code=202)
+async def optimize(data: dict):
+    """Start an optimization job; follow it at /jobs/{id}."""
+    http_requests_total.labels(method='POST', endpoint='/optimize').inc()
+    start_time = time.time()
+    
+    optimization_type = data.get('type')
+    if not optimization_type:
+        raise HTTPException(status_code=400, detail="Optimization type is required")
+    
+    response = submit_job('optimize', run_optimization, {'issue_type': optimization_type})
     request_latency.labels(method='POST', endpoint='/optimize').observe(time.time() - start_time)
+    return response
+
+@app.post("/analyze", status_code=202)
+async def analyze(data: dict):
+    """Start a performance audit job for the given URLs; follow it at /jobs/{id}."""
+    http_requests_total.labels(method='POST', endpoint='/analyze').inc()
+    start_time = time.time()
     
+    urls = data.get('urls', ["https://sloelux.com"])
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+        raise HTTPException(status_code=400, detail="urls must be a non-empty list of strings")
+    
+    response = submit_job('analyze', run_analysis, {'urls': urls})
+    request_latency.labels(method='POST', endpoint='/analyze').observe(time.time() - start_time)
+    return response
+
+@app.get("/jobs")
+async def list_jobs():
+    """Job queue state and recent jobs."""
+    http_requests_total.labels(method='GET', endpoint='/jobs').inc()
     return {
-        "status": "success",
-        "message": f"Optimization completed for {optimization_type}",
-        "new_metrics": PERFORMANCE_DATA
+        "stats": job_manager.stats(),
+        "jobs": [job.to_dict() for job in sorted(job_manager.jobs.values(), key=lambda j: -j.created_at)]
     }
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """State, progress and (once finished) result of a job."""
+    http_requests_total.labels(method='GET', endpoint='/jobs/{id}').inc()
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events: one `progress` event per change, then a final `done` event."""
+    http_requests_total.labels(method='GET', endpoint='/jobs/{id}/events').inc()
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def stream():
+        version = None
+        while True:
+            if job.version != version:
+                version = job.version
+                event = "done" if job.status in FINISHED else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if event == "done":
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            await job.wait_for_change(version, JOB_EVENTS_HEARTBEAT)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
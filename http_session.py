@@ -0,0 +1,27 @@
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared keep-alive session; connections are pooled per host
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
+REQUEST_TIMEOUT = 10  # seconds
+MAX_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def get(url, timeout=REQUEST_TIMEOUT, **kwargs):
+    """GET through the shared session, retrying timeouts, connection errors, 429 and 5xx with jittered backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = session.get(url, timeout=timeout, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            response.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+        # Exponential backoff with full jitter
+        time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
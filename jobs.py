@@ -0,0 +1,173 @@
+"""
+Background jobs for long-running API work (optimisations, audits).
+
+Handlers submit work and return a job id at once instead of holding the
+request (and, with blocking calls, the whole event loop) for minutes.
+A fixed pool of worker tasks drains a bounded queue. When the queue is
+full, submit() raises JobQueueFull and the API answers 429 with a
+Retry-After hint instead of piling up work it cannot finish.
+
+Each job records its state (queued, running, succeeded, failed),
+progress and result. Watchers can poll GET /jobs/{id} or follow
+GET /jobs/{id}/events, which streams every change as server-sent events.
+Finished jobs are kept for JOB_RETENTION seconds.
+"""
+
+import asyncio
+import inspect
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))          # Jobs run concurrently
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '100'))  # Jobs waiting before submissions get 429
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', '3600'))  # Seconds finished jobs stay queryable
+
+FINISHED = ('succeeded', 'failed')
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at capacity"""
+
+class Job:
+    """One unit of background work and its observable state"""
+
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def update(self, progress: Optional[float] = None, message: Optional[str] = None, **fields):
+        """Record progress (0-1) and/or a message, and wake event-stream watchers"""
+        if progress is not None:
+            self.progress = round(min(max(progress, 0.0), 1.0), 4)
+        if message is not None:
+            self.message = message
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.version += 1
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._changed.set()
+        else:  # Progress reported from a worker thread
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def wait_for_change(self, version: int, timeout: float):
+        """Return once the job has moved past `version`, or after timeout"""
+        if self.version == version:
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+JobFunction = Callable[..., Awaitable[Any]]
+
+class JobManager:
+    """Bounded queue plus a fixed pool of asyncio workers"""
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE,
+                 retention: float = JOB_RETENTION):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+
+    def _start(self):
+        """Create the queue and workers on the running event loop (first use)"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind: str, func: JobFunction, params: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue func(job, **params); raises JobQueueFull at capacity"""
+        self._start()
+        self._prune()
+        job = Job(kind, params or {})
+        try:
+            self._queue.put_nowait((job, func))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"{self._queue.qsize()} jobs already queued")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up, from recent job durations"""
+        durations = [j.finished_at - j.started_at for j in self.jobs.values()
+                     if j.finished_at is not None and j.started_at is not None]
+        average = sum(durations) / len(durations) if durations else 1.0
+        waiting = self._queue.qsize() if self._queue else 0
+        return max(1, round(average * waiting / max(self.workers, 1)))
+
+    async def _worker(self):
+        while True:
+            job, func = await self._queue.get()
+            self._running += 1
+            job.update(0.0, 'Running', status='running', started_at=time.time())
+            try:
+                if inspect.iscoroutinefunction(func):
+                    result = await func(job, **job.params)
+                else:
+                    # Blocking work goes to a thread so the event loop keeps serving requests
+                    result = await asyncio.to_thread(func, job, **job.params)
+                job.update(1.0, 'Done', status='succeeded', result=result, finished_at=time.time())
+            except Exception as e:
+                job.update(message='Failed', status='failed', error=str(e), finished_at=time.time())
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at is not None and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            'workers': self.workers,
+            'running': self._running,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'max_queue': self.max_queue,
+            'jobs': counts
+        }
+
+# Shared job manager
+job_manager = JobManager()
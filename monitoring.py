@@ -2,6 +2,7 @@ import logging
 import time
 import requests
 from prometheus_client import Counter, Gauge, Histogram
+import http_session
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,15 +19,14 @@ def fetch_performance_metrics(url):
     """Fetch performance metrics from a given URL."""
     start_time = time.time()
     try:
-        response = requests.get(url)
+        response = http_session.get(url)
         response.raise_for_status()
-        data = response.json()
-        request_latency.labels(method='GET', endpoint='/performance').observe(time.time() - start_time)
-        return data
+        return response.json()
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching performance metrics: {e}")
-        request_latency.labels(method='GET', endpoint='/performance').observe(time.time() - start_time)
         return None
+    finally:
+        request_latency.labels(method='GET', endpoint='/performance').observe(time.time() - start_time)
 
 def update_metrics(data):
     """Update Prometheus metrics with incoming data."""
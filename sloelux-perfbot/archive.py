@@ -0,0 +1,391 @@
+"""
+Columnar archive of sealed metrics-store segments, for analytics.
+
+Each sealed segment of the metrics store is compacted once into a part
+directory of NumPy arrays. There is one fixed-width column per field
+(position, timestamp, metrics), and URLs and opportunity ids are
+dictionary-encoded against archive-wide dictionaries. Opportunities are
+stored CSR-style: per-row offsets into flat id and savings arrays.
+Readers open columns with `np.load(mmap_mode='r')`, so scans over
+millions of runs are vectorised and do not copy or parse anything up
+front.
+
+The archive is derived data: the store stays the source of truth, and
+any part can be rebuilt from its segment.
+
+    python archive.py   # archive any newly sealed segments
+"""
+
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: archiving is only serialised within a process
+    fcntl = None
+
+from config import METRICS_ARCHIVE_DIR
+from metrics_store import MetricsStore, make_position, metrics_store, record_time
+
+# Fixed-width metric columns: name -> dtype (missing values are NaN)
+METRIC_COLUMNS = {'lcp': np.float32, 'tbt': np.float32, 'performance_score': np.float32, 'inp_ms': np.float32}
+INP_CODES = {'good': 0, 'needs-improvement': 1, 'poor': 2}  # -1: unknown
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+class _Dictionary:
+    """Append-only string <-> id mapping persisted as a JSON list"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ids: Dict[str, int] = {}
+        self.values: List[str] = []
+        self._mtime = None
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self.values = json.load(f)
+            self._ids = {value: i for i, value in enumerate(self.values)}
+            self._mtime = mtime
+
+    def id(self, value: str) -> int:
+        if value not in self._ids:
+            self._ids[value] = len(self.values)
+            self.values.append(value)
+        return self._ids[value]
+
+    def get(self, value: str) -> Optional[int]:
+        return self._ids.get(value)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.values, f)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+class _Encoder:
+    """Builds the archive columns from store records"""
+
+    def __init__(self, url_id: Callable[[str], int], opportunity_id: Callable[[str], int]):
+        self.url_id = url_id
+        self.opportunity_id = opportunity_id
+        self.positions, self.timestamps, self.url_ids, self.inp = [], [], [], []
+        self.metrics = {name: [] for name in METRIC_COLUMNS}
+        self.offsets, self.opp_ids, self.opp_savings = [0], [], []
+
+    def add(self, position: int, record: Dict[str, Any], fallback_timestamp: float):
+        self.positions.append(position)
+        self.timestamps.append(record_time(record, fallback_timestamp))
+        self.url_ids.append(self.url_id(record.get('url', '')))
+        self.inp.append(INP_CODES.get(record.get('inp'), -1))
+        for name in METRIC_COLUMNS:
+            self.metrics[name].append(_number(record.get(name)))
+        for opportunity in record.get('opportunities') or ():
+            self.opp_ids.append(self.opportunity_id(opportunity.get('id', '')))
+            self.opp_savings.append(_number(opportunity.get('savings')))
+        self.offsets.append(len(self.opp_ids))
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {
+            'position': np.array(self.positions, dtype=np.int64),
+            'timestamp': np.array(self.timestamps, dtype=np.float64),
+            'url': np.array(self.url_ids, dtype=np.int32),
+            'inp': np.array(self.inp, dtype=np.int8),
+            'opp_offsets': np.array(self.offsets, dtype=np.int64),
+            'opp_ids': np.array(self.opp_ids, dtype=np.int32),
+            'opp_savings': np.array(self.opp_savings, dtype=np.float32),
+            **{name: np.array(values, dtype=METRIC_COLUMNS[name]) for name, values in self.metrics.items()}
+        }
+
+def _meta(columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    positions, timestamps = columns['position'], columns['timestamp']
+    rows = len(positions)
+    return {
+        'rows': rows,
+        'first_position': int(positions[0]) if rows else None,
+        'last_position': int(positions[-1]) if rows else None,
+        'min_timestamp': float(timestamps.min()) if rows else None,
+        'max_timestamp': float(timestamps.max()) if rows else None
+    }
+
+def _overlay(dictionary: '_Dictionary') -> Tuple[Callable[[str], int], List[str]]:
+    """Encoder for values the dictionary may not have yet, without persisting them"""
+    names = list(dictionary.values)
+    extra: Dict[str, int] = {}
+
+    def encode(value: str) -> int:
+        known = dictionary.get(value)
+        if known is not None:
+            return known
+        if value not in extra:
+            extra[value] = len(names)
+            names.append(value)
+        return extra[value]
+    return encode, names
+
+class MetricsArchive:
+    """Writer and memory-mapped reader for the columnar archive"""
+
+    def __init__(self, root: str = METRICS_ARCHIVE_DIR, store: MetricsStore = metrics_store):
+        self.root = root
+        self.store = store
+        self._lock = threading.RLock()
+        self.urls = _Dictionary(os.path.join(root, 'urls.json'))
+        self.opportunities = _Dictionary(os.path.join(root, 'opportunities.json'))
+        self._parts: Dict[int, Dict[str, Any]] = {}
+        self._live: Optional[Dict[str, Any]] = None  # Encoded unarchived records, extended as the store grows
+
+    # -- Writing -----------------------------------------------------------
+
+    def _part_dir(self, segment: int) -> str:
+        return os.path.join(self.root, f"{segment:08d}")
+
+    def archive_sealed(self) -> List[int]:
+        """Compact every sealed, not yet archived store segment; returns the segments archived"""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            lock_fd = os.open(os.path.join(self.root, 'archive.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                self.urls.load()
+                self.opportunities.load()
+                archived = []
+                for segment in self.store.sealed_segments():
+                    if not os.path.exists(os.path.join(self._part_dir(segment), 'meta.json')):
+                        self._archive_segment(segment)
+                        archived.append(segment)
+                return archived
+            finally:
+                os.close(lock_fd)
+
+    def _archive_segment(self, segment: int):
+        encoder = _Encoder(self.urls.id, self.opportunities.id)
+        for ordinal, entry, record in self.store.segment_records(segment):
+            encoder.add(make_position(segment, ordinal), record, entry[3])
+        columns = encoder.columns()
+
+        # Dictionaries first: a part never references ids that are not persisted
+        self.urls.save()
+        self.opportunities.save()
+
+        part = self._part_dir(segment)
+        tmp_part = f"{part}.tmp"
+        os.makedirs(tmp_part, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_part, f"{name}.npy"), values)
+        meta = {'segment': segment, **_meta(columns)}
+        with open(os.path.join(tmp_part, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if os.path.exists(part):
+            # Left by an interrupted run without meta.json
+            for name in os.listdir(part):
+                os.remove(os.path.join(part, name))
+            os.rmdir(part)
+        os.replace(tmp_part, part)
+
+    # -- Reading -----------------------------------------------------------
+
+    def _load_parts(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.urls.load()
+            self.opportunities.load()
+            if os.path.isdir(self.root):
+                for name in sorted(os.listdir(self.root)):
+                    if not name.isdigit() or int(name) in self._parts:
+                        continue
+                    meta_path = os.path.join(self.root, name, 'meta.json')
+                    if os.path.exists(meta_path):
+                        with open(meta_path) as f:
+                            self._parts[int(name)] = {'meta': json.load(f), 'columns': {}}
+            return [self._parts[segment] for segment in sorted(self._parts)]
+
+    def _column(self, part: Dict[str, Any], name: str) -> np.ndarray:
+        columns = part['columns']
+        if name not in columns:
+            path = os.path.join(self._part_dir(part['meta']['segment']), f"{name}.npy")
+            columns[name] = np.load(path, mmap_mode='r')
+        return columns[name]
+
+    def last_position(self) -> int:
+        """Position of the newest archived record, or -1"""
+        parts = [p for p in self._load_parts() if p['meta']['rows']]
+        return parts[-1]['meta']['last_position'] if parts else -1
+
+    def _live_part(self) -> Tuple[Dict[str, Any], List[str], List[str]]:
+        """Store records newer than the archive, encoded like a part, plus the id -> name lists.
+
+        The encoded records are kept between calls and only records appended
+        since are read, so the store is parsed once per record rather than on
+        every scan. Archiving more segments starts the overlay afresh.
+        """
+        archived = self.last_position()
+        head = self.store.head()
+        with self._lock:
+            live = self._live
+            if live is None or live['archived'] != archived:
+                url_id, url_names = _overlay(self.urls)
+                opportunity_id, opportunity_names = _overlay(self.opportunities)
+                live = self._live = {'archived': archived, 'head': archived, 'part': None,
+                                     'encoder': _Encoder(url_id, opportunity_id),
+                                     'url_names': url_names, 'opportunity_names': opportunity_names}
+            if head > live['head']:
+                appended = []
+                for position, entry in self.store.entries():
+                    if position <= live['head']:
+                        break
+                    appended.append((position, entry))
+                for position, entry in reversed(appended):
+                    live['encoder'].add(position, self.store.read(position), entry[3])
+                if appended:
+                    live['head'], live['part'] = appended[0][0], None
+            if live['part'] is None:
+                columns = live['encoder'].columns()
+                live['part'] = {'meta': _meta(columns), 'columns': columns}
+            return live['part'], live['url_names'], live['opportunity_names']
+
+    def scan(self, columns: List[str], url: Optional[str] = None, since: Optional[float] = None,
+             until: Optional[float] = None, live: bool = True) -> Tuple[List[Dict[str, np.ndarray]], List[str], List[str]]:
+        """Select columns for rows matching url and [since, until).
+
+        Returns ([{column: array} per part], url names, opportunity names),
+        where the name lists map the encoded ids back to strings. Parts
+        outside the time range are skipped without being opened; within a
+        part only the requested columns are mapped. With live=True, records
+        not yet archived are read from the store and included.
+        """
+        parts = self._load_parts()
+        url_names, opportunity_names = self.urls.values, self.opportunities.values
+        if live:
+            live_part, url_names, opportunity_names = self._live_part()
+            parts = parts + [live_part]
+
+        url_id = None
+        if url is not None:
+            url_id = self.urls.get(url)
+            if url_id is None and url in url_names:
+                url_id = url_names.index(url)  # Only seen in unarchived records
+            if url_id is None:
+                return [], url_names, opportunity_names
+
+        chunks = []
+        for part in parts:
+            meta = part['meta']
+            if not meta['rows'] or (since is not None and meta['max_timestamp'] < since) or \
+                    (until is not None and meta['min_timestamp'] >= until):
+                continue
+            mask = np.ones(meta['rows'], dtype=bool)
+            if url_id is not None:
+                mask &= self._column(part, 'url') == url_id
+            if since is not None:
+                mask &= self._column(part, 'timestamp') >= since
+            if until is not None:
+                mask &= self._column(part, 'timestamp') < until
+            rows = None if mask.all() else np.flatnonzero(mask)
+            if rows is not None and not len(rows):
+                continue
+            chunks.append({name: self._select(part, name, rows) for name in columns})
+        return chunks, url_names, opportunity_names
+
+    def _select(self, part, name, rows):
+        if name == 'opportunities':
+            # CSR rows -> (ids, savings) of the selected rows' opportunities
+            offsets = self._column(part, 'opp_offsets')
+            ids, savings = self._column(part, 'opp_ids'), self._column(part, 'opp_savings')
+            if rows is None:
+                return ids, savings
+            counts = offsets[rows + 1] - offsets[rows]
+            starts = np.repeat(offsets[rows], counts)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            flat = starts + within
+            return ids[flat], savings[flat]
+        column = self._column(part, name)
+        return column if rows is None else column[rows]
+
+    def url_summary(self, since: Optional[float] = None, until: Optional[float] = None,
+                    live: bool = True) -> List[Dict[str, Any]]:
+        """Per-URL run count, LCP/TBT percentiles and mean score over [since, until)"""
+        chunks, url_names, _ = self.scan(['url', 'lcp', 'tbt', 'performance_score'], since=since, until=until, live=live)
+        if not chunks:
+            return []
+        data = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+        url_ids, _, counts = _groups(data['url'])
+        lcp = _group_percentiles(data['url'], data['lcp'], (0.5, 0.75))
+        tbt = _group_percentiles(data['url'], data['tbt'], (0.5, 0.75))
+        groups = np.searchsorted(url_ids, data['url'])
+        scored = ~np.isnan(data['performance_score'])
+        score_sums = np.bincount(groups, weights=np.where(scored, data['performance_score'], 0), minlength=len(url_ids))
+        score_counts = np.bincount(groups, weights=scored, minlength=len(url_ids))
+        return [
+            {
+                'url': url_names[url_id],
+                'runs': int(counts[i]),
+                'lcp_p50': _float(lcp[0][i]), 'lcp_p75': _float(lcp[1][i]),
+                'tbt_p50': _float(tbt[0][i]), 'tbt_p75': _float(tbt[1][i]),
+                'performance_score': round(float(score_sums[i] / score_counts[i]), 1) if score_counts[i] else None
+            }
+            for i, url_id in enumerate(url_ids)
+        ]
+
+    def opportunity_counts(self, url: Optional[str] = None, since: Optional[float] = None,
+                           until: Optional[float] = None, live: bool = True) -> List[Dict[str, Any]]:
+        """How often each opportunity was reported, and its total estimated savings, most frequent first"""
+        chunks, _, names = self.scan(['opportunities'], url=url, since=since, until=until, live=live)
+        counts = np.zeros(len(names), dtype=np.int64)
+        savings = np.zeros(len(names), dtype=np.float64)
+        for chunk in chunks:
+            ids, saved = chunk['opportunities']
+            counts += np.bincount(ids, minlength=len(names))
+            savings += np.bincount(ids, weights=np.nan_to_num(saved), minlength=len(names))
+        order = np.argsort(-counts, kind='stable')
+        return [{'id': names[i], 'count': int(counts[i]), 'total_savings_ms': round(float(savings[i]), 1)}
+                for i in order if counts[i]]
+
+    def stats(self) -> Dict[str, Any]:
+        parts = self._load_parts()
+        return {
+            'parts': len(parts),
+            'rows': sum(p['meta']['rows'] for p in parts),
+            'urls': len(self.urls.values),
+            'opportunities': len(self.opportunities.values),
+            'last_position': self.last_position()
+        }
+
+def _float(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 3)
+
+def _groups(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Distinct keys (sorted), and each key's start and count in the key-sorted order"""
+    unique, counts = np.unique(keys, return_counts=True)
+    return unique, np.concatenate(([0], np.cumsum(counts)[:-1])), counts
+
+def _group_percentiles(keys: np.ndarray, values: np.ndarray, quantiles) -> List[np.ndarray]:
+    """Nearest-rank percentiles of values per key (NaNs ignored), one array per quantile"""
+    order = np.lexsort((values, keys))  # NaN sorts last within each key
+    ordered = values[order]
+    _, starts, _ = _groups(keys)
+    valid = np.add.reduceat(~np.isnan(ordered), starts) if len(starts) else np.array([], dtype=int)
+    result = []
+    for q in quantiles:
+        rank = np.maximum(np.ceil(q * valid).astype(np.int64) - 1, 0)
+        picked = ordered[np.minimum(starts + rank, len(ordered) - 1)]
+        result.append(np.where(valid > 0, picked, np.nan))
+    return result
+
+# Shared archive instance
+metrics_archive = MetricsArchive()
+
+if __name__ == "__main__":
+    archived = metrics_archive.archive_sealed()
+    print(f"Archived segments: {archived or 'none'}; {metrics_archive.stats()}")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the columnar metrics archive.
+Fills a metrics store, archives its sealed segments and compares a
+per-URL summary (runs, p50/p75 LCP and TBT, mean score) plus opportunity
+counts computed by parsing every JSON record with the same queries on
+the memory-mapped archive.
+
+    python bench_archive.py --records 2000000
+"""
+
+import argparse
+import math
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from archive import MetricsArchive
+from bench_metrics_store import make_record
+from metrics_store import MetricsStore
+
+def json_scan(store):
+    """The pre-archive approach: parse every record, group in Python"""
+    lcp, tbt, scores, opportunities = defaultdict(list), defaultdict(list), defaultdict(list), Counter()
+    for segment in store.sealed_segments():
+        for _, _, record in store.segment_records(segment):
+            url = record['url']
+            lcp[url].append(record['lcp'])
+            tbt[url].append(record['tbt'])
+            scores[url].append(record['performance_score'])
+            opportunities.update(o['id'] for o in record['opportunities'])
+
+    def rank(values, q):
+        values = sorted(values)
+        return values[math.ceil(q * len(values)) - 1]
+    return {url: (len(lcp[url]), rank(lcp[url], 0.75), rank(tbt[url], 0.75), sum(scores[url]) / len(scores[url]))
+            for url in lcp}, opportunities
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=500_000)
+    parser.add_argument('--urls', type=int, default=500, help='Distinct URLs')
+    parser.add_argument('--segment-mb', type=int, default=16, help='Store segment size')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='perfbot-archive-bench-')
+    store = MetricsStore(os.path.join(root, 'store'), segment_bytes=args.segment_mb * 1024 * 1024, legacy_log=None)
+    urls = [f"https://sloelux.com/products/product-{i}" for i in range(args.urls)]
+    for start in range(0, args.records, 10_000):
+        store.append_many([make_record(i, urls) for i in range(start, min(args.records, start + 10_000))])
+
+    archive = MetricsArchive(os.path.join(root, 'archive'), store)
+    start = time.perf_counter()
+    archive.archive_sealed()
+    archive_s = time.perf_counter() - start
+    rows = archive.stats()['rows']
+    size = sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, names in os.walk(archive.root) for name in names)
+    print(f"🚀 {rows:,} archived runs, {args.urls} URLs (archived in {archive_s:.1f}s, {size / 1024 / 1024:.1f} MB)\n")
+
+    start = time.perf_counter()
+    expected, expected_opportunities = json_scan(store)
+    scan_s = time.perf_counter() - start
+
+    cold = MetricsArchive(archive.root, store)  # Fresh reader: nothing mapped yet
+    start = time.perf_counter()
+    summary = cold.url_summary(live=False)
+    opportunities = cold.opportunity_counts(live=False)
+    archive_query_s = time.perf_counter() - start
+
+    for entry in summary:
+        runs, lcp_p75, tbt_p75, _ = expected[entry['url']]
+        assert entry['runs'] == runs and abs(entry['lcp_p75'] - lcp_p75) < 1e-3 and entry['tbt_p75'] == tbt_p75
+    assert {o['id']: o['count'] for o in opportunities} == dict(expected_opportunities)
+
+    print(f"   {'JSON scan':<18} {scan_s * 1000:10.1f} ms")
+    print(f"   {'columnar archive':<18} {archive_query_s * 1000:10.1f} ms  ({scan_s / archive_query_s:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark for metrics store compaction.
+Fills a store with records shaped like performance_log.json, then
+compares the sealed segments before and after compact_sealed(): bytes on
+disk, a full read of every record, and a per-URL history lookup.
+
+    python bench_compaction.py --records 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from bench_metrics_store import make_record, median_ms
+from metrics_store import MetricsStore
+
+def sealed_bytes(store):
+    suffixes = ('jsonl', 'blocks', 'bidx', 'dict')
+    return sum(os.path.getsize(store._path(segment, suffix))
+               for segment in store.sealed_segments() for suffix in suffixes
+               if os.path.exists(store._path(segment, suffix)))
+
+def full_read(store):
+    start = time.perf_counter()
+    count = sum(1 for segment in store.sealed_segments() for _ in store.segment_records(segment))
+    return count, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=300_000)
+    parser.add_argument('--urls', type=int, default=500, help='Distinct URLs')
+    parser.add_argument('--segment-mb', type=int, default=16, help='Store segment size')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='perfbot-compaction-bench-')
+    store = MetricsStore(root, segment_bytes=args.segment_mb * 1024 * 1024, legacy_log=None)
+    urls = [f"https://sloelux.com/products/product-{i}" for i in range(args.urls)]
+    for start in range(0, args.records, 10_000):
+        store.append_many([make_record(i, urls) for i in range(start, min(args.records, start + 10_000))])
+    print(f"🚀 {args.records:,} records, {len(store.sealed_segments())} sealed segments\n")
+
+    raw_bytes = sealed_bytes(store)
+    count, raw_read_s = full_read(store)
+    raw_history_ms = median_ms(lambda: MetricsStore(root, legacy_log=None).history(urls[7], 50), repeat=20)
+
+    start = time.perf_counter()
+    store.compact_sealed()
+    compact_s = time.perf_counter() - start
+
+    reader = MetricsStore(root, legacy_log=None)
+    compact_bytes = sealed_bytes(reader)
+    compact_count, compact_read_s = full_read(reader)
+    compact_history_ms = median_ms(lambda: MetricsStore(root, legacy_log=None).history(urls[7], 50), repeat=20)
+    assert compact_count == count
+
+    print(f"   compaction took {compact_s:.1f}s\n")
+    print(f"   {'':<22} {'JSON lines':>12} {'compacted':>12}")
+    print(f"   {'sealed bytes (MB)':<22} {raw_bytes / 1e6:12.1f} {compact_bytes / 1e6:12.1f}  ({raw_bytes / compact_bytes:.0f}x)")
+    print(f"   {'full read (s)':<22} {raw_read_s:12.2f} {compact_read_s:12.2f}")
+    print(f"   {'history(50) cold (ms)':<22} {raw_history_ms:12.2f} {compact_history_ms:12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the critical-CSS engine.
+Builds a Dawn-style theme (BEM component stylesheets with media queries,
+state selectors and keyframes) and rendered index, collection and product
+pages, each using only some of the components. Classifies every selector
+with the indexed matcher and with a naive matcher that tries each
+selector against every element, checks both agree, and reports the
+pruned and critical sizes.
+
+    python bench_critical_css.py --components 200
+    python bench_critical_css.py --theme ~/dawn --pages ~/rendered   # real theme + saved HTML
+"""
+
+import argparse
+import os
+import random
+import time
+
+from critical_css import CRITICAL, USED, PageIndex, SelectorMatcher, StyleRule, extract, parse_stylesheet
+
+ELEMENTS = ('wrapper', 'media', 'heading', 'text', 'link', 'badge', 'button', 'icon', 'list', 'item', 'info', 'price')
+MODIFIERS = ('small', 'large', 'active', 'secondary', 'full-width', 'inverse')
+STATES = (':hover', ':focus-visible', '::before', '::after', ':not(:last-child)', '')
+
+def make_theme(components, seed=7):
+    """(stylesheet, {page: html}) shaped like Dawn's base.css and section markup"""
+    rng = random.Random(seed)
+    names = [f"{rng.choice(('card', 'header', 'product', 'facets', 'cart', 'menu', 'slider', 'banner'))}-{i}"
+             for i in range(components)]
+    rules = [':root{--color-base-text:18,18,18}', 'html{box-sizing:border-box}', 'body{margin:0}']
+    for name in names:
+        for element in rng.sample(ELEMENTS, 8):
+            block = f".{name}__{element}"
+            rules.append(f"{block}{rng.choice(STATES)}{{display:flex;gap:1rem}}")
+            rules.append(f".{name} > {block} .{name}__{rng.choice(ELEMENTS)}{{margin:0 auto}}")
+            rules.append(f"{block}--{rng.choice(MODIFIERS)}{{padding:{rng.randrange(1, 5)}rem}}")
+            rules.append(f"@media screen and (min-width:750px){{{block}{{width:{rng.randrange(10, 100)}%}}}}")
+        rules.append(f"@keyframes {name}-in{{from{{opacity:0}}to{{opacity:1}}}}")
+        rules.append(f".{name}.animate{{animation:{name}-in .3s}}")
+    css = '\n'.join(rules)
+
+    pages = {}
+    for page in ('index', 'collection', 'product'):
+        used = rng.sample(names, len(names) // 4)
+        sections = []
+        for name in used:
+            children = ''.join(
+                f'<div class="{name}__{element} {name}__{element}--{rng.choice(MODIFIERS)}">'
+                f'<span class="{name}__{rng.choice(ELEMENTS)}">x</span><a href="#" class="{name}__link">y</a></div>'
+                for element in rng.sample(ELEMENTS, 6))
+            sections.append(f'<div id="shopify-section-{name}" class="shopify-section"><section class="{name}">{children}</section></div>')
+        pages[page] = f'<!doctype html><html class="no-js"><head><title>{page}</title></head><body>{"".join(sections)}</body></html>'
+    return css, pages
+
+class _Everything:
+    def __contains__(self, item):
+        return True
+
+class NaiveMatcher(SelectorMatcher):
+    """Tries every selector against every element: O(selectors x elements)"""
+
+    def __init__(self, pages):
+        super().__init__(pages)
+        self.ids = self.classes = _Everything()
+
+    @staticmethod
+    def _candidates(page, compound):
+        return page.elements
+
+def selectors(rules):
+    for rule in rules:
+        if isinstance(rule, StyleRule):
+            yield from rule.selectors
+        elif rule.rules is not None:
+            yield from selectors(rule.rules)
+
+def load_theme(theme_dir, pages_dir):
+    assets = os.path.join(theme_dir, 'assets')
+    css = '\n'.join(open(os.path.join(assets, n), encoding='utf-8').read()
+                    for n in sorted(os.listdir(assets)) if n.endswith('.css') and not n.endswith('.pruned.css'))
+    pages = {n: open(os.path.join(pages_dir, n), encoding='utf-8').read()
+             for n in sorted(os.listdir(pages_dir)) if n.endswith('.html')}
+    return css, pages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--components', type=int, default=200)
+    parser.add_argument('--theme', help='Theme checkout (reads assets/*.css)')
+    parser.add_argument('--pages', help='Directory of rendered *.html pages')
+    args = parser.parse_args()
+
+    css, pages = load_theme(args.theme, args.pages) if args.theme else make_theme(args.components)
+    started = time.perf_counter()
+    rules = parse_stylesheet(css)
+    parse_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    indexes = [PageIndex(html) for html in pages.values()]
+    index_seconds = time.perf_counter() - started
+    unique = list(dict.fromkeys(selectors(rules)))
+    elements = sum(len(p.elements) for p in indexes)
+    print(f"🚀 {len(css) / 1e6:.1f} MB CSS, {len(unique)} selectors, {len(pages)} pages, {elements} elements\n")
+    print(f"   parse        {parse_seconds:8.3f} s")
+    print(f"   index pages  {index_seconds:8.3f} s")
+
+    results = {}
+    for label, matcher in (('naive', NaiveMatcher(indexes)), ('indexed', SelectorMatcher(indexes))):
+        started = time.perf_counter()
+        results[label] = [matcher.classify(s) for s in unique]
+        elapsed = time.perf_counter() - started
+        print(f"   {label:<12} {elapsed:8.3f} s  {len(unique) / elapsed:10.0f} selectors/s")
+    assert results['naive'] == results['indexed'], 'indexed matcher disagrees with the naive one'
+
+    used = sum(r >= USED for r in results['indexed'])
+    critical = sum(r == CRITICAL for r in results['indexed'])
+    result = extract(css, SelectorMatcher(indexes))
+    print(f"\n   {used} selectors used, {critical} above the fold")
+    print(f"   {len(css.encode()) / 1024:.0f} KB -> {len(result['pruned'].encode()) / 1024:.0f} KB pruned, "
+          f"{len(result['critical'].encode()) / 1024:.0f} KB critical")
+
+if __name__ == "__main__":
+    main()
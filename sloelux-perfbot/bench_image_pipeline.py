@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the image pipeline.
+Generates a deterministic corpus shaped like theme assets (photographic
+product JPEGs, large hero JPEGs, flat PNG graphics with transparency),
+converts it with one worker and with the full pool, then runs again to
+show content-hash cache hits. Reports images/second and bytes saved.
+
+    python bench_image_pipeline.py --images 60 --workers 8
+"""
+
+import argparse
+import os
+import random
+import tempfile
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from image_pipeline import ImagePipeline
+
+def make_corpus(root, count, seed=7):
+    """Product shots, hero banners and transparent PNG graphics"""
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    for i in range(count):
+        kind = ('product', 'hero', 'graphic')[i % 3]
+        size = {'product': (1200, 1200), 'hero': (2400, 1000), 'graphic': (600, 400)}[kind]
+        mode = 'RGBA' if kind == 'graphic' else 'RGB'
+        image = Image.new(mode, size, (0, 0, 0, 0) if mode == 'RGBA' else (245, 240, 235))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40 if kind != 'graphic' else 8):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            r = rng.randrange(40, size[0] // 3)
+            colour = tuple(rng.randrange(256) for _ in range(3)) + ((255,) if mode == 'RGBA' else ())
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=colour)
+        if kind != 'graphic':
+            # Photographic texture: blur plus sensor-like noise
+            image = image.filter(ImageFilter.GaussianBlur(6))
+            noise = Image.effect_noise(size, 24).convert('RGB')
+            image = Image.blend(image, noise, 0.12)
+            image.save(os.path.join(root, f"{kind}-{i}.jpg"), quality=92)
+        else:
+            image.save(os.path.join(root, f"{kind}-{i}.png"), optimize=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='perfbot-image-bench-')
+    corpus = os.path.join(root, 'assets')
+    make_corpus(corpus, args.images)
+    corpus_bytes = sum(os.path.getsize(os.path.join(corpus, name)) for name in os.listdir(corpus))
+    print(f"🚀 {args.images} images, {corpus_bytes / 1e6:.1f} MB\n")
+
+    for label, workers in (('1 worker', 1), (f'{args.workers} workers', args.workers)):
+        report = ImagePipeline(output_dir=os.path.join(root, label.replace(' ', '-')), workers=workers).run(corpus)
+        print(f"   {label:<12} {report['images_per_second']:8.1f} images/s  "
+              f"{report['bytes_saved'] / 1e6:6.1f} MB saved ({report['bytes_saved'] / report['bytes_in']:.0%}), "
+              f"best format {report['formats']}")
+
+    rerun = ImagePipeline(output_dir=os.path.join(root, label.replace(' ', '-')), workers=args.workers).run(corpus)
+    assert rerun['cached'] == args.images, rerun
+    print(f"   {'cached rerun':<12} {rerun['images_per_second']:8.1f} images/s  ({rerun['cached']} cache hits)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: full json.loads of PSI responses vs. selective extraction.
+Pass captured reports with --reports DIR (one PSI response per *.json
+file); without it a synthetic report shaped like a real mobile run is used.
+"""
+
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+from lighthouse import WANTED_AUDITS, AuditExtractor, extract_report
+
+def synthetic_report(url='https://sloelux.com'):
+    """A PSI-shaped response: screenshots, large detail tables, ~150 audits"""
+    random.seed(7)
+    audits = {}
+    for i in range(150):
+        audit_id = WANTED_AUDITS[i] if i < len(WANTED_AUDITS) else f"audit-{i}"
+        items = [{'url': f"https://cdn.shopify.com/s/files/asset-{i}-{j}.js", 'wastedMs': random.random() * 300,
+                  'wastedBytes': random.randint(1000, 90000), 'totalBytes': random.randint(1000, 200000)}
+                 for j in range(random.randint(5, 120))]
+        audits[audit_id] = {
+            'id': audit_id, 'title': f"Audit {audit_id}", 'description': 'x' * 400,
+            'score': round(random.random(), 2), 'scoreDisplayMode': 'numeric',
+            'numericValue': random.random() * 5000, 'displayValue': '1.2 s',
+            'details': {'type': 'opportunity', 'overallSavingsMs': random.random() * 900,
+                        'headings': [{'key': 'url', 'valueType': 'url'}], 'items': items}
+        }
+    frames = [{'timing': t * 300, 'data': 'data:image/jpeg;base64,' + base64.b64encode(os.urandom(24000)).decode()}
+              for t in range(10)]
+    audits['screenshot-thumbnails'] = {'id': 'screenshot-thumbnails', 'details': {'type': 'filmstrip', 'items': frames}}
+    audits['final-screenshot'] = {'id': 'final-screenshot', 'details': {
+        'type': 'screenshot', 'data': base64.b64encode(os.urandom(400000)).decode()}}
+    inp = {'percentile': 180, 'category': 'FAST', 'distributions': []}
+    return json.dumps({
+        'id': url,
+        'loadingExperience': {'metrics': {'INTERACTION_TO_NEXT_PAINT': inp}},
+        'originLoadingExperience': {'metrics': {'INTERACTION_TO_NEXT_PAINT': dict(inp, category='AVERAGE')}},
+        'lighthouseResult': {
+            'requestedUrl': url, 'finalUrl': url, 'audits': audits,
+            'categories': {'performance': {'id': 'performance', 'score': 0.71,
+                                           'auditRefs': [{'id': a, 'weight': 1} for a in audits]}},
+            'i18n': {'icuMessagePaths': {f"core/audits/{a}.js | title": [f"audits[{a}].title"] for a in audits}}
+        }
+    }).encode()
+
+def full_parse(url, payload):
+    """The old approach: parse everything, then walk the dict"""
+    audits = json.loads(payload).get('lighthouseResult', {}).get('audits', {})
+    return {audit_id: audits.get(audit_id, {}).get('score', 1) for audit_id in WANTED_AUDITS}
+
+def streamed(url, payload, chunk=64 * 1024):
+    extractor = AuditExtractor(url)
+    for start in range(0, len(payload), chunk):
+        extractor.feed(payload[start:start + chunk])
+    return extractor.finish()
+
+def measure(func, url, payload, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(url, payload)
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func(url, payload)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reports', help='Directory of captured PSI responses (*.json)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.reports:
+        reports = []
+        for path in sorted(glob.glob(os.path.join(args.reports, '*.json'))):
+            with open(path, 'rb') as f:
+                reports.append((os.path.basename(path), f.read()))
+    else:
+        reports = [('synthetic', synthetic_report())]
+
+    print("🚀 Lighthouse extraction benchmark (median ms, peak MB allocated)\n")
+    for name, payload in reports:
+        # The extracted audits must match what a full parse sees
+        report = extract_report(name, payload)
+        expected = full_parse(name, payload)
+        assert all(report.score(a) == (expected[a] if expected[a] is not None else 1) for a in WANTED_AUDITS)
+
+        print(f"   {name} ({len(payload) / 1024 / 1024:.1f} MB)")
+        for label, func in (('json.loads', full_parse), ('extract_report', extract_report), ('streamed 64KB', streamed)):
+            ms, peak = measure(func, name, payload, args.repeat)
+            print(f"      {label:<15} {ms:8.2f} ms  {peak:8.2f} MB")
+
+if __name__ == "__main__":
+    main()
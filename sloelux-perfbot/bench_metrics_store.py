@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the segmented metrics store.
+Grows a store to the requested size and, at each checkpoint, measures
+the reads behind /metrics (tail), /status (last record) and per-URL
+lookups, next to the old approach of parsing the whole JSON-lines log.
+
+    python bench_metrics_store.py --records 10000000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from metrics_store import MetricsStore
+
+def make_record(i, urls):
+    return {
+        'url': urls[i % len(urls)],
+        'lcp': round(random.uniform(1.5, 5.0), 2),
+        'tbt': random.randint(50, 600),
+        'inp': 'good',
+        'performance_score': random.randint(40, 100),
+        'opportunities': [
+            {'id': 'unused-css-rules', 'title': 'Remove unused CSS', 'savings': 500},
+            {'id': 'render-blocking-resources', 'title': 'Eliminate render-blocking resources', 'savings': 300}
+        ],
+        'timestamp': f"2026-01-01T00:00:{i % 60:02d}+00:00"
+    }
+
+def median_ms(func, repeat=50):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def legacy_tail(path):
+    """What /metrics did before: parse every line, keep the last 10"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()][-10:]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--urls', type=int, default=500, help='Distinct URLs in the log')
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='Largest size at which the full-scan baseline is measured')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='perfbot-store-bench-')
+    store = MetricsStore(os.path.join(root, 'store'), legacy_log=None)
+    legacy_path = os.path.join(root, 'performance_log.json')
+    urls = [f"https://sloelux.com/products/product-{i}" for i in range(args.urls)]
+
+    checkpoints = [n for n in (10 ** k for k in range(3, 9)) if n < args.records] + [args.records]
+    print(f"🚀 Metrics store benchmark, {args.urls} URLs (median ms per read)\n")
+    print(f"   {'records':>10}  {'tail(10)':>9}  {'last()':>8}  {'latest(url)':>11}  {'cold open':>9}  {'full scan':>9}")
+
+    written = 0
+    for checkpoint in checkpoints:
+        while written < checkpoint:
+            batch = [make_record(i, urls) for i in range(written, min(checkpoint, written + 10_000))]
+            store.append_many(batch)
+            if checkpoint <= args.legacy_max:
+                with open(legacy_path, 'a') as f:
+                    f.writelines(json.dumps(record) + '\n' for record in batch)
+            written += len(batch)
+
+        tail = median_ms(lambda: store.tail(10))
+        last = median_ms(store.last)
+        latest = median_ms(lambda: store.latest(random.choice(urls)))
+        cold = median_ms(lambda: MetricsStore(store.root, legacy_log=None).last(), repeat=5)
+        scan = f"{median_ms(lambda: legacy_tail(legacy_path), repeat=3):9.2f}" if checkpoint <= args.legacy_max else f"{'-':>9}"
+        print(f"   {checkpoint:>10,}  {tail:9.3f}  {last:8.3f}  {latest:11.3f}  {cold:9.2f}  {scan}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the concurrent audit pipeline in perf_loop.
+Runs the pipeline against a local mock PageSpeed Insights server and
+reports URLs/minute for increasing concurrency limits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+def start_mock_psi(delay):
+    """Start a mock PSI server that answers every request after `delay` seconds"""
+
+    class MockPSIHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = parse_qs(urlparse(self.path).query).get('url', [''])[0]
+            time.sleep(delay)
+            body = json.dumps({
+                'id': url,
+                'lighthouseResult': {
+                    'categories': {'performance': {'id': 'performance', 'score': 0.75}},
+                    'audits': {
+                        'largest-contentful-paint': {'id': 'largest-contentful-paint', 'numericValue': 2500},
+                        'total-blocking-time': {'id': 'total-blocking-time', 'numericValue': 150}
+                    }
+                }
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockPSIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def run_cycle(urls, concurrency):
+    """Run one audit cycle and return the elapsed wall time"""
+    from perf_loop import run_audits
+
+    start = time.perf_counter()
+    async for _ in run_audits(urls, {"timestamp": "benchmark"}, concurrency):
+        pass
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--urls', type=int, default=40, help='URLs per cycle')
+    parser.add_argument('--delay', type=float, default=0.25, help='Mock PSI latency (s)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server = start_mock_psi(args.delay)
+
+    # Point the real fetch path at the mock server and lift the PSI quota limiter
+    os.environ['PSI_KEY'] = 'benchmark'
+    os.environ['PSI_API_URL'] = f"http://127.0.0.1:{server.server_address[1]}/runPagespeed"
+    os.environ['PSI_RATE_LIMIT'] = os.environ['PSI_BURST'] = '1000'
+    os.environ['HTTP_POOL_PER_HOST'] = str(max(args.concurrency))
+
+    # Keep benchmark metrics and cache entries out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix='perfbot-bench-'))
+
+    print(f"🚀 {args.urls} URLs, mock PSI latency {args.delay * 1000:.0f} ms\n")
+    baseline = None
+    for concurrency in args.concurrency:
+        # Fresh URLs per run so the PSI cache never answers
+        urls = [f"https://sloelux.com/products/product-{i}?c={concurrency}" for i in range(args.urls)]
+        elapsed = asyncio.run(run_cycle(urls, concurrency))
+        urls_per_minute = args.urls / elapsed * 60
+        baseline = baseline or urls_per_minute
+        print(f"   concurrency={concurrency:<3} {elapsed:6.2f}s  "
+              f"{urls_per_minute:8.1f} URLs/min  ({urls_per_minute / baseline:.1f}x)")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Ingest benchmark for the Postgres write-behind writer.
+Inserts synthetic performance_metrics rows into the database named by
+DB_HOST / DB_USER / DB_PASSWORD / DB_NAME (run setup_db.py first, and
+use a scratch database) and reports rows/second for one INSERT and
+commit per row, as a direct per-call write would do, next to PgWriter
+batches. Benchmark rows are deleted afterwards.
+
+    DB_HOST=localhost python bench_pg_writer.py --rows 100000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from db import connection, db_enabled
+from pg_writer import PgWriter
+
+BENCH_PREFIX = 'https://bench.invalid/'
+
+def make_row(i):
+    return {
+        'url': f"{BENCH_PREFIX}products/product-{i % 500}",
+        'lcp': round(random.uniform(1.5, 5.0), 2),
+        'tbt': random.randint(50, 600),
+        'inp': 'good',
+        'timestamp': '2026-01-01T00:00:00+00:00'
+    }
+
+def per_row_inserts(rows):
+    """One INSERT and commit per row"""
+    with connection() as conn, conn.cursor() as cur:
+        for row in rows:
+            cur.execute("INSERT INTO performance_metrics (url, lcp, tbt, inp, timestamp) VALUES (%s, %s, %s, %s, %s)",
+                        (row['url'], row['lcp'], row['tbt'], row['inp'], row['timestamp']))
+            conn.commit()
+
+def write_behind(rows, batch):
+    writer = PgWriter(batch_size=batch, flush_interval=3600,
+                      spool_path=os.path.join(tempfile.mkdtemp(prefix='perfbot-pg-bench-'), 'spool.jsonl'))
+    for start in range(0, len(rows), batch):
+        for row in rows[start:start + batch]:
+            writer.add_metric(row)
+        writer.flush()
+    assert writer.stats()['rows_written'] == len(rows), writer.stats()
+
+def cleanup():
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM performance_metrics WHERE url LIKE %s", (BENCH_PREFIX + '%',))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--per-row-max', type=int, default=5_000,
+                        help='Rows used for the (slow) per-row INSERT baseline')
+    parser.add_argument('--batch', type=int, nargs='+', default=[100, 500, 5000])
+    args = parser.parse_args()
+
+    if not db_enabled():
+        parser.error("set DB_HOST (and DB_USER / DB_PASSWORD / DB_NAME) to a scratch database")
+
+    rows = [make_row(i) for i in range(args.rows)]
+    print(f"🚀 performance_metrics ingest, {args.rows:,} rows\n")
+    try:
+        baseline_rows = rows[:args.per_row_max]
+        start = time.perf_counter()
+        per_row_inserts(baseline_rows)
+        baseline = len(baseline_rows) / (time.perf_counter() - start)
+        print(f"   {'INSERT + commit per row':<28} {baseline:10,.0f} rows/s  (1.0x)")
+
+        for batch in args.batch:
+            start = time.perf_counter()
+            write_behind(rows, batch)
+            rate = len(rows) / (time.perf_counter() - start)
+            print(f"   {f'PgWriter COPY, batch {batch}':<28} {rate:10,.0f} rows/s  ({rate / baseline:.1f}x)")
+    finally:
+        cleanup()
+
+if __name__ == "__main__":
+    main()
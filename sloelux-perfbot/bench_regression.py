@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the regression detector.
+Scores a synthetic history (every run against the previous window of
+runs of the same URL) with a per-row Python loop using statistics.median,
+then with the vectorised score_history() pass, and checks both agree.
+
+    python bench_regression.py --runs 500000 --urls 2000
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from config import REGRESSION_WINDOW
+from regression import METRICS, MAD_SCALE, REGRESSION_METRICS, score_history
+
+def python_scores(keys, values, window):
+    """Robust z-scores one row at a time"""
+    z = np.full(values.shape, np.nan)
+    start = 0
+    for i in range(len(keys)):
+        if i and keys[i] != keys[i - 1]:
+            start = i
+        history = values[max(start, i - window):i]
+        if not len(history):
+            continue
+        for j, name in enumerate(METRICS):
+            direction, floor, _ = REGRESSION_METRICS[name]
+            baseline = statistics.median(history[:, j])
+            mad = statistics.median(abs(v - baseline) for v in history[:, j])
+            z[i, j] = direction * (values[i, j] - baseline) / (MAD_SCALE * mad + floor)
+    return z
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=200_000)
+    parser.add_argument('--urls', type=int, default=1_000)
+    parser.add_argument('--window', type=int, default=REGRESSION_WINDOW)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    keys = np.sort(rng.integers(0, args.urls, args.runs))
+    values = np.column_stack([rng.normal(2.5, 0.3, args.runs), rng.normal(200, 40, args.runs),
+                              rng.normal(75, 5, args.runs)])
+    print(f"🚀 {args.runs:,} runs, {args.urls:,} URLs, window {args.window}\n")
+
+    start = time.perf_counter()
+    expected = python_scores(keys, values, args.window)
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = score_history(keys, values, args.window)
+    vector_s = time.perf_counter() - start
+
+    assert np.allclose(scores['z'], expected, equal_nan=True)
+    print(f"   {'per-row Python':<18} {loop_s * 1000:10.1f} ms")
+    print(f"   {'score_history':<18} {vector_s * 1000:10.1f} ms  ({loop_s / vector_s:.0f}x)")
+    flagged = int(scores['regressed'].any(axis=1).sum())
+    print(f"\n   {flagged:,} runs ({flagged / args.runs:.2%}) flagged as regressions on pure noise")
+
+if __name__ == "__main__":
+    main()
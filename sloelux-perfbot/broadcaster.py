@@ -0,0 +1,168 @@
+"""
+In-process fan-out of live results to server-sent-event subscribers.
+
+Publishers (run_audits, performance_monitoring_loop and the store relay)
+call publish() once per result. The event is encoded into an SSE frame
+once and appended to each subscriber's bounded buffer, so hundreds of
+open dashboards cost one encode plus a deque append each, not one
+polling request each.
+
+A slow subscriber never blocks publishers or other subscribers. When
+its buffer is full, a new event replaces a pending event for the same
+URL (the dashboard only needs the newest numbers per URL). If there is
+none, the oldest pending event is dropped, and the subscriber gets a
+`lagged` event with the count before the next delivered event.
+
+Audits run by other processes (the scheduled worker, PerfBot) reach the
+stream through StoreRelay, which tails the metrics store while anyone is
+subscribed and publishes each new record as a `metrics` event.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, Optional, Set
+
+from config import STREAM_BUFFER, STREAM_RELAY_INTERVAL
+from metrics_store import NO_POSITION, MetricsStore, metrics_store
+
+class Subscription:
+    """One subscriber's bounded buffer of encoded frames"""
+
+    def __init__(self, url: Optional[str], maxlen: int):
+        self.url = url
+        self.maxlen = maxlen
+        self.pending: deque = deque()  # (key, frame)
+        self.dropped = 0
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, key: Optional[str], frame: bytes):
+        if self.url is not None and key != self.url:
+            return
+        if len(self.pending) >= self.maxlen:
+            for i, (pending_key, _) in enumerate(self.pending):
+                if key is not None and pending_key == key:
+                    del self.pending[i]
+                    self.coalesced += 1
+                    break
+            else:
+                self.pending.popleft()
+                self.dropped += 1
+        self.pending.append((key, frame))
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """The next frame (prefixed by a lagged notice if events were dropped), or None on timeout"""
+        if not self.pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        _, frame = self.pending.popleft()
+        if self.dropped:
+            notice = _frame('lagged', {'dropped': self.dropped})
+            self.dropped = 0
+            return notice + frame
+        return frame
+
+def _frame(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+class Broadcaster:
+    """Publish once, deliver to every subscriber's buffer"""
+
+    def __init__(self, buffer: int = STREAM_BUFFER):
+        self.buffer = buffer
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, url: Optional[str] = None) -> Subscription:
+        """Register a subscriber (on the event loop), optionally for one URL only"""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(url, self.buffer)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, data: Dict[str, Any], event: str = 'result'):
+        """Fan an event out to every subscriber; safe to call from any thread"""
+        if not self._subscribers:
+            return
+        frame = _frame(event, data)
+        key = data.get('url') if isinstance(data.get('url'), str) else None
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(key, frame)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, key, frame)
+
+    def _deliver(self, key: Optional[str], frame: bytes):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(key, frame)
+        self.published += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'published': self.published,
+            'pending': sum(len(s.pending) for s in subscribers),
+            'coalesced': sum(s.coalesced for s in subscribers)
+        }
+
+class StoreRelay:
+    """Publishes records appended to the metrics store (by any process) while there are subscribers"""
+
+    def __init__(self, broadcaster: Broadcaster, store: MetricsStore = metrics_store,
+                 interval: float = STREAM_RELAY_INTERVAL):
+        self.broadcaster = broadcaster
+        self.store = store
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last = await asyncio.to_thread(self.store.head)
+        while self.broadcaster.subscriber_count():
+            await asyncio.sleep(self.interval)
+            head = await asyncio.to_thread(self.store.head)
+            if head == last or head == NO_POSITION:
+                continue
+            records, last = await asyncio.to_thread(self._newer_than, last)
+            for record in records:
+                self.broadcaster.publish(record, event='metrics')
+
+    def _newer_than(self, position: int):
+        """Records appended after position (at most one buffer's worth), and the newest position seen"""
+        positions = []
+        for current, _ in self.store.entries():
+            if current <= position or len(positions) == self.broadcaster.buffer:
+                break
+            positions.append(current)
+        newest = positions[0] if positions else position
+        return [self.store.read(p) for p in reversed(positions)], newest
+
+# Shared broadcaster and store relay
+broadcaster = Broadcaster()
+store_relay = StoreRelay(broadcaster)
@@ -2,6 +2,9 @@
 Configuration for SLOE LUX performance monitoring
 """
 
+import os
+import tempfile
+
 # Performance SLAs
 PERFORMANCE_SLAS = {
     'LCP': 4000,  # Largest Contentful Paint (ms)
@@ -21,4 +24,115 @@ THEME_ID_PREVIEW = 'preview_theme_id'  # Replace with actual preview theme ID
 THEME_ID_LIVE = 'live_theme_id'        # Replace with actual live theme ID
 
 # Slack notification settings
-SLACK_WEBHOOK_URL = ''  # Add your Slack webhook URL here 
\ No newline at end of file
+SLACK_WEBHOOK_URL = ''  # Add your Slack webhook URL here
+
+# Audit pipeline settings
+AUDIT_CONCURRENCY = int(os.getenv('AUDIT_CONCURRENCY', '4'))  # Max URLs audited in parallel
+AUDIT_CONCURRENCY_MAX = int(os.getenv('AUDIT_CONCURRENCY_MAX', '16'))  # Highest concurrency an /analyze request may ask for
+
+# Shared rate limits: bucket name -> (tokens per second, burst capacity)
+RATE_LIMITS = {
+    'psi': (float(os.getenv('PSI_RATE_LIMIT', '1')), float(os.getenv('PSI_BURST', '4')))
+}
+
+# PageSpeed Insights response cache
+PSI_CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))       # Seconds before a cached response expires
+PSI_CACHE_SIZE = int(os.getenv('PSI_CACHE_SIZE', '128'))  # Responses kept in memory per process
+PSI_CACHE_DIR = os.getenv('PSI_CACHE_DIR', 'cache/psi')   # On-disk layer shared across processes
+
+# Outbound HTTP client
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))            # Total seconds per request attempt
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))               # Retries on transient failures
+HTTP_POOL_PER_HOST = int(os.getenv('HTTP_POOL_PER_HOST', '8'))   # Pooled connections per host
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', '30'))        # Idle keep-alive seconds
+PSI_API_URL = os.getenv('PSI_API_URL', 'https://www.googleapis.com/pagespeedonline/v5/runPagespeed')
+
+# Metrics store
+METRICS_STORE_DIR = os.getenv('METRICS_STORE_DIR', 'metrics_store')
+METRICS_SEGMENT_BYTES = int(os.getenv('METRICS_SEGMENT_BYTES', str(64 * 1024 * 1024)))  # Seal segments at this size
+METRICS_LEGACY_LOG = 'performance_log.json'  # Imported into an empty store on first use
+METRICS_COMPACT_BLOCK = int(os.getenv('METRICS_COMPACT_BLOCK', '256'))  # Records per compressed block of a sealed segment
+METRICS_PAGE_MAX = int(os.getenv('METRICS_PAGE_MAX', '1000'))  # Largest /metrics page
+METRICS_ARCHIVE_DIR = os.getenv('METRICS_ARCHIVE_DIR', 'metrics_archive')  # Columnar archive of sealed segments
+
+# Per-URL latest/previous run snapshots shared across processes
+SNAPSHOT_DB = os.getenv('SNAPSHOT_DB', 'snapshots.db')
+
+# Serialised responses of the dashboard's read endpoints
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '256'))                  # Cached bodies per process
+RESPONSE_CACHE_GENERATION = os.getenv('RESPONSE_CACHE_GENERATION', 'cache/generation')  # Write counter shared across processes
+
+# Live /stream/metrics server-sent events
+STREAM_BUFFER = int(os.getenv('STREAM_BUFFER', '100'))                 # Pending events per subscriber before coalescing/dropping
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))          # Seconds between keep-alive comments
+STREAM_RELAY_INTERVAL = float(os.getenv('STREAM_RELAY_INTERVAL', '1'))  # Seconds between polls of the store for other processes' results
+
+# Local theme snapshot and the image pipeline that optimises its assets
+THEME_DIR = os.getenv('THEME_DIR', 'theme')                               # Snapshot of the theme (assets/, layout/, sections/, snippets/)
+IMAGE_OUTPUT_DIR = os.getenv('IMAGE_OUTPUT_DIR', 'cache/images')         # Converted images plus the content-hash manifest
+IMAGE_FORMATS = [f for f in os.getenv('IMAGE_FORMATS', 'webp,avif').split(',') if f]
+IMAGE_TARGET_KB = float(os.getenv('IMAGE_TARGET_KB', '150'))             # Size each image's quality search aims for
+IMAGE_MIN_QUALITY = int(os.getenv('IMAGE_MIN_QUALITY', '40'))            # Quality search bounds
+IMAGE_MAX_QUALITY = int(os.getenv('IMAGE_MAX_QUALITY', '85'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '0')) or None             # Encoder processes (default: one per CPU)
+RESPONSIVE_WIDTHS = [int(w) for w in os.getenv('RESPONSIVE_WIDTHS', '360,540,720,960,1280,1600,2048').split(',') if w]
+RESPONSIVE_SIZES = os.getenv('RESPONSIVE_SIZES', '100vw')                 # sizes attribute for <img> tags that have none
+RESPONSIVE_QUALITY = int(os.getenv('RESPONSIVE_QUALITY', '82'))          # JPEG/WebP quality of the width variants
+
+# Critical CSS and unused-CSS pruning
+CRITICAL_SECTIONS = int(os.getenv('CRITICAL_SECTIONS', '3'))     # Leading Shopify sections treated as above the fold
+CRITICAL_ELEMENTS = int(os.getenv('CRITICAL_ELEMENTS', '400'))   # Above-the-fold elements on pages without sections
+CSS_SAFELIST = os.getenv('CSS_SAFELIST', r'^(js|no-js|active|open|focused|loading|hidden)$|^(is-|js-|animate|menu-opening|overflow-hidden)')  # Classes scripts toggle; never pruned
+
+# Render-blocking script deferral
+SCRIPT_ASYNC_ALLOW = [h for h in os.getenv('SCRIPT_ASYNC_ALLOW', 'googletagmanager.com,google-analytics.com,connect.facebook.net,static.hotjar.com,static.klaviyo.com,analytics.tiktok.com,snap.licdn.com').split(',') if h]  # Third-party hosts safe to load async
+
+# Font subsetting
+FONT_BASE_TEXT = os.getenv('FONT_BASE_TEXT', ''.join(map(chr, [*range(0x20, 0x7f), *range(0xa0, 0x180)])) + '‘’“”–—…•€™')  # Glyphs every subset keeps (ASCII, Latin-1, Latin Extended-A)
+FONT_DISPLAY = os.getenv('FONT_DISPLAY', 'swap')                          # font-display for the theme's @font-face rules
+
+# Statistical regression detection against each URL's own history
+REGRESSION_WINDOW = int(os.getenv('REGRESSION_WINDOW', '10'))                 # Previous runs in the rolling baseline
+REGRESSION_MIN_SAMPLES = int(os.getenv('REGRESSION_MIN_SAMPLES', '5'))        # Runs needed before flagging anything
+REGRESSION_CONFIDENCE = float(os.getenv('REGRESSION_CONFIDENCE', '0.999'))    # One-sided confidence to flag a regression
+
+# Cross-process locks used to de-duplicate in-flight PSI runs
+INFLIGHT_LOCK_DIR = os.getenv('INFLIGHT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'sloelux-inflight'))
+
+# Sitemap expansion of wildcard watchlist entries
+SITEMAP_MAX_URLS = int(os.getenv('SITEMAP_MAX_URLS', '50000'))                # URLs read per sitemap
+SAMPLE_CONFIDENCE = float(os.getenv('SAMPLE_CONFIDENCE', '0.95'))             # Confidence level per cluster
+SAMPLE_MARGIN = float(os.getenv('SAMPLE_MARGIN', '0.15'))                     # Margin of error on the SLA pass rate
+SAMPLE_MAX_PER_CLUSTER = int(os.getenv('SAMPLE_MAX_PER_CLUSTER', '40'))       # Hard cap on audits per cluster
+
+# Durable per-URL audit schedule
+SCHEDULE_DB = os.getenv('SCHEDULE_DB', 'schedule.db')
+SCHEDULE_INTERVAL = float(os.getenv('SCHEDULE_INTERVAL', str(24 * 60 * 60)))  # Default seconds between audits of a URL
+SCHEDULE_INTERVALS = {  # Per-template overrides
+    'index': float(os.getenv('SCHEDULE_INTERVAL_INDEX', str(6 * 60 * 60))),
+    'collection': float(os.getenv('SCHEDULE_INTERVAL_COLLECTION', str(12 * 60 * 60)))
+}
+SCHEDULE_JITTER = float(os.getenv('SCHEDULE_JITTER', '0.1'))                 # +/- fraction of the interval
+SCHEDULE_LEASE = float(os.getenv('SCHEDULE_LEASE', '900'))                   # Seconds a claimed URL stays leased
+SCHEDULE_RETRY = float(os.getenv('SCHEDULE_RETRY', '300'))                   # First retry delay after an error (doubles)
+SCHEDULE_BOOST_WINDOW = float(os.getenv('SCHEDULE_BOOST_WINDOW', str(24 * 60 * 60)))  # How long a boost lasts
+SCHEDULE_BOOST_FACTOR = float(os.getenv('SCHEDULE_BOOST_FACTOR', '4'))      # Interval divisor while boosted
+SCHEDULE_BOOST_SCORE_DROP = float(os.getenv('SCHEDULE_BOOST_SCORE_DROP', '10'))  # Score drop since the last audit that boosts a URL
+SCHEDULE_RESYNC = float(os.getenv('SCHEDULE_RESYNC', '3600'))               # Seconds between watchlist re-expansions
+SCHEDULE_IDLE_POLL = float(os.getenv('SCHEDULE_IDLE_POLL', '60'))           # Longest idle wait between claims
+
+# PostgreSQL (performance_metrics / optimization_history); disabled unless DB_HOST is set
+DB_PARAMS = {
+    'host': os.getenv('DB_HOST', ''),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'dbname': os.getenv('DB_NAME', 'sloelux_perf')
+}
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '4'))                     # Pooled connections per process
+PG_WRITE_BATCH = int(os.getenv('PG_WRITE_BATCH', '500'))             # Rows buffered before a flush
+PG_FLUSH_INTERVAL = float(os.getenv('PG_FLUSH_INTERVAL', '2'))       # Max seconds a row waits in the buffer
+PG_SPOOL_PATH = os.getenv('PG_SPOOL_PATH', 'spool/pg_writer.jsonl')  # Rows kept here while Postgres is down
+
+# Performance history queries (rollups.py)
+HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', '500'))                 # Most points returned per series
+HISTORY_RAW_SPAN = float(os.getenv('HISTORY_RAW_SPAN', str(2 * 24 * 60 * 60)))  # Ranges up to this many seconds use raw rows
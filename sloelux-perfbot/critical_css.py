@@ -0,0 +1,608 @@
+"""
+Critical-CSS extraction and unused-CSS pruning for the theme snapshot.
+
+The theme's stylesheets are parsed into rules (keeping @media, @supports
+and similar blocks nested) and every selector is matched against the
+rendered HTML of the watchlist pages (one page per template). Matching
+is indexed the way browsers do it: each page's elements are indexed by
+id, class, tag and attribute name, and a selector is checked right to
+left, starting only from elements that carry its rightmost id, rarest
+class or tag. Most unused selectors are rejected before any element is
+visited, because a class or id they need does not occur on any page.
+The cost follows the number of candidate elements, not rules x nodes.
+
+Selectors that match nothing are dropped from `<name>.pruned.css`, and
+the theme references the pruned file instead. Rules that match an
+element above the fold form the critical CSS, inlined into
+layout/theme.liquid. Above the fold means the first CRITICAL_SECTIONS
+Shopify sections, or the first CRITICAL_ELEMENTS elements on pages
+without sections. Relative url()s in the critical rules are rewritten
+to asset_url, since inlined they would resolve against the page URL
+instead of the assets directory. The stylesheets referenced by the
+layout are then loaded without blocking rendering.
+
+Pruning errs on the side of keeping. Pseudo-classes, state attributes
+(open, aria-expanded, ...) and classes matching CSS_SAFELIST (classes
+that scripts toggle) are assumed to match, and any selector the parser
+does not understand is kept.
+"""
+
+import asyncio
+import os
+import posixpath
+import re
+import time
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import CRITICAL_ELEMENTS, CRITICAL_SECTIONS, CSS_SAFELIST, THEME_DIR, WATCHLIST
+from http_client import http_client
+from sitemap import expand_watchlist, is_wildcard
+
+UNUSED, USED, CRITICAL = 0, 1, 2
+
+# At-rules whose block holds further rules
+NESTED_AT_RULES = {'media', 'supports', 'layer', 'container', 'document', '-moz-document', 'scope'}
+# Attributes that scripts and user interaction toggle; conditions on them are assumed to hold
+STATE_ATTRIBUTES = {'open', 'hidden', 'checked', 'selected', 'disabled', 'aria-expanded', 'aria-hidden',
+                    'aria-selected', 'aria-current', 'aria-pressed', 'aria-busy'}
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                 'param', 'source', 'track', 'wbr'}
+
+class StyleRule:
+    __slots__ = ('selectors', 'declarations')
+
+    def __init__(self, selectors: List[str], declarations: str):
+        self.selectors = selectors
+        self.declarations = declarations
+
+class AtRule:
+    """@media/@supports/... with child rules, or a raw at-rule (@font-face, @keyframes, @import)"""
+    __slots__ = ('name', 'prelude', 'rules', 'body')
+
+    def __init__(self, name: str, prelude: str, rules: Optional[list] = None, body: Optional[str] = None):
+        self.name = name
+        self.prelude = prelude
+        self.rules = rules
+        self.body = body
+
+COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.DOTALL)
+SPECIAL = re.compile(r'[{}();"\']')
+WHITESPACE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|\s+')
+AT_NAME = re.compile(r'@([\w-]+)')
+
+def _minify(text: str) -> str:
+    """Collapse whitespace outside strings"""
+    return WHITESPACE.sub(lambda m: m.group(1) or ' ', text).strip()
+
+def _scan(text: str, pos: int, stops: str) -> int:
+    """Index of the first character in stops at paren depth 0 outside strings (len(text) if none)"""
+    depth = 0
+    while True:
+        match = SPECIAL.search(text, pos)
+        if not match:
+            return len(text)
+        char, pos = match.group(), match.start()
+        if char in '"\'':
+            end = re.compile(r'\\.|' + char).search
+            pos += 1
+            while True:
+                found = end(text, pos)
+                if not found:
+                    return len(text)
+                pos = found.end()
+                if found.group() == char:
+                    break
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(depth - 1, 0)
+        elif depth == 0 and char in stops:
+            return pos
+        pos += 1
+
+def _block_end(text: str, pos: int) -> int:
+    """Index of the '}' closing the block that starts after pos"""
+    depth = 1
+    while depth:
+        pos = _scan(text, pos, '{}')
+        if pos >= len(text):
+            return pos
+        depth += 1 if text[pos] == '{' else -1
+        pos += 1
+    return pos - 1
+
+def split_selectors(prelude: str) -> List[str]:
+    """Split a selector list on top-level commas"""
+    selectors, depth, start, quote = [], 0, 0, None
+    for i, char in enumerate(prelude):
+        if quote:
+            if char == quote and prelude[i - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(' '.join(prelude[start:i].split()))
+            start = i + 1
+    selectors.append(' '.join(prelude[start:].split()))
+    return [s for s in selectors if s]
+
+def parse_stylesheet(text: str) -> list:
+    """Parse CSS into StyleRule/AtRule trees"""
+    text = COMMENT.sub(lambda m: m.group(1) or '', text)
+    rules, _ = _parse_rules(text, 0)
+    return rules
+
+def _parse_rules(text: str, pos: int) -> Tuple[list, int]:
+    rules = []
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            return rules, pos
+        if text[pos] == '}':
+            return rules, pos + 1
+        end = _scan(text, pos, '{;}')
+        prelude = text[pos:end].strip()
+        if end >= len(text) or text[end] != '{':
+            # Statement at-rule (@import, @charset) or a stray declaration
+            if prelude.startswith('@'):
+                name = AT_NAME.match(prelude)
+                rules.append(AtRule(name.group(1).lower() if name else '', prelude))
+            pos = end + 1 if end < len(text) and text[end] == ';' else end
+            continue
+        if prelude.startswith('@'):
+            name = AT_NAME.match(prelude)
+            name = name.group(1).lower() if name else ''
+            if name in NESTED_AT_RULES:
+                children, pos = _parse_rules(text, end + 1)
+                rules.append(AtRule(name, prelude, rules=children))
+                continue
+            close = _block_end(text, end + 1)
+            rules.append(AtRule(name, prelude, body=text[end + 1:close]))
+            pos = close + 1
+            continue
+        close = _block_end(text, end + 1)
+        body = text[end + 1:close]
+        if '{' in body:  # CSS nesting: kept verbatim
+            rules.append(AtRule('', prelude, body=body))
+        else:
+            rules.append(StyleRule(split_selectors(prelude), body))
+        pos = close + 1
+
+def serialise(rules: Iterable) -> str:
+    """Minified CSS text for a rule tree"""
+    out = []
+    for rule in rules:
+        if isinstance(rule, StyleRule):
+            out.append(f"{','.join(rule.selectors)}{{{_minify(rule.declarations)}}}")
+        elif rule.rules is not None:
+            out.append(f"{_minify(rule.prelude)}{{{serialise(rule.rules)}}}")
+        elif rule.body is not None:
+            out.append(f"{_minify(rule.prelude)}{{{_minify(rule.body)}}}")
+        else:
+            out.append(f"{_minify(rule.prelude)};")
+    return ''.join(out)
+
+class Element:
+    __slots__ = ('tag', 'id', 'classes', 'attrs', 'parent', 'previous', 'order')
+
+    def __init__(self, tag, attrs, parent, previous, order):
+        self.tag = tag
+        self.attrs = attrs
+        self.id = attrs.get('id')
+        self.classes = frozenset((attrs.get('class') or '').split())
+        self.parent = parent
+        self.previous = previous
+        self.order = order
+
+class PageIndex(HTMLParser):
+    """Elements of one rendered page, indexed by id, class, tag and attribute name"""
+
+    def __init__(self, html: str, sections: int = CRITICAL_SECTIONS, elements: int = CRITICAL_ELEMENTS):
+        super().__init__(convert_charrefs=True)
+        self.elements: List[Element] = []
+        self.by_id: Dict[str, List[Element]] = {}
+        self.by_class: Dict[str, List[Element]] = {}
+        self.by_tag: Dict[str, List[Element]] = {}
+        self.by_attr: Dict[str, List[Element]] = {}
+        self._stack: List[Element] = []
+        self._last_child: List[Optional[Element]] = [None]
+        self._sections: List[int] = []
+        self._body: Optional[int] = None
+        self.feed(html)
+        self.close()
+        # Elements before `fold` (in document order) are above the fold
+        if len(self._sections) > sections:
+            self.fold = self._sections[sections]
+        elif self._sections:
+            self.fold = len(self.elements)
+        else:
+            self.fold = (self._body or 0) + elements
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or '' for name, value in attrs}
+        parent = self._stack[-1] if self._stack else None
+        element = Element(tag, attrs, parent, self._last_child[-1], len(self.elements))
+        self._last_child[-1] = element
+        self.elements.append(element)
+        if element.id:
+            self.by_id.setdefault(element.id, []).append(element)
+        for name in element.classes:
+            self.by_class.setdefault(name, []).append(element)
+        self.by_tag.setdefault(tag, []).append(element)
+        for name in attrs:
+            self.by_attr.setdefault(name, []).append(element)
+        if tag == 'body' and self._body is None:
+            self._body = element.order
+        if 'shopify-section' in element.classes:
+            self._sections.append(element.order)
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(element)
+            self._last_child.append(None)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # Close up to the matching element; unmatched end tags are ignored
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i].tag == tag:
+                del self._stack[i:]
+                del self._last_child[i + 1:]
+                return
+
+SELECTOR_TOKEN = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<comb>[>+~])
+  | (?P<id>\#(?:[\w-]|\\.)+)
+  | (?P<cls>\.(?:[\w-]|\\.)+)
+  | (?P<tag>[\w-]+|\*)
+  | (?P<attr>\[\s*(?P<name>[\w:-]+)\s*(?:(?P<op>[~|^$*]?=)\s*(?P<value>"[^"]*"|'[^']*'|[^\s\]]+)\s*(?P<flag>[iIsS])?)?\s*\])
+  | (?P<pseudo>::?[\w-]+(?:\((?:[^()]|\([^()]*\))*\))?)
+''', re.VERBOSE)
+ESCAPE = re.compile(r'\\(.)')
+
+class Compound:
+    __slots__ = ('tag', 'ids', 'classes', 'attrs')
+
+    def __init__(self):
+        self.tag: Optional[str] = None
+        self.ids: List[str] = []
+        self.classes: List[str] = []
+        self.attrs: List[Tuple[str, Optional[str], str, bool]] = []
+
+    def matches(self, element: Element) -> bool:
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        if any(element.id != i for i in self.ids):
+            return False
+        if any(c not in element.classes for c in self.classes):
+            return False
+        for name, op, value, fold in self.attrs:
+            actual = element.attrs.get(name)
+            if actual is None:
+                return False
+            if op is None:
+                continue
+            if fold:
+                actual = actual.lower()
+            if not (op == '=' and actual == value
+                    or op == '~=' and value in actual.split()
+                    or op == '|=' and (actual == value or actual.startswith(value + '-'))
+                    or op == '^=' and value and actual.startswith(value)
+                    or op == '$=' and value and actual.endswith(value)
+                    or op == '*=' and value and value in actual):
+                return False
+        return True
+
+def parse_selector(selector: str, safelist: Optional[re.Pattern] = None) -> Optional[Tuple[List[Compound], List[str]]]:
+    """(compounds, combinators) left to right, or None if the selector is not understood"""
+    compounds, combinators = [Compound()], []
+    pending, pos, started = None, 0, False
+    while pos < len(selector):
+        token = SELECTOR_TOKEN.match(selector, pos)
+        if not token:
+            return None
+        kind, text, pos = token.lastgroup, token.group(), token.end()
+        if kind in ('ws', 'comb'):
+            if not started:
+                if kind == 'comb':
+                    return None  # Relative selector
+                continue
+            if kind == 'comb' or pending is None:
+                pending = text if kind == 'comb' else ' '
+            continue
+        started = True
+        if pending is not None:
+            compounds.append(Compound())
+            combinators.append(pending)
+            pending = None
+        compound = compounds[-1]
+        if kind == 'attr':
+            name = token.group('name').lower()
+            if name in STATE_ATTRIBUTES:
+                continue
+            value = token.group('value')
+            if value and value[0] in '"\'':
+                value = value[1:-1]
+            fold = (token.group('flag') or '').lower() == 'i'
+            compound.attrs.append((name, token.group('op'), (value or '').lower() if fold else value or '', fold))
+        elif kind == 'id':
+            compound.ids.append(ESCAPE.sub(r'\1', text[1:]))
+        elif kind == 'cls':
+            name = ESCAPE.sub(r'\1', text[1:])
+            if not (safelist and safelist.search(name)):
+                compound.classes.append(name)
+        elif kind == 'tag':
+            if text != '*':
+                compound.tag = text.lower()
+        elif kind == 'pseudo':
+            if text.lower() == ':root' and compound.tag is None:
+                compound.tag = 'html'
+            # Other pseudo-classes and pseudo-elements are assumed to match
+    if pending is not None and pending != ' ':
+        return None  # Trailing combinator
+    return compounds, combinators
+
+class SelectorMatcher:
+    """Classifies selectors as unused, used or critical across a set of rendered pages"""
+
+    def __init__(self, pages: Sequence[PageIndex], safelist: str = CSS_SAFELIST):
+        self.pages = pages
+        self.safelist = re.compile(safelist) if safelist else None
+        self.ids = set().union(*(p.by_id for p in pages)) if pages else set()
+        self.classes = set().union(*(p.by_class for p in pages)) if pages else set()
+        self._cache: Dict[str, int] = {}
+
+    def classify(self, selector: str) -> int:
+        result = self._cache.get(selector)
+        if result is None:
+            result = self._cache[selector] = self._classify(selector)
+        return result
+
+    def _classify(self, selector: str) -> int:
+        parsed = parse_selector(selector, self.safelist)
+        if parsed is None:
+            return CRITICAL  # Not understood: keep it everywhere
+        compounds, combinators = parsed
+        # Cheap rejection: an id or class that no page has
+        for compound in compounds:
+            if any(i not in self.ids for i in compound.ids) or any(c not in self.classes for c in compound.classes):
+                return UNUSED
+        result = UNUSED
+        for page in self.pages:
+            order = self._first_match(page, compounds, combinators)
+            if order is not None:
+                if order < page.fold:
+                    return CRITICAL
+                result = USED
+        return result
+
+    @staticmethod
+    def _candidates(page: PageIndex, compound: Compound) -> List[Element]:
+        if compound.ids:
+            return page.by_id.get(compound.ids[0], [])
+        if compound.classes:
+            return min((page.by_class.get(c, []) for c in compound.classes), key=len)
+        if compound.tag is not None:
+            return page.by_tag.get(compound.tag, [])
+        if compound.attrs:
+            return page.by_attr.get(compound.attrs[0][0], [])
+        return page.elements
+
+    def _first_match(self, page: PageIndex, compounds: List[Compound], combinators: List[str]) -> Optional[int]:
+        """Document order of the first element the selector matches on page"""
+        memo: Dict[Tuple[int, int], bool] = {}
+
+        def match(i: int, element: Element) -> bool:
+            key = (i, element.order)
+            if key in memo:
+                return memo[key]
+            result = compounds[i].matches(element)
+            if result and i:
+                combinator = combinators[i - 1]
+                if combinator == ' ':
+                    other, result = element.parent, False
+                    while other is not None and not result:
+                        result, other = match(i - 1, other), other.parent
+                elif combinator == '>':
+                    result = element.parent is not None and match(i - 1, element.parent)
+                elif combinator == '+':
+                    result = element.previous is not None and match(i - 1, element.previous)
+                else:
+                    other, result = element.previous, False
+                    while other is not None and not result:
+                        result, other = match(i - 1, other), other.previous
+            memo[key] = result
+            return result
+
+        last = len(compounds) - 1
+        for element in self._candidates(page, compounds[last]):
+            if match(last, element):
+                return element.order
+        return None
+
+KEYFRAMES = ('keyframes', '-webkit-keyframes', '-moz-keyframes')
+
+def _prune(rules: list, matcher: SelectorMatcher, level: int) -> list:
+    """Rules with selectors classified at or above level; @keyframes are filtered afterwards"""
+    kept = []
+    for rule in rules:
+        if isinstance(rule, StyleRule):
+            selectors = [s for s in rule.selectors if matcher.classify(s) >= level]
+            if selectors:
+                kept.append(StyleRule(selectors, rule.declarations))
+        elif rule.rules is not None:
+            children = _prune(rule.rules, matcher, level)
+            if children:
+                kept.append(AtRule(rule.name, rule.prelude, rules=children))
+        elif level == CRITICAL and (rule.name == 'font-face' or rule.body is None):
+            continue  # Fonts and imports load with the full stylesheet
+        else:
+            kept.append(rule)
+    return kept
+
+def _drop_unused_keyframes(rules: list) -> list:
+    """Remove @keyframes no kept declaration refers to"""
+    declarations = []
+
+    def collect(nodes):
+        for node in nodes:
+            if isinstance(node, StyleRule):
+                declarations.append(node.declarations)
+            elif node.rules is not None:
+                collect(node.rules)
+    collect(rules)
+    text = '\n'.join(declarations)
+
+    def keep(nodes):
+        out = []
+        for node in nodes:
+            if isinstance(node, AtRule) and node.name in KEYFRAMES:
+                parts = node.prelude.split(None, 1)
+                name = parts[1].strip().strip('"\'') if len(parts) > 1 else ''
+                if not name or not re.search(r'(?<![\w-])' + re.escape(name) + r'(?![\w-])', text):
+                    continue
+            elif isinstance(node, AtRule) and node.rules is not None:
+                node = AtRule(node.name, node.prelude, rules=keep(node.rules))
+            out.append(node)
+        return out
+    return keep(rules)
+
+def _count(rules: list) -> int:
+    return sum(_count(r.rules) if isinstance(r, AtRule) and r.rules is not None else 1 for r in rules)
+
+def extract(css: str, matcher: SelectorMatcher) -> Dict[str, Any]:
+    """Pruned and critical CSS for one stylesheet"""
+    rules = parse_stylesheet(css)
+    pruned = _drop_unused_keyframes(_prune(rules, matcher, USED))
+    critical = _drop_unused_keyframes(_prune(rules, matcher, CRITICAL))
+    return {
+        'pruned': serialise(pruned),
+        'critical': serialise(critical),
+        'rules': _count(rules),
+        'rules_kept': _count(pruned),
+        'rules_critical': _count(critical)
+    }
+
+async def fetch_pages(entries: Sequence[str] = WATCHLIST) -> Dict[str, str]:
+    """Rendered HTML of the literal watchlist URLs plus one sampled page per wildcard template"""
+    _, clusters, _ = await expand_watchlist(entries)
+    # Pages built from one template share their markup, so one page stands in for the template
+    urls = [e for e in entries if not is_wildcard(e)] + [c.sample[0] for c in clusters if c.sample]
+    responses = await asyncio.gather(*(http_client.request('GET', url) for url in urls), return_exceptions=True)
+    return {url: r.text() for url, r in zip(urls, responses) if not isinstance(r, Exception) and r.ok}
+
+STYLESHEET_TAG = re.compile(r'(?<!<noscript>)\{\{\s*(["\'])([^"\']+\.css)\1\s*\|\s*asset_url\s*\|\s*stylesheet_tag\s*\}\}')
+DEFERRED_LINK = re.compile(r'<link rel="stylesheet" href="\{\{\s*["\']([^"\']+\.css)["\']\s*\|\s*asset_url\s*\}\}" media="print"')
+CRITICAL_BLOCK = re.compile(r'<style data-critical-css>.*?</style>\n?', re.DOTALL)
+CSS_URL = re.compile(r'url\(\s*(["\']?)([^"\'()\s]+)\1\s*\)', re.IGNORECASE)
+NOT_RELATIVE = re.compile(r'^(?:[a-z][a-z0-9+.-]*:|/|#|\{)', re.IGNORECASE)  # scheme:, /path, //host, #id, Liquid
+TEMPLATE_DIRS = ('layout', 'sections', 'snippets', 'templates')
+
+def _write(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _asset_urls(css: str) -> str:
+    """Rewrite url()s relative to the assets directory to asset_url, for CSS inlined into a template"""
+    def rewrite(match):
+        target = match.group(2)
+        if NOT_RELATIVE.match(target):
+            return match.group(0)
+        path, hash_, fragment = target.partition('#')
+        name = posixpath.normpath(path.split('?')[0])
+        if '/' in name or "'" in name:
+            return match.group(0)  # Outside the (flat) assets directory
+        return f'url("{{{{ \'{name}\' | asset_url }}}}{hash_}{fragment}")'
+    return CSS_URL.sub(rewrite, css)
+
+def _pruned_name(name: str) -> str:
+    return f"{name[:-len('.css')]}.pruned.css"
+
+def optimize_theme(theme_dir: str = THEME_DIR, pages: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Prune the snapshot's stylesheets against the rendered pages and inline the critical CSS"""
+    started = time.perf_counter()
+    if pages is None:
+        pages = http_client.run_sync(fetch_pages())
+    if not pages:
+        return {'status': 'error', 'error': 'No rendered pages to match selectors against'}
+    matcher = SelectorMatcher([PageIndex(html) for html in pages.values()])
+
+    asset_dir = os.path.join(theme_dir, 'assets')
+    names = sorted(n for n in os.listdir(asset_dir) if n.endswith('.css') and not n.endswith('.pruned.css')) \
+        if os.path.isdir(asset_dir) else []
+    layout_path = os.path.join(theme_dir, 'layout', 'theme.liquid')
+    layout = open(layout_path, encoding='utf-8').read() if os.path.exists(layout_path) else ''
+    # Critical rules follow the cascade: the layout's stylesheets first, in the order it links them
+    linked = [re.sub(r'\.pruned\.css$', '.css', m.group(2)) for m in STYLESHEET_TAG.finditer(layout)]
+    linked += [re.sub(r'\.pruned\.css$', '.css', m.group(1)) for m in DEFERRED_LINK.finditer(layout)]
+    order = {name: i for i, name in enumerate(dict.fromkeys(linked + names))}
+
+    report = {'pages': len(pages), 'stylesheets': {}, 'bytes_in': 0, 'bytes_out': 0, 'critical_bytes': 0}
+    critical = []
+    for name in names:
+        with open(os.path.join(asset_dir, name), encoding='utf-8') as f:
+            css = f.read()
+        result = extract(css, matcher)
+        _write(os.path.join(asset_dir, _pruned_name(name)), result['pruned'])
+        critical.append((order[name], _asset_urls(result['critical'])))
+        report['stylesheets'][name] = {key: result[key] for key in ('rules', 'rules_kept', 'rules_critical')}
+        report['bytes_in'] += len(css.encode())
+        report['bytes_out'] += len(result['pruned'].encode())
+    critical_css = ''.join(text for _, text in sorted(critical))
+    report['critical_bytes'] = len(critical_css.encode())
+
+    # Point the templates at the pruned files
+    reference = re.compile(r'(["\'])(' + '|'.join(re.escape(n[:-len('.css')]) for n in names) + r')\.css\1(\s*\|\s*asset_url)') \
+        if names else None
+    templates = []
+    for directory in TEMPLATE_DIRS:
+        root = os.path.join(theme_dir, directory)
+        if not reference or not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            if not name.endswith('.liquid'):
+                continue
+            path = os.path.join(root, name)
+            text = layout if path == layout_path else open(path, encoding='utf-8').read()
+            updated = reference.sub(lambda m: f"{m.group(1)}{m.group(2)}.pruned.css{m.group(1)}{m.group(3)}", text)
+            if path == layout_path:
+                updated = _inline_critical(updated, critical_css)
+            if updated != text:
+                _write(path, updated)
+                templates.append(os.path.relpath(path, theme_dir))
+
+    report['templates'] = templates
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+def _inline_critical(layout: str, critical_css: str) -> str:
+    """Inline the critical CSS ahead of the layout's stylesheets, which then load without blocking"""
+    block = f"<style data-critical-css>{critical_css}</style>\n"
+    existing = CRITICAL_BLOCK.search(layout)
+    if existing:
+        layout = layout[:existing.start()] + block + layout[existing.end():]
+    else:
+        first = STYLESHEET_TAG.search(layout)
+        at = first.start() if first else layout.find('</head>')
+        if at < 0:
+            return layout
+        layout = layout[:at] + block + layout[at:]
+
+    def defer(match):
+        quote, name = match.group(1), match.group(2)
+        href = f"{{{{ {quote}{name}{quote} | asset_url }}}}"
+        return (f'<link rel="stylesheet" href="{href}" media="print" onload="this.media=\'all\'">'
+                f'<noscript>{match.group(0)}</noscript>')
+    return STYLESHEET_TAG.sub(defer, layout)
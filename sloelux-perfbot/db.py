@@ -0,0 +1,40 @@
+"""
+Pooled PostgreSQL connections shared by the writers and query helpers.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import DB_PARAMS, DB_POOL_MAX
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def db_enabled() -> bool:
+    """Whether a PostgreSQL database is configured (DB_HOST is set)"""
+    return bool(DB_PARAMS['host'])
+
+def get_pool() -> ThreadedConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ThreadedConnectionPool(1, DB_POOL_MAX, connect_timeout=5, **DB_PARAMS)
+        return _pool
+
+@contextmanager
+def connection():
+    """A pooled connection: commits on success, rolls back on error"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        # Drop broken connections instead of returning them to the pool
+        pool.putconn(conn, close=bool(conn.closed))
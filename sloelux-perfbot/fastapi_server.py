@@ -1,10 +1,29 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from a2a_middleware import verify_a2a
-from perf_loop import bot
+from perf_loop import bot, run_audits
+from rate_limiter import limiter_stats
+from psi_cache import pagespeed_cache
+from http_client import http_client
+from metrics_store import metrics_store
+from snapshots import snapshots
+from pagespeed import pagespeed_flight
+from scheduler import schedule
+from db import db_enabled
+from pg_writer import pg_writer
+from rollups import performance_history
+from archive import metrics_archive
+from regression import regression_detector
+from response_cache import response_cache
+from broadcaster import broadcaster, store_relay
+from config import AUDIT_CONCURRENCY_MAX, METRICS_PAGE_MAX, STREAM_HEARTBEAT
 import asyncio
+import hashlib
 import json
-from typing import Dict, Any
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
 
 app = FastAPI(
     title="SloeLux Performance Bot API",
@@ -39,29 +58,26 @@ async def root():
 
 @app.post("/analyze")
 async def analyze_performance(request: Dict[str, Any]):
-    """Trigger performance analysis for specific URLs"""
+    """Analyze the requested URLs concurrently, streaming each result as NDJSON"""
     urls = request.get("urls", ["https://sloelux.com"])
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        raise HTTPException(status_code=400, detail="urls must be a list of strings")
+    # Checked before streaming starts: afterwards an error could only truncate the 200 response
+    concurrency = request.get("concurrency")
+    if concurrency is not None and (not isinstance(concurrency, int) or isinstance(concurrency, bool)
+                                    or not 1 <= concurrency <= AUDIT_CONCURRENCY_MAX):
+        raise HTTPException(status_code=400,
+                            detail=f"concurrency must be an integer from 1 to {AUDIT_CONCURRENCY_MAX}")
     
-    results = []
-    for url in urls:
-        try:
-            # Create a context for the bot
-            context = {"url": url, "timestamp": "manual_trigger"}
-            
-            # Run the performance analysis
-            async for result in bot.loop(context):
-                if result.get("url") == url:
-                    results.append(result)
-                    break
-                    
-        except Exception as e:
-            results.append({
-                "status": "error",
-                "url": url,
-                "error": str(e)
-            })
+    # Audit each distinct URL once, in request order
+    urls = list(dict.fromkeys(urls))
+    context = {"urls": urls, "timestamp": "manual_trigger"}
+    
+    async def stream_results():
+        async for result in run_audits(urls, context, concurrency):
+            yield json.dumps(result) + "\n"
     
-    return {"results": results}
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 @app.post("/optimize")
 async def optimize_theme(request: Dict[str, Any]):
@@ -74,26 +90,161 @@ async def optimize_theme(request: Dict[str, Any]):
     
     try:
         from tools import optimize_shopify_theme
-        result = optimize_shopify_theme(shop_domain, issue_type)
-        return result
+        # The theme optimisers resize images, match CSS and subset fonts: keep them off the event loop
+        return await asyncio.to_thread(optimize_shopify_theme.func, shop_domain, issue_type)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _cached_json(request: Request, build) -> Response:
+    """Serve a read endpoint from the response cache, building it with `build()` on a miss"""
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    body = response_cache.get(key)
+    if body is None:
+        generation = response_cache.generation()  # Before building: a write during the build marks it stale
+        body = response_cache.serialise(key, await build(), generation)
+    return Response(body, media_type="application/json")
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
 @app.get("/metrics")
-async def get_metrics():
-    """Get stored performance metrics"""
+async def get_metrics(request: Request, url: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, fields: Optional[str] = None,
+                      limit: int = Query(10, ge=1, le=METRICS_PAGE_MAX), cursor: Optional[str] = None):
+    """Stored performance metrics, newest first, one keyset-paginated page at a time.
+
+    `since`/`until` filter on each record's own `timestamp` (append time for
+    records without one). Pass `next_cursor` back as `cursor` for the next
+    (older) page. Stored records never change, so the ETag is derived from
+    the page's positions and a matching If-None-Match is answered with 304
+    before any record is read.
+    """
     try:
-        metrics = []
-        with open('performance_log.json', 'r') as f:
-            for line in f:
-                if line.strip():
-                    metrics.append(json.loads(line))
-        
-        return {"metrics": metrics[-10:]}  # Return last 10 entries
+        before = int(cursor, 16) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    projection = [field for field in fields.split(",") if field] if fields else None
+    
+    try:
+        positions, more = await asyncio.to_thread(
+            metrics_store.select, url, since.timestamp() if since else None,
+            until.timestamp() if until else None, before, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    next_cursor = format(positions[-1], "x") if more else None
+    digest = hashlib.blake2b(json.dumps([positions, projection, next_cursor]).encode(), digest_size=12).hexdigest()
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "no-cache"}
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    # Same positions and projection, same bytes: the page is cached under its ETag with no generation
+    key = ("/metrics", digest)
+    body = response_cache.get(key)
+    if body is None:
+        def read_page():
+            records = [metrics_store.read(position) for position in positions]
+            if url is not None:
+                records = [record for record in records if record.get("url") == url]  # URL hash collisions
+            if projection:
+                records = [{field: record[field] for field in projection if field in record} for record in records]
+            return records
         
-    except FileNotFoundError:
-        return {"metrics": []}
+        try:
+            records = await asyncio.to_thread(read_page)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        body = response_cache.serialise(key, {"metrics": records, "next_cursor": next_cursor}, immutable=True)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/metrics/latest")
+async def get_latest_metrics(request: Request, url: Optional[str] = None):
+    """Latest run, previous run and delta per URL (or for one URL), without reading the history"""
+    async def build():
+        if url is None:
+            return {"snapshots": snapshots.all()}
+        snapshot = snapshots.get(url)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail=f"No runs recorded for {url}")
+        return snapshot
+    
+    return await _cached_json(request, build)
+
+@app.get("/metrics/summary")
+async def get_metrics_summary(request: Request, url: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None):
+    """Per-URL percentiles and opportunity frequencies over the full metrics history"""
+    since_ts = since.timestamp() if since else None
+    until_ts = until.timestamp() if until else None
+    
+    def summarize():
+        urls = metrics_archive.url_summary(since_ts, until_ts)
+        if url is not None:
+            urls = [entry for entry in urls if entry['url'] == url]
+        return {"urls": urls, "opportunities": metrics_archive.opportunity_counts(url, since_ts, until_ts)}
+    
+    async def build():
+        try:
+            return await asyncio.to_thread(summarize)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return await _cached_json(request, build)
+
+@app.get("/clusters")
+async def get_clusters():
+    """Latest summary of each sampled template cluster (wildcard watchlist entries)"""
+    return {"clusters": await asyncio.to_thread(snapshots.clusters)}
+
+@app.get("/regressions")
+async def get_regressions(request: Request, url: Optional[str] = None, all: bool = False):
+    """Latest run of each URL scored against its own rolling baseline (regressed URLs only unless all=true)"""
+    async def build():
+        try:
+            assessments = await asyncio.to_thread(regression_detector.assess_all)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        results = [a.to_dict() for a in assessments.values()
+                   if (url is None or a.url == url) and (all or a.regressed)]
+        return {"regressions": sorted(results, key=lambda r: -r['confidence'])}
+    
+    return await _cached_json(request, build)
+
+@app.get("/stream/metrics")
+async def stream_metrics(request: Request, url: Optional[str] = None):
+    """Server-sent events: `result` per audit finished here, `metrics` per record stored by any process"""
+    subscription = broadcaster.subscribe(url)
+    store_relay.ensure_running()
+    
+    async def events():
+        try:
+            yield b"retry: 5000\n\n"
+            while not await request.is_disconnected():
+                frame = await subscription.next(STREAM_HEARTBEAT)
+                yield frame if frame is not None else b": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/history")
+async def get_history(url: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      resolution: Optional[str] = None):
+    """LCP/TBT/INP percentiles for a URL, at a resolution suited to the time range"""
+    if not db_enabled():
+        raise HTTPException(status_code=503, detail="History requires a database (set DB_HOST)")
+    if resolution not in (None, "raw", "hour", "day"):
+        raise HTTPException(status_code=400, detail="resolution must be raw, hour or day")
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    try:
+        return await asyncio.to_thread(performance_history, url, start, end, resolution)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -104,7 +255,9 @@ async def deploy_webhook(request: Dict[str, Any]):
     
     action = request.get("action")
     if action == "deploy":
-        # In a real implementation, this would trigger theme deployment
+        # In a real implementation, this would trigger theme deployment.
+        # Published theme changes make every cached PSI response stale.
+        pagespeed_cache.invalidate()
         return {
             "status": "success",
             "message": "Theme deployment initiated",
@@ -116,31 +269,29 @@ async def deploy_webhook(request: Dict[str, Any]):
 @app.get("/status")
 async def get_status():
     """Get bot status and last run information"""
-    try:
-        # Check if performance log exists and get last entry
-        last_run = None
-        with open('performance_log.json', 'r') as f:
-            lines = f.readlines()
-            if lines:
-                last_entry = json.loads(lines[-1])
-                last_run = last_entry.get('timestamp')
-        
-        return {
-            "bot_name": bot.name,
-            "description": bot.description,
-            "last_run": last_run,
-            "status": "active",
-            "next_run": "24 hours from last run"
-        }
-        
-    except FileNotFoundError:
-        return {
-            "bot_name": bot.name,
-            "description": bot.description,
-            "last_run": None,
-            "status": "ready",
-            "next_run": "Not scheduled"
-        }
+    newest = snapshots.newest()
+    last_entry = newest['latest'] if newest else None
+    last_run = last_entry.get('timestamp') if last_entry else None
+    schedule_stats = schedule.stats()
+    next_due = schedule_stats['next_due_in_s']
+    
+    return {
+        "bot_name": bot.name,
+        "description": bot.description,
+        "last_run": last_run,
+        "status": "active" if last_entry else "ready",
+        "next_run": datetime.fromtimestamp(time.time() + next_due, timezone.utc).isoformat() if next_due is not None else "Not scheduled",
+        "rate_limits": limiter_stats(),
+        "psi_cache": pagespeed_cache.stats(),
+        "http_pools": http_client.pool_stats(),
+        "single_flight": pagespeed_flight.stats(),
+        "schedule": schedule_stats,
+        "pg_writer": pg_writer.stats() if db_enabled() else None,
+        "archive": metrics_archive.stats(),
+        "snapshots": snapshots.stats(),
+        "response_cache": response_cache.stats(),
+        "stream": broadcaster.stats()
+    }
 
 if __name__ == "__main__":
     import uvicorn
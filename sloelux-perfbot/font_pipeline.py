@@ -0,0 +1,407 @@
+"""
+Font subsetting and font-display rewriting for the theme snapshot.
+
+A web font ships every glyph it has, while a store's pages use a small
+part of them. The pipeline collects the characters on the rendered
+watchlist pages (text, placeholders and button values), adds
+FONT_BASE_TEXT (printable ASCII, Latin-1 and Latin Extended-A letters and
+common punctuation, for content that changes between renders such as
+prices, cart counts and product names), and subsets
+every font the theme hosts in its assets to those glyphs as
+`<name>.subset.woff2` with fontTools. Layout features are kept.
+
+The @font-face rules in the theme's stylesheets and Liquid templates
+then point at the subsets and declare `font-display: FONT_DISPLAY`, so
+text renders in a fallback font instead of staying invisible while the
+font loads. Each subset face declares the `unicode-range` it covers, and
+the original font stays declared as a second face with the
+complementary range. A page showing a character nobody sampled (a new
+product name, say) therefore still gets the real glyph; the browser
+only downloads the full font when such a character is on the page. Shopify-hosted fonts (`| font_face`) get the same
+`font_display:` argument. The primary face is the regular face of the
+family the body text uses. The layout preloads it so it is requested
+with the HTML instead of after the CSS.
+
+Bytes saved are reported per page. A page counts a face when a rule that
+matches the page (see critical_css) sets the face's family.
+"""
+
+import logging
+import os
+import re
+import time
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fontTools import subset
+from fontTools.ttLib import TTFont
+
+from config import FONT_BASE_TEXT, FONT_DISPLAY, THEME_DIR
+from critical_css import USED, PageIndex, SelectorMatcher, StyleRule, fetch_pages, parse_stylesheet
+from http_client import http_client
+
+# fontTools warns about every table it drops (e.g. FontForge's FFTM); the subset does not need them
+logging.getLogger('fontTools.subset').setLevel(logging.ERROR)
+
+FONT_EXTENSIONS = ('.woff2', '.woff', '.ttf', '.otf')
+SUBSET_SUFFIX = '.subset.woff2'
+TEMPLATE_DIRS = ('layout', 'sections', 'snippets')
+HIDDEN_ELEMENTS = {'script', 'style', 'noscript', 'template', 'head', 'title'}
+
+FONT_FACE = re.compile(r'@font-face\s*\{((?:\{\{.*?\}\}|[^{}])*)\}', re.IGNORECASE)
+FONT_URL = re.compile(r'url\(\s*(["\']?)(.*?)\1\s*\)')
+ASSET_URL = re.compile(r'^\{\{\s*(["\'])([^"\']+)\1\s*\|\s*asset_url\s*\}\}$')
+DESCRIPTOR = re.compile(r'(font-family|font-weight|font-style|font-display)\s*:\s*([^;]+)', re.IGNORECASE)
+FALLBACK_MARK = '/* glyphs outside the subset */'
+FONT_FACE_FILTER = re.compile(r'(\{\{\s*([^|{}]+?)\s*\|\s*font_face)((?::[^{}]*?)?)(\s*\}\})')
+FONT_DECLARATION = re.compile(r'(?:^|;)\s*(font-family|font)\s*:\s*([^;]+)', re.IGNORECASE)
+CUSTOM_PROPERTY = re.compile(r'(--[\w-]+)\s*:\s*([^;}]+)')
+VAR = re.compile(r'var\(\s*(--[\w-]+)\s*(?:,\s*([^)]*))?\)')
+PRIMARY_SELECTORS = ('body', 'html', ':root')
+
+class _TextCollector(HTMLParser):
+    """Characters a page renders as text"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chars: Set[str] = set()
+        self._hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_ELEMENTS:
+            self._hidden += 1
+        for name, value in attrs:
+            if name in ('placeholder', 'value') and value:
+                self.chars.update(value)
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_ELEMENTS and self._hidden:
+            self._hidden -= 1
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self.chars.update(data)
+
+def collect_text(pages: Iterable[str], base: str = FONT_BASE_TEXT) -> str:
+    """Every character rendered on the pages plus the base set, sorted"""
+    chars = set(base)
+    for html in pages:
+        collector = _TextCollector()
+        collector.feed(html)
+        collector.close()
+        chars |= collector.chars
+    return ''.join(sorted(c for c in chars if not c.isspace() or c == ' '))
+
+def subset_font(source: str, dest: str, text: str) -> Tuple[int, int]:
+    """Write source subset to text as WOFF2; returns (bytes before, bytes after)"""
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    font = TTFont(source)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    tmp_path = f"{dest}.tmp"
+    font.save(tmp_path)
+    font.close()
+    os.replace(tmp_path, dest)
+    return os.path.getsize(source), os.path.getsize(dest)
+
+def _codepoints(path: str) -> Set[int]:
+    font = TTFont(path, lazy=True)
+    try:
+        return set(font.getBestCmap() or ())
+    finally:
+        font.close()
+
+def _unicode_range(codepoints: Iterable[int]) -> str:
+    """unicode-range value covering exactly the given code points"""
+    spans: List[List[int]] = []
+    for codepoint in sorted(codepoints):
+        if spans and codepoint == spans[-1][1] + 1:
+            spans[-1][1] = codepoint
+        else:
+            spans.append([codepoint, codepoint])
+    return ', '.join(f"U+{a:X}" if a == b else f"U+{a:X}-{b:X}" for a, b in spans)
+
+def _family(value: str) -> str:
+    return value.split(',')[0].strip().strip('"\'').lower()
+
+def _asset_name(url: str) -> Optional[str]:
+    """Asset file name a @font-face url refers to (asset_url output or a relative path), if local"""
+    asset = ASSET_URL.match(url.strip())
+    if asset:
+        return asset.group(2)
+    if '//' in url or url.startswith(('data:', '/')):
+        return None
+    return os.path.basename(url.split('?')[0].split('#')[0])
+
+def _source_of(name: str, asset_dir: str) -> Optional[str]:
+    """The original font file for an asset name (which may already be a subset)"""
+    if name.endswith(SUBSET_SUFFIX):
+        stem = name[:-len(SUBSET_SUFFIX)]
+        for extension in FONT_EXTENSIONS:
+            if os.path.exists(os.path.join(asset_dir, stem + extension)):
+                return stem + extension
+        return None
+    return name if name.lower().endswith(FONT_EXTENSIONS) and os.path.exists(os.path.join(asset_dir, name)) else None
+
+def _subset_name(source: str) -> str:
+    return os.path.splitext(source)[0] + SUBSET_SUFFIX
+
+def _theme_files(theme_dir: str) -> List[str]:
+    """Stylesheets and Liquid templates that may hold @font-face rules"""
+    files = []
+    asset_dir = os.path.join(theme_dir, 'assets')
+    if os.path.isdir(asset_dir):
+        files += [os.path.join(asset_dir, n) for n in sorted(os.listdir(asset_dir)) if n.endswith(('.css', '.css.liquid'))]
+    for directory in TEMPLATE_DIRS:
+        root = os.path.join(theme_dir, directory)
+        if os.path.isdir(root):
+            files += [os.path.join(root, n) for n in sorted(os.listdir(root)) if n.endswith('.liquid')]
+    return files
+
+def _faces(texts: Dict[str, str], asset_dir: str) -> List[Dict[str, Any]]:
+    """Locally hosted @font-face rules: family, weight, style and source font file"""
+    faces = []
+    for text in texts.values():
+        for match in FONT_FACE.finditer(text):
+            descriptors = {k.lower(): v.strip() for k, v in DESCRIPTOR.findall(match.group(1))}
+            for url in FONT_URL.finditer(match.group(1)):
+                name = _asset_name(url.group(2))
+                source = name and _source_of(name, asset_dir)
+                if source:
+                    faces.append({
+                        'family': _family(descriptors.get('font-family', '')),
+                        'weight': descriptors.get('font-weight', '400').lower(),
+                        'style': descriptors.get('font-style', 'normal').lower(),
+                        'source': source
+                    })
+                    break
+    return faces
+
+def _with_descriptor(block: str, name: str, value: str) -> str:
+    """A @font-face block with a descriptor set, replacing any existing one"""
+    existing = re.compile(r';?\s*' + name + r'\s*:[^;{}]*', re.IGNORECASE)
+    return existing.sub('', block).rstrip().rstrip(';') + f';{name}: {value};'
+
+def _block_source(block: str, subsets: Dict[str, str]) -> Optional[str]:
+    """The subset source font a @font-face block loads, whether it points at the source or the subset"""
+    originals = {subset_name: source for source, subset_name in subsets.items()}
+    for url in FONT_URL.finditer(block):
+        name = _asset_name(url.group(2))
+        if name in subsets:
+            return name
+        if name in originals:
+            return originals[name]
+    return None
+
+def _rewrite_faces(text: str, subsets: Dict[str, str], ranges: Dict[str, Tuple[str, str]], display: str) -> str:
+    """Point @font-face rules at their subsets, each followed by a face serving the rest of the font"""
+    covered = {_block_source(m.group(1), subsets) for m in FONT_FACE.finditer(text) if FALLBACK_MARK in m.group(1)}
+
+    def rewrite(match):
+        block = match.group(1)
+        source = _block_source(block, subsets)
+        subset_range, rest = ranges.get(source, ('', ''))
+        if FALLBACK_MARK in block:
+            if source not in ranges:
+                return match.group(0)
+            return '@font-face {' + _with_descriptor(block, 'unicode-range', rest) + '}' if rest else ''
+        face = _rewrite_face(block, subsets, display)
+        if not subset_range:
+            return '@font-face {' + face + '}'
+        face = '@font-face {' + _with_descriptor(face, 'unicode-range', subset_range) + '}'
+        if rest and source not in covered and any(_asset_name(u.group(2)) == source for u in FONT_URL.finditer(block)):
+            covered.add(source)
+            fallback = _with_descriptor(_with_descriptor(block, 'font-display', display), 'unicode-range', rest)
+            face += '\n@font-face {' + FALLBACK_MARK + ' ' + fallback.lstrip() + '}'
+        return face
+
+    return FONT_FACE.sub(rewrite, text)
+
+def _rewrite_face(block: str, subsets: Dict[str, str], display: str) -> str:
+    """Point a @font-face block's local sources at their subsets and set font-display"""
+    def source(match):
+        quote, url = match.group(1), match.group(2)
+        name = _asset_name(url)
+        subset_name = subsets.get(name) or (name if name in subsets.values() else None)
+        if not subset_name:
+            return match.group(0)
+        asset = ASSET_URL.match(url.strip())
+        new_url = f"{{{{ {asset.group(1)}{subset_name}{asset.group(1)} | asset_url }}}}" if asset \
+            else url[:len(url) - len(os.path.basename(url))] + subset_name
+        return f"url({quote}{new_url}{quote})"
+
+    body = FONT_URL.sub(source, block)
+    # Subsets are WOFF2 whatever the source format was
+    body = re.sub(r'(\.subset\.woff2[^)]*\)\s*)format\(\s*["\']?(?!woff2)[\w-]+["\']?\s*\)', r"\1format('woff2')", body)
+    if re.search(r'font-display\s*:', body, re.IGNORECASE):
+        return re.sub(r'font-display\s*:\s*[\w-]+', f'font-display: {display}', body, flags=re.IGNORECASE)
+    return body.rstrip().rstrip(';') + f';font-display: {display};'
+
+def _rewrite_font_face_filter(match: re.Match, display: str) -> str:
+    head, arguments, tail = match.group(1), match.group(3), match.group(4)
+    if 'font_display' in arguments:
+        arguments = re.sub(r"font_display:\s*(['\"])[\w-]*\1", f"font_display: '{display}'", arguments)
+    elif arguments.strip():
+        arguments = f"{arguments.rstrip()}, font_display: '{display}'"
+    else:
+        arguments = f": font_display: '{display}'"
+    return f"{head}{arguments}{tail}"
+
+def _family_usage(asset_dir: str, texts: Dict[str, str], indexes: List[PageIndex],
+                  families: Set[str]) -> Tuple[List[Set[str]], Optional[str]]:
+    """Per page, the face families that matching rules set; and the family the body text uses"""
+    variables: Dict[str, str] = {}
+    for text in texts.values():
+        for name, value in CUSTOM_PROPERTY.findall(text):
+            variables.setdefault(name, value)
+
+    def resolve(value: str, depth: int = 0) -> str:
+        if depth > 5:
+            return value
+        return VAR.sub(lambda m: resolve(variables.get(m.group(1), m.group(2) or ''), depth + 1), value)
+
+    def families_in(value: str) -> Set[str]:
+        value = resolve(value).lower()
+        if '{{' in value:  # Set from theme settings in Liquid: could be any family
+            return set(families)
+        return {f for f in families if f and re.search(r'(?<![\w-])' + re.escape(f) + r'(?![\w-])', value)}
+
+    matchers = [SelectorMatcher([index]) for index in indexes]
+    pages: List[Set[str]] = [set() for _ in indexes]
+    primary = None
+    for path, text in texts.items():
+        if not path.startswith(asset_dir) or path.endswith('.pruned.css'):
+            continue
+        stack = list(parse_stylesheet(text))
+        while stack:
+            rule = stack.pop()
+            if not isinstance(rule, StyleRule):
+                stack.extend(rule.rules or ())
+                continue
+            used = set()
+            for _, value in FONT_DECLARATION.findall(rule.declarations):
+                used |= families_in(value)
+            if not used:
+                continue
+            if primary is None and len(used) == 1 and any(s in PRIMARY_SELECTORS for s in rule.selectors):
+                primary = next(iter(used))
+            for i, matcher in enumerate(matchers):
+                if any(matcher.classify(s) >= USED for s in rule.selectors):
+                    pages[i] |= used
+    return pages, primary
+
+def optimize_theme(theme_dir: str = THEME_DIR, pages: Optional[Dict[str, str]] = None,
+                   display: str = FONT_DISPLAY) -> Dict[str, Any]:
+    """Subset the snapshot's fonts to the rendered pages' glyphs, set font-display and preload the primary face"""
+    started = time.perf_counter()
+    if pages is None:
+        pages = http_client.run_sync(fetch_pages())
+    if not pages:
+        return {'status': 'error', 'error': 'No rendered pages to collect glyphs from'}
+    asset_dir = os.path.join(theme_dir, 'assets')
+    texts = {}
+    for path in _theme_files(theme_dir):
+        with open(path, encoding='utf-8') as f:
+            texts[path] = f.read()
+
+    # Subset every locally hosted face to the glyphs the pages use
+    text = collect_text(pages.values())
+    faces = _faces(texts, asset_dir)
+    fonts: Dict[str, Dict[str, int]] = {}
+    subsets: Dict[str, str] = {}
+    ranges: Dict[str, Tuple[str, str]] = {}
+    errors = {}
+    for source in dict.fromkeys(face['source'] for face in faces):
+        source_path, subset_path = os.path.join(asset_dir, source), os.path.join(asset_dir, _subset_name(source))
+        try:
+            before, after = subset_font(source_path, subset_path, text)
+            kept, available = _codepoints(subset_path), _codepoints(source_path)
+        except Exception as e:
+            errors[source] = str(e)
+            continue
+        subsets[source] = _subset_name(source)
+        ranges[source] = (_unicode_range(kept), _unicode_range(available - kept))
+        fonts[source] = {'bytes_before': before, 'bytes_after': after}
+
+    # Rewrite @font-face rules and Shopify font_face filters
+    changed = []
+    for path, original in texts.items():
+        updated = _rewrite_faces(original, subsets, ranges, display)
+        updated = FONT_FACE_FILTER.sub(lambda m: _rewrite_font_face_filter(m, display), updated)
+        if updated != original:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(updated)
+            os.replace(tmp_path, path)
+            texts[path] = updated
+            changed.append(os.path.relpath(path, theme_dir))
+
+    # Per-page savings, from the faces each page's matching rules use
+    families = {face['family'] for face in faces}
+    indexes = [PageIndex(html) for html in pages.values()]
+    usage, primary_family = _family_usage(asset_dir, texts, indexes, families)
+    per_page = {}
+    for url, used in zip(pages, usage):
+        sources = {face['source'] for face in faces if face['family'] in used and face['source'] in fonts}
+        before = sum(fonts[s]['bytes_before'] for s in sources)
+        after = sum(fonts[s]['bytes_after'] for s in sources)
+        per_page[url] = {'faces': sorted(sources), 'bytes_before': before, 'bytes_after': after,
+                         'bytes_saved': before - after}
+
+    primary = _primary_face(faces, subsets, primary_family)
+    preload = _add_preload(theme_dir, primary, texts)
+    if preload and 'layout/theme.liquid' not in changed:
+        changed.append('layout/theme.liquid')
+    return {
+        'glyphs': len(text),
+        'fonts': fonts,
+        'pages': per_page,
+        'primary': primary,
+        'preload': preload,
+        'files': changed,
+        'errors': errors,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+def _primary_face(faces: List[Dict[str, Any]], subsets: Dict[str, str], family: Optional[str]) -> Optional[str]:
+    """Subset file of the regular face of the body text's family (or of the first face)"""
+    candidates = [f for f in faces if f['source'] in subsets]
+    if family:
+        candidates = [f for f in candidates if f['family'] == family] or candidates
+    regular = [f for f in candidates if f['weight'] in ('400', 'normal') and f['style'] == 'normal']
+    chosen = (regular or candidates or [None])[0]
+    return subsets[chosen['source']] if chosen else None
+
+def _add_preload(theme_dir: str, primary: Optional[str], texts: Dict[str, str]) -> Optional[str]:
+    """Preload the primary face from the layout's <head>; returns the href added, if any"""
+    layout_path = os.path.join(theme_dir, 'layout', 'theme.liquid')
+    layout = texts.get(layout_path)
+    if layout is None:
+        return None
+    if primary:
+        href = f"{{{{ '{primary}' | asset_url }}}}"
+    else:
+        # Shopify-hosted fonts: preload the first face the layout outputs
+        shopify_font = FONT_FACE_FILTER.search(layout)
+        if not shopify_font:
+            return None
+        href = f"{{{{ {shopify_font.group(2)} | font_url }}}}"
+    if any(href in tag and 'preload' in tag for tag in re.findall(r'<link\b[^>]*>', layout)):
+        return None
+    link = f'<link rel="preload" href="{href}" as="font" type="font/woff2" crossorigin>\n'
+    at = layout.find('</head>')
+    if at < 0:
+        return None
+    # Ahead of the stylesheets, so the font request starts with theirs
+    first = re.search(r'<style|<link[^>]*stylesheet|\{\{[^}]*stylesheet_tag', layout[:at])
+    at = first.start() if first else at
+    layout = layout[:at] + link + layout[at:]
+    tmp_path = f"{layout_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(layout)
+    os.replace(tmp_path, layout_path)
+    texts[layout_path] = layout
+    return href
@@ -0,0 +1,183 @@
+"""
+Shared HTTP client for all outbound calls (PSI, Shopify, Slack).
+
+A single aiohttp session runs on a dedicated background event loop, so
+every caller in the process (async handlers, sync tools, PerfBot) reuses
+the same per-host keep-alive connection pools. Requests get a timeout
+and are retried with jittered exponential backoff on transient errors.
+"""
+
+import asyncio
+import atexit
+import json
+import random
+import threading
+import time
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from config import HTTP_KEEPALIVE, HTTP_POOL_PER_HOST, HTTP_RETRIES, HTTP_TIMEOUT
+
+# Responses worth retrying: rate limited or transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+class HttpResponse:
+    """Fully read response, safe to use outside the client's event loop"""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def text(self) -> str:
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+def _query(params):
+    """Flatten list values so repeated query keys (e.g. category) survive"""
+    if not params:
+        return None
+    items = []
+    for key, value in params.items():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            items.append((key, str(item)))
+    return items
+
+class HttpClient:
+    """Pooled keep-alive HTTP client with retries and pool utilisation metrics"""
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES,
+                 limit_per_host: int = HTTP_POOL_PER_HOST, keepalive: float = HTTP_KEEPALIVE):
+        self.timeout = timeout
+        self.retries = retries
+        self.limit_per_host = limit_per_host
+        self.keepalive = keepalive
+        self._loop = None
+        self._session = None
+        self._start_lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, float]] = {}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='http-client', daemon=True).start()
+                atexit.register(self.close)
+        return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def _host_stats(self, host: str) -> Dict[str, float]:
+        if host not in self._hosts:
+            self._hosts[host] = {'requests': 0, 'in_flight': 0, 'peak_in_flight': 0,
+                                 'retries': 0, 'errors': 0, 'total_time_s': 0.0}
+        return self._hosts[host]
+
+    async def _request(self, method, url, params=None, json=None, headers=None,
+                       timeout=None, retries=None, stream=None) -> HttpResponse:
+        session = self._get_session()
+        stats = self._host_stats(urlsplit(url).netloc)
+        retries = self.retries if retries is None else retries
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+
+        for attempt in range(retries + 1):
+            stats['requests'] += 1
+            stats['in_flight'] += 1
+            stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                async with session.request(method, url, params=_query(params), json=json,
+                                           headers=headers, timeout=request_timeout) as response:
+                    if stream is not None and response.status == 200:
+                        # Hand successful bodies to the consumer chunk by chunk
+                        stream.reset()
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            stream.feed(chunk)
+                        body = b''
+                    else:
+                        body = await response.read()
+                    result = HttpResponse(response.status, dict(response.headers), body)
+                if result.status not in RETRY_STATUSES or attempt == retries:
+                    return result
+                retry_after = result.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                stats['errors'] += 1
+                if attempt == retries:
+                    raise
+            finally:
+                stats['in_flight'] -= 1
+                stats['total_time_s'] += time.perf_counter() - start
+
+            # Full jitter backoff, honouring Retry-After when the server sends one
+            stats['retries'] += 1
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    async def request(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """Send a request from any event loop through the shared pools.
+
+        Pass stream=<object with reset()/feed(chunk)> to consume a 200 body
+        incrementally instead of buffering it.
+        """
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await self._request(method, url, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), loop)
+        return await asyncio.wrap_future(future)
+
+    def request_sync(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """Blocking variant of request() for synchronous callers"""
+        return self.run_sync(self._request(method, url, **kwargs))
+
+    def run_sync(self, coro):
+        """Run a coroutine on the client loop and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return future.result()
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host request counts and connection pool utilisation"""
+        return {
+            host: {
+                **{key: round(value, 3) for key, value in stats.items()},
+                'pool_limit': self.limit_per_host,
+                'utilisation': round(stats['in_flight'] / self.limit_per_host, 3),
+                'peak_utilisation': round(stats['peak_in_flight'] / self.limit_per_host, 3)
+            }
+            for host, stats in list(self._hosts.items())
+        }
+
+    def close(self) -> None:
+        """Close the shared session and its pooled connections"""
+        if self._loop is None or self._session is None or self._session.closed:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+        except Exception:
+            pass
+
+# Shared client instance
+http_client = HttpClient()
@@ -0,0 +1,208 @@
+"""
+Parallel image optimisation for a local snapshot of theme assets.
+
+Each JPEG/PNG is re-encoded as WebP and AVIF across a process pool (the
+encoders are CPU-bound and hold the GIL). The pipeline searches for a
+quality per image and format: a binary search over
+[IMAGE_MIN_QUALITY, IMAGE_MAX_QUALITY], in steps of 5, finds the
+highest quality whose output fits IMAGE_TARGET_KB. Outputs that are not
+smaller than the source are discarded.
+
+A manifest keyed by the SHA-256 of each source file's content (plus the
+encoder settings) records what was produced. Unchanged images, including
+images that were renamed or copied, are skipped on later runs.
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, features
+
+from config import (
+    IMAGE_FORMATS,
+    IMAGE_MAX_QUALITY,
+    IMAGE_MIN_QUALITY,
+    IMAGE_OUTPUT_DIR,
+    IMAGE_TARGET_KB,
+    IMAGE_WORKERS
+)
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+QUALITY_STEP = 5  # Quality search granularity: ~4 encodes per image and format
+ENCODER_OPTIONS = {
+    'webp': {'method': 4},
+    'avif': {'speed': 8}
+}
+
+def supported_formats(formats: Sequence[str] = IMAGE_FORMATS) -> List[str]:
+    """The requested output formats this Pillow build can encode"""
+    supported = []
+    for fmt in formats:
+        try:
+            if features.check(fmt):
+                supported.append(fmt)
+        except ValueError:  # Feature unknown to this Pillow version
+            pass
+    return supported
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt.upper(), quality=quality, **ENCODER_OPTIONS.get(fmt, {}))
+    return buffer.getvalue()
+
+def search_quality(image: Image.Image, fmt: str, target_bytes: int,
+                   min_quality: int = IMAGE_MIN_QUALITY, max_quality: int = IMAGE_MAX_QUALITY) -> Tuple[int, bytes]:
+    """Highest quality (in QUALITY_STEP steps) whose encoding fits target_bytes, else min_quality"""
+    qualities = list(range(min_quality, max_quality + 1, QUALITY_STEP))
+    best = None
+    lo, hi = 0, len(qualities) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = _encode(image, fmt, qualities[mid])
+        if len(data) <= target_bytes:
+            best = (qualities[mid], data)
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best or (min_quality, _encode(image, fmt, min_quality))
+
+def _convert(source: str, outputs: Dict[str, str], target_bytes: int,
+             min_quality: int, max_quality: int) -> Dict[str, Any]:
+    """Worker: encode one source image into every format (runs in a pool process)"""
+    original = os.path.getsize(source)
+    with Image.open(source) as image:
+        if getattr(image, 'n_frames', 1) > 1:
+            return {'skipped': 'animated'}
+        image.load()
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    results = {}
+    for fmt, path in outputs.items():
+        quality, data = search_quality(image, fmt, min(target_bytes, original), min_quality, max_quality)
+        if len(data) >= original:
+            results[fmt] = {'bytes': len(data), 'quality': quality, 'path': None}  # No gain: keep the source
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        results[fmt] = {'bytes': len(data), 'quality': quality, 'path': path}
+    return {'original_bytes': original, 'width': image.width, 'height': image.height, 'outputs': results}
+
+class ImagePipeline:
+    """Converts a directory of images, skipping content it has already processed"""
+
+    def __init__(self, output_dir: str = IMAGE_OUTPUT_DIR, formats: Sequence[str] = IMAGE_FORMATS,
+                 target_kb: float = IMAGE_TARGET_KB, min_quality: int = IMAGE_MIN_QUALITY,
+                 max_quality: int = IMAGE_MAX_QUALITY, workers: Optional[int] = IMAGE_WORKERS):
+        self.output_dir = output_dir
+        self.formats = supported_formats(formats)
+        self.target_bytes = int(target_kb * 1024)
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.workers = workers or os.cpu_count() or 1
+        self.manifest_path = os.path.join(output_dir, 'manifest.json')
+        # Part of every cache key: changing the settings re-encodes everything
+        self.settings = hashlib.sha256(json.dumps(
+            [self.formats, self.target_bytes, min_quality, max_quality, ENCODER_OPTIONS, Image.__version__]
+        ).encode()).hexdigest()[:16]
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _outputs(self, digest: str) -> Dict[str, str]:
+        # Content-addressed, so identical images share outputs
+        return {fmt: os.path.join(self.output_dir, digest[:2], f"{digest}.{fmt}") for fmt in self.formats}
+
+    def run(self, source_dir: str) -> Dict[str, Any]:
+        """Convert every image under source_dir; returns the run report"""
+        started = time.perf_counter()
+        manifest = self._load_manifest()
+        sources = sorted(
+            os.path.join(dirpath, name)
+            for dirpath, _, names in os.walk(source_dir) for name in names
+            if name.lower().endswith(SOURCE_EXTENSIONS))
+
+        report = {'images': len(sources), 'processed': 0, 'cached': 0, 'skipped': 0, 'failed': 0,
+                  'bytes_in': 0, 'bytes_out': 0, 'formats': {fmt: 0 for fmt in self.formats}, 'files': {}, 'errors': {}}
+        pending = {}
+        for source in sources:
+            digest = content_hash(source)
+            key = f"{digest}:{self.settings}"
+            entry = manifest.get(key)
+            if entry and 'skipped' in entry:
+                report['skipped'] += 1  # Known not to need converting (e.g. animated)
+            elif entry and all(o['path'] is None or os.path.exists(o['path']) for o in entry['outputs'].values()):
+                report['cached'] += 1
+                self._account(report, source, entry)
+            else:
+                pending.setdefault(key, []).append(source)
+
+        if pending and self.formats:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                futures = {
+                    pool.submit(_convert, sources_[0], self._outputs(key.split(':')[0]), self.target_bytes,
+                                self.min_quality, self.max_quality): (key, sources_)
+                    for key, sources_ in pending.items()
+                }
+                for future in as_completed(futures):
+                    key, sources_ = futures[future]
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        report['failed'] += len(sources_)
+                        report['errors'].update({source: str(e) for source in sources_})
+                        continue
+                    manifest[key] = entry  # Skipped content too, so it is not decoded again next run
+                    if 'skipped' in entry:
+                        report['skipped'] += len(sources_)
+                        continue
+                    report['processed'] += len(sources_)
+                    for source in sources_:
+                        self._account(report, source, entry)
+            self._save_manifest(manifest)
+
+        elapsed = time.perf_counter() - started
+        report['bytes_saved'] = report['bytes_in'] - report['bytes_out']
+        report['seconds'] = round(elapsed, 3)
+        report['images_per_second'] = round(report['images'] / elapsed, 1) if elapsed else None
+        return report
+
+    def _account(self, report: Dict[str, Any], source: str, entry: Dict[str, Any]):
+        """Add an image's best output to the totals"""
+        written = {fmt: o for fmt, o in entry['outputs'].items() if o['path']}
+        best_fmt = min(written, key=lambda fmt: written[fmt]['bytes']) if written else None
+        report['bytes_in'] += entry['original_bytes']
+        report['bytes_out'] += written[best_fmt]['bytes'] if best_fmt else entry['original_bytes']
+        if best_fmt:
+            report['formats'][best_fmt] += 1
+        report['files'][source] = {fmt: o['path'] for fmt, o in written.items()}
+
+def optimize_images(source_dir: str, **settings) -> Dict[str, Any]:
+    """Convert the images under source_dir with the configured (or overridden) settings"""
+    return ImagePipeline(**settings).run(source_dir)
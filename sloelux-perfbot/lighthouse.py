@@ -0,0 +1,207 @@
+"""
+Streaming, selective extraction of Lighthouse audits from PSI responses.
+
+A PageSpeed Insights response is several megabytes of JSON, most of it
+screenshots, network tables and audits the bot never reads. Instead of
+parsing the whole document, AuditExtractor scans the byte stream as it
+arrives. It decodes only the audit objects we use (plus the performance
+category score and the field INP category) and drops everything else,
+so memory stays bounded by the largest wanted audit rather than the
+whole report.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Audits the bot reads: core metrics plus the opportunities it can fix
+WANTED_AUDITS = (
+    'largest-contentful-paint',
+    'total-blocking-time',
+    'interaction-to-next-paint',
+    'cumulative-layout-shift',
+    'first-contentful-paint',
+    'speed-index',
+    'font-display',
+    'modern-image-formats',
+    'uses-optimized-images',
+    'uses-responsive-images',
+    'offscreen-images',
+    'render-blocking-resources',
+    'unused-css-rules',
+    'unused-javascript',
+    'unminified-css',
+    'unminified-javascript',
+    'uses-text-compression'
+)
+
+_decoder = json.JSONDecoder()
+
+@dataclass(frozen=True)
+class Audit:
+    """The parts of a Lighthouse audit the bot uses"""
+    id: str
+    title: str = ''
+    score: Optional[float] = None
+    numeric_value: Optional[float] = None
+    display_value: str = ''
+    is_opportunity: bool = False
+    savings_ms: float = 0.0
+    # (resource url, wasted ms, wasted bytes) from the audit's details table
+    items: Tuple[Tuple[str, float, float], ...] = ()
+
+    @classmethod
+    def from_json(cls, audit: Dict[str, Any]) -> 'Audit':
+        details = audit.get('details') or {}
+        items = tuple(
+            (item.get('url', ''), float(item.get('wastedMs') or 0), float(item.get('wastedBytes') or 0))
+            for item in details.get('items') or ()
+            if isinstance(item, dict) and 'url' in item
+        )
+        return cls(
+            id=audit['id'],
+            title=audit.get('title', ''),
+            score=audit.get('score'),
+            numeric_value=audit.get('numericValue'),
+            display_value=audit.get('displayValue', ''),
+            is_opportunity=details.get('type') == 'opportunity',
+            savings_ms=float(details.get('overallSavingsMs') or 0),
+            items=items
+        )
+
+@dataclass(frozen=True)
+class LighthouseReport:
+    """Compact record of one PSI run"""
+    url: str
+    performance_score: Optional[float] = None
+    field_inp_category: Optional[str] = None
+    audits: Dict[str, Audit] = field(default_factory=dict)
+    field_inp_ms: Optional[float] = None  # p75 field INP for the URL
+
+    def score(self, audit_id: str, default: float = 1) -> float:
+        """Audit score, treating missing or unscored audits as passing"""
+        audit = self.audits.get(audit_id)
+        return default if audit is None or audit.score is None else audit.score
+
+    def numeric(self, audit_id: str, default: float = 0) -> float:
+        audit = self.audits.get(audit_id)
+        return default if audit is None or audit.numeric_value is None else audit.numeric_value
+
+    def opportunities(self):
+        """Failing opportunity audits, largest estimated savings first"""
+        return sorted((a for a in self.audits.values() if a.is_opportunity and (a.score or 0) < 1),
+                      key=lambda a: a.savings_ms, reverse=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LighthouseReport':
+        audits = {
+            audit_id: Audit(**{**audit, 'items': tuple(tuple(item) for item in audit.get('items', ()))})
+            for audit_id, audit in data.get('audits', {}).items()
+        }
+        return cls(data['url'], data.get('performance_score'), data.get('field_inp_category'), audits,
+                   data.get('field_inp_ms'))
+
+class AuditExtractor:
+    """Incremental scanner: feed() raw response chunks, then finish()"""
+
+    # Only attempt to decode a pending object again once its buffer has grown this much
+    RETRY_GROWTH = 64 * 1024
+
+    def __init__(self, url: str, audit_ids: Iterable[str] = WANTED_AUDITS):
+        self.url = url
+        self.audit_ids = set(audit_ids)
+        keys = sorted(self.audit_ids | {'performance', 'INTERACTION_TO_NEXT_PAINT'}, key=len, reverse=True)
+        self._pattern = re.compile(rb'"(' + b'|'.join(re.escape(k.encode()) for k in keys) + rb')"\s*:\s*\{')
+        self._max_key = max(len(k) for k in keys) + 8
+        self.reset()
+
+    def reset(self):
+        """Discard partial state (e.g. before a retried request)"""
+        self._buffer = bytearray()
+        self._pending = None  # (key, start) of an object that spans chunks
+        self._attempted_at = 0
+        self._audits: Dict[str, Audit] = {}
+        self._performance_score = None
+        self._inp_category = None
+        self._inp_ms = None
+
+    def feed(self, chunk: bytes):
+        self._buffer += chunk
+        self._scan(final=False)
+
+    def finish(self) -> LighthouseReport:
+        self._scan(final=True)
+        self._buffer = bytearray()
+        return LighthouseReport(self.url, self._performance_score, self._inp_category, dict(self._audits),
+                                self._inp_ms)
+
+    def _scan(self, final: bool):
+        position = 0
+        if self._pending:
+            if not final and len(self._buffer) - self._attempted_at < self.RETRY_GROWTH:
+                return
+            key, start = self._pending
+            end = self._decode(key, start, final)
+            if end is None:
+                return
+            self._pending = None
+            position = end
+
+        while True:
+            match = self._pattern.search(self._buffer, position)
+            if not match:
+                break
+            key, start = match.group(1).decode(), match.end() - 1
+            end = self._decode(key, start, final)
+            if end is None:
+                # Object continues in a later chunk: keep it and wait
+                del self._buffer[:start]
+                self._pending = (key, 0)
+                self._attempted_at = len(self._buffer)
+                return
+            position = end
+
+        # Nothing pending: keep only a tail long enough to complete a split key
+        del self._buffer[:max(position, len(self._buffer) - self._max_key)]
+
+    def _decode(self, key: str, start: int, final: bool) -> Optional[int]:
+        """Decode the object at start; return the byte offset after it, or None if incomplete"""
+        # Decode through a widening window so small audits never decode the rest of the buffer
+        window = 16 * 1024
+        while True:
+            text = self._buffer[start:start + window].decode('utf-8', 'ignore')
+            try:
+                value, end = _decoder.raw_decode(text)
+                break
+            except json.JSONDecodeError:
+                if start + window < len(self._buffer):
+                    window *= 4
+                elif final:
+                    return len(self._buffer)  # Truncated or malformed: skip the rest
+                else:
+                    return None
+
+        self._collect(key, value)
+        return start + len(text[:end].encode('utf-8'))
+
+    def _collect(self, key: str, value: Any):
+        if not isinstance(value, dict):
+            return
+        if key in self.audit_ids and value.get('id') == key and key not in self._audits:
+            self._audits[key] = Audit.from_json(value)
+        elif key == 'performance' and value.get('id') == 'performance' and self._performance_score is None:
+            self._performance_score = value.get('score')
+        elif key == 'INTERACTION_TO_NEXT_PAINT' and self._inp_category is None:
+            # loadingExperience (URL-level field data) precedes the origin-level block
+            self._inp_category = value.get('category')
+            self._inp_ms = value.get('percentile')
+
+def extract_report(url: str, payload: bytes, audit_ids: Iterable[str] = WANTED_AUDITS) -> LighthouseReport:
+    """Extract a compact report from a complete PSI response body"""
+    extractor = AuditExtractor(url, audit_ids)
+    extractor.feed(payload)
+    return extractor.finish()
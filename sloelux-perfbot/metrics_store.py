@@ -0,0 +1,581 @@
+"""
+Segmented, append-only store for performance metrics.
+
+Records are JSON lines in numbered segment files. Each segment has a
+sidecar index of fixed-width entries (offset, length, URL hash,
+timestamp, previous position for the same URL), so:
+
+- tail reads seek backwards from the end of the newest index,
+- per-URL lookups start from an in-memory head map and follow the
+  per-URL back-pointers instead of scanning the log,
+- segments are sealed once they reach a size threshold; the head map is
+  checkpointed at each seal so opening the store only replays the
+  active segment,
+- sealed segments are compacted: URLs and opportunity objects (the same
+  few repeat on every line) are interned into a per-segment dictionary,
+  and the encoded lines are zlib-compressed in blocks of a fixed number
+  of records, so a record is found from its ordinal alone
+  (block = ordinal // block size). Reads rebuild the original record.
+
+The index timestamp is the record's own ISO `timestamp` (append time
+for records without one), so time-range reads and the archive agree
+with what the record says. Records are stamped just before they are
+appended, so index timestamps follow append order to within
+TIMESTAMP_SKEW seconds; the legacy import is sorted by time first.
+
+Appends from different processes are serialised with an advisory lock,
+and readers pick up other processes' appends incrementally.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialised within a process
+    fcntl = None
+
+from config import METRICS_COMPACT_BLOCK, METRICS_LEGACY_LOG, METRICS_SEGMENT_BYTES, METRICS_STORE_DIR
+
+# offset, length, url hash, timestamp, previous position for the same URL
+INDEX_ENTRY = struct.Struct('<QIQdq')
+HEAD_ENTRY = struct.Struct('<Qq')
+# offset, length of a compressed block
+BLOCK_ENTRY = struct.Struct('<QI')
+NO_POSITION = -1
+BLOCK_CACHE_SIZE = 16  # Decompressed blocks kept for sequential and per-URL reads
+TIMESTAMP_SKEW = 300   # Seconds a record's timestamp may trail that of a record appended before it
+
+def url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), 'little')
+
+def record_time(record: Dict[str, Any], fallback: float) -> float:
+    """Epoch seconds of the record's ISO timestamp, or fallback if it has none"""
+    try:
+        return datetime.fromisoformat(record['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return fallback
+
+def make_position(segment: int, ordinal: int) -> int:
+    """Global record position: segment number in the high bits, ordinal in the low bits"""
+    return (segment << 32) | ordinal
+
+def split_position(position: int) -> Tuple[int, int]:
+    return position >> 32, position & 0xFFFFFFFF
+
+class _Interner:
+    """Per-segment dictionary of URLs and opportunity objects"""
+
+    def __init__(self):
+        self.urls: List[str] = []
+        self.opportunities: List[Any] = []
+        self._ids: Dict[Tuple[str, str], int] = {}
+
+    def _id(self, kind: str, key: str, value, values: List) -> int:
+        ident = self._ids.get((kind, key))
+        if ident is None:
+            ident = self._ids[(kind, key)] = len(values)
+            values.append(value)
+        return ident
+
+    def encode(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        # Replacements are tagged objects, which neither field holds in a raw record
+        encoded = dict(record)
+        if isinstance(record.get('url'), str):
+            encoded['url'] = {'@u': self._id('u', record['url'], record['url'], self.urls)}
+        if isinstance(record.get('opportunities'), list):
+            encoded['opportunities'] = {'@o': [
+                self._id('o', json.dumps(o, sort_keys=True), o, self.opportunities) for o in record['opportunities']]}
+        return encoded
+
+def _decode(record: Dict[str, Any], dictionary: Dict[str, List]) -> Dict[str, Any]:
+    url, opportunities = record.get('url'), record.get('opportunities')
+    if isinstance(url, dict):
+        record['url'] = dictionary['urls'][url['@u']]
+    if isinstance(opportunities, dict):
+        record['opportunities'] = [dictionary['opportunities'][i] for i in opportunities['@o']]
+    return record
+
+class MetricsStore:
+    """Append-only metrics log with O(1) tail and per-URL latest reads"""
+
+    def __init__(self, root: str = METRICS_STORE_DIR, segment_bytes: int = METRICS_SEGMENT_BYTES,
+                 legacy_log: Optional[str] = METRICS_LEGACY_LOG):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.legacy_log = legacy_log
+        self._lock = threading.RLock()
+        self._opened = False
+        self._segments: List[int] = []
+        self._counts: Dict[int, int] = {}  # Index entries seen per segment
+        self._heads: Dict[int, int] = {}   # URL hash -> newest position
+        self._complete = set()             # Sealed segments fully replayed
+        self._compacted = set()            # Segments stored as compressed blocks
+        self._dictionaries: Dict[int, Dict[str, List]] = {}
+        self._blocks: OrderedDict = OrderedDict()  # (segment, block) -> encoded lines
+        self._fds: Dict[str, int] = {}
+        self._fd_readers: Dict[int, int] = {}  # fd -> reads in progress
+        self._retired: Set[int] = set()        # fds dropped from the cache, closed when their last read ends
+
+    # -- Files -------------------------------------------------------------
+
+    def _path(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.root, f"{segment:08d}.{suffix}")
+
+    def _fd(self, path: str) -> int:
+        with self._lock:
+            fd = self._fds.get(path)
+            if fd is None:
+                fd = self._fds[path] = os.open(path, os.O_RDONLY)
+            return fd
+
+    @contextmanager
+    def _reading(self, path: str):
+        """A cached fd for reads outside the lock; it is not closed (or reused) until the read ends"""
+        with self._lock:
+            fd = self._fd(path)
+            self._fd_readers[fd] = self._fd_readers.get(fd, 0) + 1
+        try:
+            yield fd
+        finally:
+            with self._lock:
+                self._fd_readers[fd] -= 1
+                if not self._fd_readers[fd]:
+                    del self._fd_readers[fd]
+                    if fd in self._retired:
+                        self._retired.discard(fd)
+                        os.close(fd)
+
+    def _retire_fd(self, path: str):
+        """Drop a path's cached fd, closing it once no read is using it"""
+        with self._lock:
+            fd = self._fds.pop(path, None)
+            if fd is None:
+                return
+            if self._fd_readers.get(fd):
+                self._retired.add(fd)
+            else:
+                os.close(fd)
+
+    def _file_lock(self):
+        """Exclusive cross-process lock for appends"""
+        fd = os.open(os.path.join(self.root, 'store.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    # -- Opening and catching up -------------------------------------------
+
+    def _open(self):
+        if self._opened:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._opened = True
+
+        if self.legacy_log and os.path.exists(self.legacy_log):
+            lock_fd = self._file_lock()
+            try:
+                if not self._list_segments():
+                    self._import_legacy()
+            finally:
+                os.close(lock_fd)
+
+        # Resume from the newest head checkpoint, then replay the rest
+        self._segments = self._list_segments()
+        self._compacted = {s for s in self._segments if os.path.exists(self._path(s, 'blocks'))}
+        checkpoint = next((s for s in reversed(self._segments) if os.path.exists(self._path(s, 'heads'))), None)
+        if checkpoint is not None:
+            with open(self._path(checkpoint, 'heads'), 'rb') as f:
+                self._heads = {h: p for h, p in HEAD_ENTRY.iter_unpack(f.read())}
+            for segment in self._segments:
+                if segment <= checkpoint:
+                    self._counts[segment] = self._entry_count(segment)
+                    self._complete.add(segment)
+        self._refresh()
+
+    def _list_segments(self) -> List[int]:
+        return sorted(int(name[:-4]) for name in os.listdir(self.root) if name.endswith('.idx'))
+
+    def _entry_count(self, segment: int) -> int:
+        try:
+            return os.path.getsize(self._path(segment, 'idx')) // INDEX_ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self):
+        """Pick up segments and index entries appended since the last look"""
+        if not self._segments:
+            self._segments = self._list_segments()
+        else:
+            while os.path.exists(self._path(self._segments[-1] + 1, 'idx')):
+                self._segments.append(self._segments[-1] + 1)
+
+        for segment in self._segments:
+            if segment in self._complete:
+                continue
+            known = self._counts.get(segment, 0)
+            count = self._entry_count(segment)
+            if count > known:
+                raw = os.pread(self._fd(self._path(segment, 'idx')),
+                               (count - known) * INDEX_ENTRY.size, known * INDEX_ENTRY.size)
+                for ordinal, (_, _, hashed, _, _) in enumerate(INDEX_ENTRY.iter_unpack(raw), start=known):
+                    self._heads[hashed] = make_position(segment, ordinal)
+                self._counts[segment] = count
+            if segment != self._segments[-1]:
+                self._complete.add(segment)  # Sealed: nothing more will be appended
+
+    def _import_legacy(self):
+        """Seed an empty store from the old single-file performance log, oldest record first"""
+        modified = os.path.getmtime(self.legacy_log)  # For records without a timestamp
+        with open(self.legacy_log) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        records.sort(key=lambda record: record_time(record, modified))
+        self._append_locked(records, modified)
+
+    # -- Writes ------------------------------------------------------------
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Append one record and return its position"""
+        return self.append_many([record])[-1]
+
+    def append_many(self, records: List[Dict[str, Any]], timestamp: Optional[float] = None) -> List[int]:
+        """Append records under a single lock acquisition and return their positions.
+
+        Records without a timestamp of their own are indexed at `timestamp`
+        (default: the time of the append).
+        """
+        with self._lock:
+            self._open()
+            lock_fd = self._file_lock()
+            try:
+                self._refresh()
+                return self._append_locked(records, timestamp)
+            finally:
+                os.close(lock_fd)
+
+    def _append_locked(self, records, timestamp):
+        positions = []
+        segment = self._segments[-1] if self._segments else 1
+        data_fd, index_fd = self._open_for_append(segment)
+        offset = os.fstat(data_fd).st_size
+        ordinal = self._counts.get(segment, 0)
+        data, index = [], []
+
+        for record in records:
+            if offset >= self.segment_bytes and ordinal:
+                self._flush(data_fd, index_fd, data, index, segment, ordinal)
+                data, index = [], []
+                self._seal(segment)
+                segment += 1
+                data_fd, index_fd = self._open_for_append(segment)
+                offset, ordinal = 0, 0
+
+            line = (json.dumps(record) + '\n').encode()
+            hashed = url_hash(record.get('url', ''))
+            index.append(INDEX_ENTRY.pack(offset, len(line), hashed, record_time(record, timestamp or time.time()),
+                                          self._heads.get(hashed, NO_POSITION)))
+            data.append(line)
+            self._heads[hashed] = make_position(segment, ordinal)
+            positions.append(make_position(segment, ordinal))
+            offset += len(line)
+            ordinal += 1
+
+        self._flush(data_fd, index_fd, data, index, segment, ordinal)
+        return positions
+
+    def _open_for_append(self, segment: int) -> Tuple[int, int]:
+        if segment not in self._segments:
+            self._segments.append(segment)
+            self._counts[segment] = 0
+        data_fd = os.open(self._path(segment, 'jsonl'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        index_fd = os.open(self._path(segment, 'idx'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return data_fd, index_fd
+
+    def _flush(self, data_fd, index_fd, data, index, segment, ordinal):
+        # Data before index: an index entry never points at unwritten bytes
+        try:
+            os.write(data_fd, b''.join(data))
+            os.write(index_fd, b''.join(index))
+            self._counts[segment] = ordinal
+        finally:
+            os.close(data_fd)
+            os.close(index_fd)
+
+    def _seal(self, segment: int):
+        """Checkpoint the head map at the end of a full segment"""
+        self._complete.add(segment)
+        tmp_path = self._path(segment, 'heads.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(HEAD_ENTRY.pack(h, p) for h, p in self._heads.items()))
+        os.replace(tmp_path, self._path(segment, 'heads'))
+
+    # -- Reads -------------------------------------------------------------
+
+    def _entry(self, position: int) -> Tuple[int, int, int, float, int]:
+        segment, ordinal = split_position(position)
+        fd = self._fd(self._path(segment, 'idx'))
+        return INDEX_ENTRY.unpack(os.pread(fd, INDEX_ENTRY.size, ordinal * INDEX_ENTRY.size))
+
+    def _record(self, position: int, entry) -> Dict[str, Any]:
+        segment, ordinal = split_position(position)
+        if segment not in self._compacted:
+            try:
+                with self._reading(self._path(segment, 'jsonl')) as fd:
+                    return json.loads(os.pread(fd, entry[1], entry[0]))
+            except FileNotFoundError:
+                self._compacted.add(segment)  # Compacted since we opened the store
+        return self._compacted_record(segment, ordinal)
+
+    def _dictionary(self, segment: int) -> Dict[str, List]:
+        with self._lock:
+            dictionary = self._dictionaries.get(segment)
+            if dictionary is None:
+                with open(self._path(segment, 'dict')) as f:
+                    dictionary = self._dictionaries[segment] = json.load(f)
+            return dictionary
+
+    def _block(self, segment: int, block: int) -> List[bytes]:
+        key = (segment, block)
+        with self._lock:
+            lines = self._blocks.get(key)
+            if lines is not None:
+                self._blocks.move_to_end(key)
+                return lines
+        offset, length = BLOCK_ENTRY.unpack(
+            os.pread(self._fd(self._path(segment, 'bidx')), BLOCK_ENTRY.size, block * BLOCK_ENTRY.size))
+        lines = zlib.decompress(os.pread(self._fd(self._path(segment, 'blocks')), length, offset)).split(b'\n')
+        with self._lock:
+            self._blocks[key] = lines
+            while len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return lines
+
+    def _compacted_record(self, segment: int, ordinal: int) -> Dict[str, Any]:
+        dictionary = self._dictionary(segment)
+        block_size = dictionary['block_records']
+        line = self._block(segment, ordinal // block_size)[ordinal % block_size]
+        return _decode(json.loads(line), dictionary)
+
+    def read(self, position: int) -> Dict[str, Any]:
+        """Read the record at a position"""
+        with self._lock:
+            self._open()
+            return self._record(position, self._entry(position))
+
+    def entries(self, before: Optional[int] = None) -> Iterator[Tuple[int, Tuple]]:
+        """Index entries from newest to oldest, optionally starting below a position"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            segments = list(self._segments)
+            counts = dict(self._counts)
+
+        for segment in reversed(segments):
+            end = counts.get(segment, 0)
+            if before is not None:
+                before_segment, before_ordinal = split_position(before)
+                if segment > before_segment:
+                    continue
+                if segment == before_segment:
+                    end = min(end, before_ordinal)
+            fd = self._fd(self._path(segment, 'idx'))
+            # Read the index backwards in blocks
+            while end > 0:
+                start = max(0, end - 1024)
+                raw = os.pread(fd, (end - start) * INDEX_ENTRY.size, start * INDEX_ENTRY.size)
+                block = list(INDEX_ENTRY.iter_unpack(raw))
+                for ordinal in range(end - 1, start - 1, -1):
+                    yield make_position(segment, ordinal), block[ordinal - start]
+                end = start
+
+    def tail(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """The newest `limit` records, oldest first"""
+        records = []
+        for position, entry in self.entries():
+            if len(records) >= limit:
+                break
+            records.append(self._record(position, entry))
+        return records[::-1]
+
+    def last(self) -> Optional[Dict[str, Any]]:
+        """The most recently appended record"""
+        records = self.tail(1)
+        return records[0] if records else None
+
+    def history(self, url: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """The newest `limit` records for a URL, newest first"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            position = self._heads.get(url_hash(url), NO_POSITION)
+            records = []
+            while position != NO_POSITION and len(records) < limit:
+                entry = self._entry(position)
+                record = self._record(position, entry)
+                if record.get('url') == url:  # Skip (vanishingly rare) hash collisions
+                    records.append(record)
+                position = entry[4]
+            return records
+
+    def _url_entries(self, url: str, before: Optional[int] = None) -> Iterator[Tuple[int, Tuple]]:
+        """Index entries of one URL from newest to oldest, following the per-URL back-pointers"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            position = self._heads.get(url_hash(url), NO_POSITION) if before is None else self._entry(before)[4]
+        while position != NO_POSITION:
+            entry = self._entry(position)
+            yield position, entry
+            position = entry[4]
+
+    def select(self, url: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+               before: Optional[int] = None, limit: int = 10) -> Tuple[List[int], bool]:
+        """Positions of the newest `limit` records matching url and [since, until), older than `before`.
+
+        Only index entries are read, so the caller can decide (e.g. from an
+        ETag) whether the records themselves are needed. Returns the
+        positions, newest first, and whether more records follow. Index
+        timestamps follow append order to within TIMESTAMP_SKEW, so the walk
+        stops at the first entry that far before since.
+        """
+        positions = []
+        walk = self.entries(before) if url is None else self._url_entries(url, before)
+        for position, entry in walk:
+            timestamp = entry[3]
+            if until is not None and timestamp >= until:
+                continue
+            if since is not None and timestamp < since:
+                if timestamp < since - TIMESTAMP_SKEW:
+                    break
+                continue
+            if len(positions) == limit:
+                return positions, True
+            positions.append(position)
+        return positions, False
+
+    def latest(self, url: str) -> Optional[Dict[str, Any]]:
+        """The most recent record for a URL"""
+        records = self.history(url, 1)
+        return records[0] if records else None
+
+    def sealed_segments(self) -> List[int]:
+        """Segments that will receive no more appends"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            return self._segments[:-1]
+
+    def segment_records(self, segment: int) -> Iterator[Tuple[int, Tuple, Dict[str, Any]]]:
+        """(ordinal, index entry, record) for every record in a segment, oldest first"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            count = self._counts.get(segment, 0)
+        raw = os.pread(self._fd(self._path(segment, 'idx')), count * INDEX_ENTRY.size, 0)
+        if segment not in self._compacted:
+            try:
+                with open(self._path(segment, 'jsonl'), 'rb') as f:
+                    for ordinal, entry in enumerate(INDEX_ENTRY.iter_unpack(raw)):
+                        f.seek(entry[0])
+                        yield ordinal, entry, json.loads(f.read(entry[1]))
+                return
+            except FileNotFoundError:
+                self._compacted.add(segment)
+        # Sequential: decompress each block once, without going through the block cache
+        dictionary = self._dictionary(segment)
+        entries = list(INDEX_ENTRY.iter_unpack(raw))
+        with open(self._path(segment, 'bidx'), 'rb') as f:
+            blocks = list(BLOCK_ENTRY.iter_unpack(f.read()))
+        ordinal = 0
+        with open(self._path(segment, 'blocks'), 'rb') as f:
+            for offset, length in blocks:
+                f.seek(offset)
+                for line in zlib.decompress(f.read(length)).split(b'\n'):
+                    if ordinal < len(entries):
+                        yield ordinal, entries[ordinal], _decode(json.loads(line), dictionary)
+                    ordinal += 1
+
+    # -- Compaction --------------------------------------------------------
+
+    def compact_sealed(self, block_records: int = METRICS_COMPACT_BLOCK) -> List[int]:
+        """Dictionary-encode and compress every sealed, not yet compacted segment; returns those compacted"""
+        pending = [s for s in self.sealed_segments() if not os.path.exists(self._path(s, 'blocks'))]
+        if not pending:
+            return []
+        compacted = []
+        lock_fd = os.open(os.path.join(self.root, 'compact.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            for segment in pending:
+                if not os.path.exists(self._path(segment, 'blocks')):  # Not done by another process meanwhile
+                    self._compact_segment(segment, block_records)
+                    compacted.append(segment)
+        finally:
+            os.close(lock_fd)
+        return compacted
+
+    def _compact_segment(self, segment: int, block_records: int):
+        interner = _Interner()
+        blocks, lines = [], []
+        for _, _, record in self.segment_records(segment):
+            lines.append(json.dumps(interner.encode(record)).encode())
+            if len(lines) == block_records:
+                blocks.append(zlib.compress(b'\n'.join(lines), 6))
+                lines = []
+        if lines:
+            blocks.append(zlib.compress(b'\n'.join(lines), 6))
+
+        dictionary = {'block_records': block_records, 'urls': interner.urls, 'opportunities': interner.opportunities}
+        index, offset = [], 0
+        for block in blocks:
+            index.append(BLOCK_ENTRY.pack(offset, len(block)))
+            offset += len(block)
+
+        # Dictionary and block index before the blocks: a .blocks file is only ever read complete
+        for suffix, data in (('dict', json.dumps(dictionary).encode()), ('bidx', b''.join(index)),
+                             ('blocks', b''.join(blocks))):
+            tmp_path = self._path(segment, f'{suffix}.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(segment, suffix))
+
+        with self._lock:
+            self._compacted.add(segment)
+            self._retire_fd(self._path(segment, 'jsonl'))
+        os.remove(self._path(segment, 'jsonl'))
+
+    def head(self) -> int:
+        """Position of the newest record, or -1 for an empty store"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            for segment in reversed(self._segments):
+                if self._counts.get(segment):
+                    return make_position(segment, self._counts[segment] - 1)
+            return NO_POSITION
+
+    def count(self) -> int:
+        """Total number of records"""
+        with self._lock:
+            self._open()
+            self._refresh()
+            return sum(self._counts.values())
+
+# Shared store instance
+metrics_store = MetricsStore()
+
+if __name__ == "__main__":
+    compacted = metrics_store.compact_sealed()
+    print(f"Compacted segments: {compacted or 'none'}; {metrics_store.count()} records")
@@ -36,4 +36,4 @@ def track_error(error, context=None):
     """Track an error in Sentry with additional context"""
     if context:
         sentry_sdk.set_context("error_context", context)
-    sentry_sdk.capture_exception(error) 
\ No newline at end of file
+    sentry_sdk.capture_exception(error)
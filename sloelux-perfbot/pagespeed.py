@@ -0,0 +1,50 @@
+"""
+PageSpeed Insights client shared by the tools, the audit pipeline and PerfBot.
+
+A request for (url, strategy) goes through, in order: the response
+cache, single-flight de-duplication (so the API, the monitoring loop and
+the MCP server never run the same audit twice at once), the shared PSI
+rate limit, and streamed extraction of the audits we use.
+"""
+
+import os
+from typing import Any, Dict
+
+from config import PSI_API_URL
+from http_client import http_client
+from lighthouse import AuditExtractor, LighthouseReport
+from psi_cache import pagespeed_cache
+from rate_limiter import get_bucket
+from singleflight import SingleFlight
+
+CATEGORIES = ['performance']
+
+# Shared de-duplication of in-flight PSI runs
+pagespeed_flight = SingleFlight()
+
+async def _run_audit(url: str, strategy: str) -> Dict[str, Any]:
+    params = {'url': url, 'strategy': strategy, 'category': CATEGORIES}
+    if os.getenv('PSI_KEY'):
+        params['key'] = os.getenv('PSI_KEY')
+    await get_bucket('psi').acquire()
+
+    # Extract only the audits we use while the multi-megabyte body streams in
+    extractor = AuditExtractor(url)
+    response = await http_client.request('GET', PSI_API_URL, params=params, stream=extractor)
+    if not response.ok:
+        raise RuntimeError(f"PageSpeed Insights returned HTTP {response.status} for {url}")
+
+    report = extractor.finish().to_dict()
+    pagespeed_cache.set(url, report, strategy, CATEGORIES)
+    return report
+
+async def fetch_report(url: str, strategy: str = 'mobile') -> LighthouseReport:
+    """Latest Lighthouse report for a URL, from cache or a (shared) PSI run"""
+    cached = pagespeed_cache.get(url, strategy, CATEGORIES)
+    if cached is None:
+        cached = await pagespeed_flight.do(
+            f"{strategy}:{url}",
+            lambda: _run_audit(url, strategy),
+            recheck=lambda: pagespeed_cache.get(url, strategy, CATEGORIES)
+        )
+    return LighthouseReport.from_dict(cached)
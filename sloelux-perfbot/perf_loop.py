@@ -1,77 +1,147 @@
 from google.adk.agents import LlmAgent
-from tools import fetch_pagespeed, classify_issues, optimize_shopify_theme, store_metrics, send_slack_notification
+from tools import fetch_pagespeed_async, classify_issues, optimize_shopify_theme, store_metrics, send_slack_notification
+from config import AUDIT_CONCURRENCY, PERFORMANCE_SLAS, WATCHLIST, SCHEDULE_RESYNC, SCHEDULE_IDLE_POLL
+from sitemap import expand_watchlist, summarize_cluster
+from scheduler import schedule
+from metrics_store import metrics_store
+from snapshots import snapshots
+from db import db_enabled
+from pg_writer import pg_writer
+from archive import metrics_archive
+from regression import regression_detector
+from broadcaster import broadcaster
 import asyncio
 import json
+import os
+import socket
+import time
+
+# URLs monitored when the caller does not supply its own list
+DEFAULT_URLS = [
+    "https://sloelux.com",
+    "https://sloelux.com/collections/all",
+    "https://sloelux.com/products/sample-product"
+]
+
+async def _call(func, *args, **kwargs):
+    """Await coroutine functions, run blocking ones in a worker thread"""
+    if asyncio.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+async def audit_url(url, context, fetch=None):
+    """Fetch, classify and store a single URL and return its result"""
+    fetch = fetch or fetch_pagespeed_async
+
+    try:
+        # Step 1: Fetch PageSpeed data
+        print(f"Analyzing performance for: {url}")
+        pagespeed_data = await _call(fetch, url)
+
+        if "error" in pagespeed_data:
+            return {"status": "error", "url": url, "error": pagespeed_data["error"]}
+
+        # Step 2: Classify issues
+        issues = classify_issues.func(pagespeed_data)
+
+        # Step 3: Store metrics, then score the run against the URL's own baseline
+        store_result = await _call(store_metrics.func, pagespeed_data)
+        assessment = await asyncio.to_thread(regression_detector.assess, url)
+
+        # Step 4: Apply optimizations for critical/high priority issues
+        optimizations_applied = []
+        for issue in issues:
+            if issue.get('priority') in ['critical', 'high']:
+                optimization_result = await _call(
+                    optimize_shopify_theme.func,
+                    shop_domain="sloelux.myshopify.com",
+                    issue_type=issue['type']
+                )
+                optimizations_applied.append(optimization_result)
+                if db_enabled():
+                    pg_writer.add_optimization(
+                        url, issue['type'], optimization_result.get('action', ''),
+                        before_metrics={key: pagespeed_data.get(key) for key in ('lcp', 'tbt', 'inp', 'performance_score')}
+                    )
+
+        # Step 5: Send notification if optimizations were applied
+        if optimizations_applied:
+            notification_message = f"Applied {len(optimizations_applied)} optimizations to {url}"
+            await _call(send_slack_notification.func, notification_message)
+
+        result = {
+            "status": "completed",
+            "url": url,
+            "performance_score": pagespeed_data.get('performance_score', 0),
+            "lcp": pagespeed_data.get('lcp', 0),
+            "tbt": pagespeed_data.get('tbt', 0),
+            "issues_found": len(issues),
+            "optimizations_applied": len(optimizations_applied),
+            "timestamp": context.get('timestamp', 'unknown')
+        }
+        if assessment is not None and assessment.regressed:
+            result["regression"] = assessment.to_dict()
+        return result
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "url": url,
+            "error": str(e)
+        }
+
+async def run_audits(urls, context, concurrency=None, fetch=None):
+    """Audit URLs concurrently, yielding each result as soon as it finishes"""
+    semaphore = asyncio.Semaphore(concurrency or AUDIT_CONCURRENCY)
+
+    async def bounded_audit(url):
+        async with semaphore:
+            return await audit_url(url, context, fetch)
+
+    tasks = [asyncio.create_task(bounded_audit(url)) for url in urls]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            result = await finished
+            broadcaster.publish(result)
+            yield result
+    finally:
+        # Stop outstanding audits if the consumer stops iterating early
+        for task in tasks:
+            task.cancel()
 
 async def performance_monitoring_loop(context):
     """Main performance monitoring loop that runs every 24 hours"""
-    
-    # URLs to monitor
-    urls_to_monitor = [
-        "https://sloelux.com",
-        "https://sloelux.com/collections/all",
-        "https://sloelux.com/products/sample-product"
-    ]
-    
-    for url in urls_to_monitor:
-        try:
-            # Step 1: Fetch PageSpeed data
-            print(f"Analyzing performance for: {url}")
-            pagespeed_data = fetch_pagespeed.func(url)
-            
-            if "error" in pagespeed_data:
-                yield {"status": "error", "url": url, "error": pagespeed_data["error"]}
-                continue
-            
-            # Step 2: Classify issues
-            issues = classify_issues.func(pagespeed_data)
-            
-            # Step 3: Store metrics
-            store_result = store_metrics.func(pagespeed_data)
-            
-            # Step 4: Apply optimizations for critical/high priority issues
-            optimizations_applied = []
-            for issue in issues:
-                if issue.get('priority') in ['critical', 'high']:
-                    optimization_result = optimize_shopify_theme.func(
-                        shop_domain="sloelux.myshopify.com",
-                        issue_type=issue['type']
-                    )
-                    optimizations_applied.append(optimization_result)
-            
-            # Step 5: Send notification if optimizations were applied
-            if optimizations_applied:
-                notification_message = f"Applied {len(optimizations_applied)} optimizations to {url}"
-                send_slack_notification.func(notification_message)
-            
-            # Yield results
-            yield {
-                "status": "completed",
-                "url": url,
-                "performance_score": pagespeed_data.get('performance_score', 0),
-                "lcp": pagespeed_data.get('lcp', 0),
-                "tbt": pagespeed_data.get('tbt', 0),
-                "issues_found": len(issues),
-                "optimizations_applied": len(optimizations_applied),
-                "timestamp": context.get('timestamp', 'unknown')
-            }
-            
-        except Exception as e:
-            yield {
-                "status": "error", 
-                "url": url, 
-                "error": str(e)
-            }
-        
-        # Small delay between URLs
-        await asyncio.sleep(2)
-    
+
+    # URLs to monitor; wildcard entries are expanded from the sitemap and sampled per template
+    urls_to_monitor, clusters, errors = await expand_watchlist(context.get('urls') or DEFAULT_URLS)
+    for pattern, error in errors.items():
+        error_result = {"status": "error", "url": pattern, "error": error}
+        broadcaster.publish(error_result)
+        yield error_result
+
+    results = {}
+    async for result in run_audits(urls_to_monitor, context, context.get('concurrency')):
+        results[result['url']] = result
+        yield result
+
+    # Attribute sampled results to every URL in their cluster
+    for cluster in clusters:
+        summary = summarize_cluster(cluster, results)
+        if summary['sampled']:
+            await asyncio.to_thread(snapshots.record_cluster, summary)
+        cluster_result = {"status": "cluster_summary", **summary}
+        broadcaster.publish(cluster_result)
+        yield cluster_result
+
     # Final summary
-    yield {
+    covered = len(urls_to_monitor) + sum(len(c.urls) - len(c.sample) for c in clusters)
+    completed = {
         "status": "loop_completed",
-        "message": f"Performance monitoring completed for {len(urls_to_monitor)} URLs",
+        "message": f"Performance monitoring completed for {len(urls_to_monitor)} URLs ({covered} covered)",
         "next_run": "24 hours"
     }
+    broadcaster.publish(completed, event="loop_completed")
+    yield completed
 
 # Create a simple bot class
 class PerformanceBot:
@@ -79,17 +149,76 @@ class PerformanceBot:
         self.name = "SloeLuxPerfBot"
         self.description = "Automated performance monitoring and optimization bot for SloeLux website"
         self.loop = performance_monitoring_loop
-    
+
     async def run(self, context=None):
         """Run the performance monitoring loop"""
         if context is None:
             context = {"timestamp": "manual_run"}
-        
+
         results = []
         async for result in self.loop(context):
             results.append(result)
-        
+
         return results
 
 # Create the bot instance
-bot = PerformanceBot() 
\ No newline at end of file
+bot = PerformanceBot()
+
+def sla_status(result):
+    """'pass', 'fail' or 'error' for an audit result, against PERFORMANCE_SLAS"""
+    if result.get('status') != 'completed':
+        return 'error'
+    meets = result.get('lcp', 0) * 1000 < PERFORMANCE_SLAS['LCP'] and result.get('tbt', 0) < PERFORMANCE_SLAS['TBT']
+    return 'pass' if meets else 'fail'
+
+async def _resync(scheduler, clusters):
+    """Record summaries for the previous clusters, archive sealed segments and re-expand the watchlist"""
+    for cluster in clusters:
+        results = {url: {'status': 'completed', **record}
+                   for url in cluster.sample if (record := snapshots.latest(url))}
+        summary = summarize_cluster(cluster, results)
+        if summary['sampled']:
+            await asyncio.to_thread(snapshots.record_cluster, summary)
+
+    # Archive, then compress, any store segments sealed since the last pass
+    archived = await asyncio.to_thread(metrics_archive.archive_sealed)
+    if archived:
+        print(f"Archived metrics segments: {archived}")
+    compacted = await asyncio.to_thread(metrics_store.compact_sealed)
+    if compacted:
+        print(f"Compacted metrics segments: {compacted}")
+
+    urls, clusters, errors = await expand_watchlist(WATCHLIST)
+    for pattern, error in errors.items():
+        print(f"Could not expand {pattern}: {error}")
+    print(f"Schedule synced: {scheduler.sync(urls)}")
+    return clusters
+
+async def run_worker(context=None, scheduler=schedule, worker_id=None, concurrency=None):
+    """Audit URLs as the durable schedule makes them due (the supervisord perf_loop program)"""
+    context = context or {"timestamp": "scheduled"}
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    concurrency = concurrency or AUDIT_CONCURRENCY
+    clusters, synced_at = [], None
+
+    while True:
+        if synced_at is None or time.monotonic() - synced_at >= SCHEDULE_RESYNC:
+            clusters = await _resync(scheduler, clusters)
+            synced_at = time.monotonic()
+
+        urls = scheduler.claim(worker_id, limit=concurrency)
+        if not urls:
+            wait = scheduler.seconds_until_due()
+            await asyncio.sleep(SCHEDULE_IDLE_POLL if wait is None else min(max(wait, 1), SCHEDULE_IDLE_POLL))
+            continue
+
+        async for result in run_audits(urls, context, concurrency):
+            url = result['url']
+            # Re-check patched URLs soon, and URLs that regressed against their own baseline even if they still pass
+            scheduler.complete(url, worker_id, sla_status(result),
+                               boost='regression' in result or result.get('optimizations_applied', 0) > 0,
+                               score=result.get('performance_score') if result.get('status') == 'completed' else None)
+            print(json.dumps(result))
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
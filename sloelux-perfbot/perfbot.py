@@ -2,60 +2,107 @@
 SLOE LUX Performance Monitoring Bot
 """
 
+import os
+import socket
 import time
 import json
-import requests
-from datetime import datetime
+from datetime import datetime, timezone
 from config import (
     PERFORMANCE_SLAS,
     WATCHLIST,
     THEME_ID_PREVIEW,
-    SLACK_WEBHOOK_URL
+    SLACK_WEBHOOK_URL,
+    SCHEDULE_RESYNC,
+    THEME_DIR,
+    SCHEDULE_IDLE_POLL
 )
+from http_client import http_client
+from pagespeed import fetch_report
+from sitemap import expand_watchlist, summarize_cluster
+from scheduler import schedule
+from snapshots import snapshots
+from regression import regression_detector
+from tools import INP_CATEGORIES, store_metrics
+from image_pipeline import optimize_images
+import script_deferral
+import font_pipeline
 
 class PerfBot:
     def __init__(self):
         self.last_check = {}
+        self.worker_id = f"perfbot:{socket.gethostname()}:{os.getpid()}"
 
     def fetch_pagespeed(self, url):
-        """Fetch PageSpeed Insights data for a URL"""
-        api_url = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed"
-        params = {
-            'url': url,
-            'strategy': 'mobile',
-            'category': ['performance']
-        }
-        response = requests.get(api_url, params=params)
-        return response.json()
+        """Fetch PageSpeed Insights data for a URL as a compact LighthouseReport"""
+        return http_client.run_sync(fetch_report(url, 'mobile'))
 
-    def classify_issues(self, pagespeed_json):
+    def classify_issues(self, report):
         """Classify performance issues from PageSpeed data"""
         labels = []
-        audits = pagespeed_json.get('lighthouseResult', {}).get('audits', {})
         
         # Check for image optimization issues
-        if audits.get('modern-image-formats', {}).get('score', 1) < 1:
+        if report.score('modern-image-formats') < 1:
             labels.append('IMAGE_WEIGHT')
             
         # Check for blocking JavaScript
-        if audits.get('render-blocking-resources', {}).get('score', 1) < 1:
+        if report.score('render-blocking-resources') < 1:
             labels.append('BLOCKING_JS')
             
         # Check for font rendering issues
-        if audits.get('font-display', {}).get('score', 1) < 1:
+        if report.score('font-display') < 1:
             labels.append('RENDER_FONT')
             
         return labels
 
-    def verify(self, url):
-        """Verify if performance metrics meet SLAs"""
-        metrics = self.fetch_pagespeed(url)
+    def measure(self, report):
+        """The SLA metrics of a report"""
         return {
-            'LCP': metrics.get('lighthouseResult', {}).get('audits', {}).get('largest-contentful-paint', {}).get('numericValue', 0),
-            'TBT': metrics.get('lighthouseResult', {}).get('audits', {}).get('total-blocking-time', {}).get('numericValue', 0),
-            'INP': metrics.get('lighthouseResult', {}).get('audits', {}).get('interaction-to-next-paint', {}).get('score', 0)
+            'LCP': report.numeric('largest-contentful-paint'),
+            'TBT': report.numeric('total-blocking-time'),
+            'INP': INP_CATEGORIES.get(report.field_inp_category, 'unknown'),
+            'INP_MS': report.field_inp_ms,
+            'score': round((report.performance_score or 0) * 100)
         }
 
+    def fix_images(self):
+        """Convert the theme snapshot's images to WebP/AVIF (cached by content, so repeat runs are cheap)"""
+        assets = os.path.join(THEME_DIR, 'assets')
+        if not os.path.isdir(assets):
+            return
+        report = optimize_images(assets)
+        if report['processed']:
+            self.notify_slack(f"🖼️ Converted {report['processed']} images in {assets}: "
+                              f"{report['bytes_saved'] / 1024:.0f} KB saved ({report['images_per_second']} images/s)")
+        for source, error in report['errors'].items():
+            self.notify_slack(f"❌ Could not convert {source}: {error}")
+
+    def fix_scripts(self, report):
+        """Defer the theme snapshot's render-blocking scripts, estimating TBT from the PSI audit"""
+        if not os.path.isdir(THEME_DIR):
+            return
+        audit = report.audits.get('render-blocking-resources')
+        result = script_deferral.optimize_theme(THEME_DIR, audit.items if audit else ())
+        for patch in result['patches']:
+            self.notify_slack(f"⏩ {patch['action']} {patch['script']} in {patch['file']}: "
+                              f"~{patch['estimated_tbt_ms']:.0f}ms TBT ({patch['estimate_source']} estimate)")
+        for kept in result['kept']:
+            self.notify_slack(f"⏸️ Left {kept['script']} blocking: {kept['reason']}")
+
+    def fix_fonts(self):
+        """Subset the theme snapshot's fonts, set font-display and preload the primary face"""
+        if not os.path.isdir(THEME_DIR):
+            return
+        result = font_pipeline.optimize_theme(THEME_DIR)
+        if 'error' in result:
+            self.notify_slack(f"❌ Could not subset fonts: {result['error']}")
+            return
+        saved = [page['bytes_saved'] for page in result['pages'].values()]
+        if result['fonts']:
+            self.notify_slack(f"🔤 Subset {len(result['fonts'])} fonts to {result['glyphs']} glyphs: "
+                              f"up to {max(saved, default=0) / 1024:.0f} KB less font data per page")
+        for source, error in result['errors'].items():
+            self.notify_slack(f"❌ Could not subset {source}: {error}")
+
     def notify_slack(self, message):
         """Send notification to Slack"""
         if not SLACK_WEBHOOK_URL:
@@ -64,47 +111,103 @@ class PerfBot:
         payload = {
             'text': f"[SLOE LUX Performance] {message}"
         }
-        requests.post(SLACK_WEBHOOK_URL, json=payload)
+        http_client.request_sync('POST', SLACK_WEBHOOK_URL, json=payload, timeout=10)
+
+    def check_url(self, url):
+        """Audit one URL and patch the local theme snapshot; returns 'pass' | 'fail' | 'error'"""
+        try:
+            # Fetch and analyze performance
+            pagespeed_data = self.fetch_pagespeed(url)
+            issues = self.classify_issues(pagespeed_data)
+            
+            # Handle each issue
+            for issue in issues:
+                if issue == 'IMAGE_WEIGHT':
+                    # Converts the local theme snapshot; the live theme is untouched
+                    self.fix_images()
+                elif issue == 'BLOCKING_JS':
+                    # Patches the local theme snapshot, like fix_images
+                    self.fix_scripts(pagespeed_data)
+                elif issue == 'RENDER_FONT':
+                    # Patches the local theme snapshot, like fix_images
+                    self.fix_fonts()
+            
+            # The fixes only touch the local snapshot, so the live page's metrics are those just audited
+            new_metrics = self.measure(pagespeed_data)
+            record = {
+                'url': url,
+                'lcp': new_metrics['LCP'] / 1000,
+                'tbt': new_metrics['TBT'],
+                'inp': new_metrics['INP'],
+                'inp_ms': new_metrics['INP_MS'],
+                'performance_score': new_metrics['score'],
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            }
+            store_metrics.func(record)
+            snapshot = snapshots.get(url)
+            
+            # A single PSI reading is noisy: only alert on a significant change from the URL's own baseline
+            assessment = regression_detector.assess(url)
+            regressed = assessment is not None and assessment.regressed
+            self.last_check[url] = {'status': 'completed', 'regressed': regressed, **record}
+            # INP is a field metric: URLs without enough CrUX traffic have no category to hold against them
+            meets_slas = (new_metrics['LCP'] < PERFORMANCE_SLAS['LCP'] and
+                          new_metrics['TBT'] < PERFORMANCE_SLAS['TBT'] and
+                          new_metrics['INP'] in (PERFORMANCE_SLAS['INP'].lower(), 'unknown'))
+            
+            if regressed:
+                self.notify_slack(f"🚨 {url} regressed: {assessment.describe()}")
+                return 'fail'
+            if meets_slas:
+                change = snapshot['delta'].get('lcp') if snapshot else None
+                since_last = f" ({change:+.2f}s LCP vs previous run)" if change is not None else ""
+                self.notify_slack(f"✅ {url} meets performance SLAs{since_last}")
+                return 'pass'
+            self.notify_slack(f"⚠️ {url} is outside performance SLAs (no significant change from its baseline)")
+            return 'fail'
+        
+        except Exception as e:
+            self.notify_slack(f"❌ Error monitoring {url}: {str(e)}")
+            return 'error'
+
+    def sync_watchlist(self, clusters):
+        """Report the previous clusters, then re-expand the watchlist into the schedule"""
+        for cluster in clusters:
+            summary = summarize_cluster(cluster, self.last_check)
+            if summary['sampled']:
+                low, high = summary['pass_rate_interval']
+                self.notify_slack(
+                    f"📦 {cluster.key}: {summary['pass_rate']:.0%} ({low:.0%}-{high:.0%}) "
+                    f"of {summary['population']} URLs meet SLAs (sampled {summary['sampled']})"
+                )
+        
+        # Wildcard entries are expanded from the sitemap and sampled per template
+        urls, clusters, errors = http_client.run_sync(expand_watchlist(WATCHLIST))
+        for pattern, error in errors.items():
+            self.notify_slack(f"❌ Could not expand {pattern}: {error}")
+        schedule.sync(urls)
+        return clusters
 
     def run_monitoring_loop(self):
-        """Main monitoring loop"""
+        """Main monitoring loop: audit URLs as the durable schedule makes them due"""
+        clusters, synced_at = [], None
         while True:
-            for url in WATCHLIST:
-                try:
-                    # Fetch and analyze performance
-                    pagespeed_data = self.fetch_pagespeed(url)
-                    issues = self.classify_issues(pagespeed_data)
-                    
-                    # Handle each issue
-                    for issue in issues:
-                        if issue == 'IMAGE_WEIGHT':
-                            # TODO: Implement FixImages agent
-                            pass
-                        elif issue == 'BLOCKING_JS':
-                            # TODO: Implement FixScripts agent
-                            pass
-                        elif issue == 'RENDER_FONT':
-                            # TODO: Implement FixCSS agent
-                            pass
-                    
-                    # Verify changes
-                    new_metrics = self.verify(url)
-                    
-                    # Check if metrics meet SLAs
-                    if (new_metrics['LCP'] < PERFORMANCE_SLAS['LCP'] and
-                        new_metrics['TBT'] < PERFORMANCE_SLAS['TBT'] and
-                        new_metrics['INP'] == PERFORMANCE_SLAS['INP']):
-                        self.notify_slack(f"✅ {url} meets performance SLAs")
-                    else:
-                        self.notify_slack(f"🚨 {url} failed performance SLAs - rolling back changes")
-                
-                except Exception as e:
-                    self.notify_slack(f"❌ Error monitoring {url}: {str(e)}")
-                
-                time.sleep(5)  # Small delay between URLs
+            if synced_at is None or time.monotonic() - synced_at >= SCHEDULE_RESYNC:
+                clusters = self.sync_watchlist(clusters)
+                synced_at = time.monotonic()
+            
+            urls = schedule.claim(self.worker_id)
+            if not urls:
+                wait = schedule.seconds_until_due()
+                time.sleep(SCHEDULE_IDLE_POLL if wait is None else min(max(wait, 1), SCHEDULE_IDLE_POLL))
+                continue
             
-            # Wait 24 hours before next check
-            time.sleep(24 * 60 * 60)
+            for url in urls:
+                status = self.check_url(url)
+                # Regressed URLs are re-checked soon; pass -> fail transitions and score drops are boosted by the schedule
+                check = self.last_check.get(url, {}) if status != 'error' else {}
+                schedule.complete(url, self.worker_id, status, boost=check.get('regressed', False),
+                                  score=check.get('performance_score'))
 
 if __name__ == "__main__":
     bot = PerfBot()
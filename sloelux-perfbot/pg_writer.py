@@ -0,0 +1,244 @@
+"""
+Write-behind buffer for the PostgreSQL performance_metrics and
+optimization_history tables.
+
+Callers hand rows to the writer and return immediately. A background
+thread flushes them in batches, when PG_WRITE_BATCH rows are buffered or
+PG_FLUSH_INTERVAL seconds have passed. Metric rows go in with COPY and
+optimization records with a multi-row INSERT, both in one transaction.
+If Postgres is unreachable, the batch is appended to a local spool file
+and fsync'd. The next successful flush replays the spool in the same
+transaction as the new rows, so delivery is at least once and no row is
+lost to an outage or restart. A batch Postgres refuses (a constraint or
+data error) is bisected until the offending rows are isolated; only
+those go to a .rejected file next to the spool. Every process on the
+host shares the spool, so a flush holds an advisory lock on it from
+reading it to removing it: rows another process spools meanwhile wait
+for the lock instead of being deleted unread, and two flushes never
+replay the same rows.
+"""
+
+import atexit
+import csv
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the spool is only serialised within a process
+    fcntl = None
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import PoolError
+
+from config import PG_FLUSH_INTERVAL, PG_SPOOL_PATH, PG_WRITE_BATCH
+from db import connection
+
+METRIC_COLUMNS = ('url', 'lcp', 'tbt', 'inp', 'inp_ms', 'timestamp')
+OPTIMIZATION_COLUMNS = ('url', 'issue_type', 'action_taken', 'before_metrics', 'after_metrics', 'timestamp')
+
+def _metric_csv(rows: List[Dict[str, Any]]) -> io.StringIO:
+    """COPY payload; unquoted empty fields load as NULL"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row.get(column) for column in METRIC_COLUMNS])
+    buffer.seek(0)
+    return buffer
+
+class PgWriter:
+    """Buffers rows and flushes them to Postgres from a background thread"""
+
+    def __init__(self, batch_size: int = PG_WRITE_BATCH, flush_interval: float = PG_FLUSH_INTERVAL,
+                 spool_path: str = PG_SPOOL_PATH):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._buffer: Dict[str, List[Dict[str, Any]]] = {'metrics': [], 'optimizations': []}
+        self._thread = None
+        self._stats = {'rows_written': 0, 'flushes': 0, 'rows_spooled': 0, 'rows_rejected': 0, 'flush_time_s': 0.0}
+        self._last_error: Optional[str] = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='pg-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _add(self, kind: str, row: Dict[str, Any]):
+        with self._lock:
+            self._ensure_thread()
+            self._buffer[kind].append(row)
+            if sum(len(rows) for rows in self._buffer.values()) >= self.batch_size:
+                self._wake.set()
+
+    def add_metric(self, record: Dict[str, Any]):
+        """Queue a metrics record (as stored by store_metrics) for performance_metrics"""
+        self._add('metrics', {column: record.get(column) for column in METRIC_COLUMNS})
+
+    def add_optimization(self, url: str, issue_type: str, action_taken: str,
+                         before_metrics: Optional[Dict[str, Any]] = None,
+                         after_metrics: Optional[Dict[str, Any]] = None,
+                         timestamp: Optional[str] = None):
+        """Queue an optimization_history record"""
+        self._add('optimizations', {
+            'url': url, 'issue_type': issue_type, 'action_taken': action_taken,
+            'before_metrics': before_metrics, 'after_metrics': after_metrics, 'timestamp': timestamp
+        })
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Write buffered and spooled rows; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, {'metrics': [], 'optimizations': []}
+            with self._spool_lock():
+                spooled = self._read_spool()
+                rows = {kind: spooled[kind] + batch[kind] for kind in batch}
+                total = sum(len(r) for r in rows.values())
+                if not total:
+                    return 0
+
+                start = time.perf_counter()
+                try:
+                    rejected = self._write_isolating(rows)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError) as e:
+                    # Postgres unreachable: keep the rows on disk until it is back
+                    self._last_error = f"{type(e).__name__}: {e}"
+                    self._spool(batch)
+                    return 0
+                if spooled['metrics'] or spooled['optimizations']:
+                    os.remove(self.spool_path)
+                written = total - self._reject(rejected)
+
+            if written == total:
+                self._last_error = None
+            self._stats['rows_written'] += written
+            self._stats['flushes'] += 1
+            self._stats['flush_time_s'] += time.perf_counter() - start
+            return written
+
+    def _write(self, rows: Dict[str, List[Dict[str, Any]]]):
+        with connection() as conn, conn.cursor() as cur:
+            if rows['metrics']:
+                cur.copy_expert(
+                    f"COPY performance_metrics ({', '.join(METRIC_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                    _metric_csv(rows['metrics']))
+            if rows['optimizations']:
+                execute_values(
+                    cur,
+                    f"INSERT INTO optimization_history ({', '.join(OPTIMIZATION_COLUMNS)}) VALUES %s",
+                    [(r['url'], r['issue_type'], r['action_taken'],
+                      Json(r['before_metrics']) if r['before_metrics'] is not None else None,
+                      Json(r['after_metrics']) if r['after_metrics'] is not None else None,
+                      r['timestamp'] or 'now')
+                     for r in rows['optimizations']],
+                    page_size=1000)
+
+    def _write_isolating(self, rows: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Write rows, bisecting any batch Postgres rejects; returns the rows it rejects on their own"""
+        try:
+            self._write(rows)
+            return {'metrics': [], 'optimizations': []}
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError):
+            raise
+        except psycopg2.Error as e:
+            entries = [(kind, row) for kind, batch in rows.items() for row in batch]
+            if len(entries) == 1:
+                self._last_error = f"{type(e).__name__}: {e}"
+                return rows
+        rejected = {'metrics': [], 'optimizations': []}
+        half = len(entries) // 2
+        for part in (entries[:half], entries[half:]):
+            group = {'metrics': [], 'optimizations': []}
+            for kind, row in part:
+                group[kind].append(row)
+            for kind, bad in self._write_isolating(group).items():
+                rejected[kind].extend(bad)
+        return rejected
+
+    @contextmanager
+    def _spool_lock(self):
+        """Exclusive cross-process lock on the spool, held from reading it until it is replaced"""
+        directory = os.path.dirname(self.spool_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(f"{self.spool_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _open_spool(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return open(path, 'a')
+
+    def _spool(self, batch: Dict[str, List[Dict[str, Any]]]):
+        lines = [json.dumps({'kind': kind, 'row': row}) + '\n' for kind, rows in batch.items() for row in rows]
+        if not lines:
+            return
+        with self._open_spool(self.spool_path) as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._stats['rows_spooled'] += len(lines)
+
+    def _reject(self, rows: Dict[str, List[Dict[str, Any]]]) -> int:
+        """Set aside rows Postgres refuses, so they cannot block later flushes; returns how many"""
+        lines = [json.dumps({'kind': kind, 'row': row}) + '\n' for kind, batch in rows.items() for row in batch]
+        if lines:
+            with self._open_spool(f"{self.spool_path}.rejected") as f:
+                f.writelines(lines)
+            self._stats['rows_rejected'] += len(lines)
+        return len(lines)
+
+    def _read_spool(self) -> Dict[str, List[Dict[str, Any]]]:
+        spooled = {'metrics': [], 'optimizations': []}
+        try:
+            with open(self.spool_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line torn by a crash mid-write
+                    spooled[entry['kind']].append(entry['row'])
+        except FileNotFoundError:
+            pass
+        return spooled
+
+    def close(self):
+        """Flush whatever is buffered (called at exit)"""
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = sum(len(rows) for rows in self._buffer.values())
+        flushes = self._stats['flushes']
+        return {
+            **{key: round(value, 3) for key, value in self._stats.items()},
+            'buffered': buffered,
+            'spool_bytes': os.path.getsize(self.spool_path) if os.path.exists(self.spool_path) else 0,
+            'avg_flush_ms': round(self._stats['flush_time_s'] / flushes * 1000, 2) if flushes else 0,
+            'last_error': self._last_error
+        }
+
+# Shared writer; only used when db_enabled()
+pg_writer = PgWriter()
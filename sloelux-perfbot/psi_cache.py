@@ -0,0 +1,143 @@
+"""
+Response cache for PageSpeed Insights results.
+
+Entries are keyed by (url, strategy, categories) and expire after a TTL.
+A bounded in-memory LRU sits in front of an on-disk layer that survives
+restarts and is shared by every bot process. Invalidation markers on
+disk let one process (e.g. after a theme deploy) expire entries that
+other processes still hold in memory.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from config import PSI_CACHE_DIR, PSI_CACHE_SIZE, PSI_CACHE_TTL
+
+_ALL = '_all'
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:16]
+
+class PSICache:
+    """Two-level (memory LRU + disk) TTL cache for PSI responses"""
+
+    def __init__(self, ttl: float = PSI_CACHE_TTL, max_entries: int = PSI_CACHE_SIZE,
+                 cache_dir: str = PSI_CACHE_DIR):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._memory = OrderedDict()  # key -> (stored_at, url, payload)
+        self._lock = threading.Lock()
+        self._hits = {'memory': 0, 'disk': 0}
+        self._misses = 0
+
+    def _key(self, url: str, strategy: str, categories: Iterable[str]) -> str:
+        return f"{_digest(url)}-{_digest(json.dumps([strategy, sorted(categories)]))}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _marker(self, url: Optional[str]) -> str:
+        return os.path.join(self.cache_dir, f"{_digest(url) if url else _ALL}.invalidated")
+
+    def _invalidated_at(self, url: str) -> float:
+        """Latest invalidation time that applies to url, from any process"""
+        latest = 0.0
+        for marker in (self._marker(None), self._marker(url)):
+            try:
+                latest = max(latest, os.stat(marker).st_mtime)
+            except FileNotFoundError:
+                pass
+        return latest
+
+    def _fresh(self, stored_at: float, url: str) -> bool:
+        return time.time() - stored_at < self.ttl and stored_at > self._invalidated_at(url)
+
+    def get(self, url: str, strategy: str = 'mobile',
+            categories: Iterable[str] = ('performance',)) -> Optional[Dict[str, Any]]:
+        """Return a cached response, or None if absent or stale"""
+        key = self._key(url, strategy, categories)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and self._fresh(entry[0], url):
+                self._memory.move_to_end(key)
+                self._hits['memory'] += 1
+                return entry[2]
+            self._memory.pop(key, None)
+
+        try:
+            with open(self._path(key)) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            record = None
+
+        with self._lock:
+            if record and self._fresh(record['stored_at'], url):
+                self._remember(key, record['stored_at'], url, record['payload'])
+                self._hits['disk'] += 1
+                return record['payload']
+            self._misses += 1
+            return None
+
+    def set(self, url: str, payload: Dict[str, Any], strategy: str = 'mobile',
+            categories: Iterable[str] = ('performance',)) -> None:
+        """Store a response in both layers"""
+        key = self._key(url, strategy, categories)
+        stored_at = time.time()
+
+        with self._lock:
+            self._remember(key, stored_at, url, payload)
+
+        # Write atomically so readers in other processes never see a partial file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'stored_at': stored_at, 'url': url, 'strategy': strategy,
+                       'categories': sorted(categories), 'payload': payload}, f)
+        os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key, stored_at, url, payload):
+        self._memory[key] = (stored_at, url, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, url: Optional[str] = None) -> None:
+        """Expire cached responses for url, or for every URL when url is None"""
+        with self._lock:
+            for key in [k for k, entry in self._memory.items() if url is None or entry[1] == url]:
+                del self._memory[key]
+
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        # Touch a marker so other processes drop their in-memory copies too
+        with open(self._marker(url), 'w'):
+            pass
+        prefix = f"{_digest(url)}-" if url else ''
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process"""
+        lookups = self._hits['memory'] + self._hits['disk'] + self._misses
+        return {
+            'memory_hits': self._hits['memory'],
+            'disk_hits': self._hits['disk'],
+            'misses': self._misses,
+            'hit_ratio': round((lookups - self._misses) / lookups, 3) if lookups else 0.0,
+            'memory_entries': len(self._memory)
+        }
+
+# Shared cache instance
+pagespeed_cache = PSICache()
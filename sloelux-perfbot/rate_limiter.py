@@ -0,0 +1,106 @@
+"""
+Token-bucket rate limiting shared by every SloeLux bot process.
+
+Bucket state lives in a small file guarded by an advisory lock, so the
+uvicorn workers, the MCP server and the perf_loop worker all draw from
+the same budget. Async callers await their turn instead of sleeping.
+"""
+
+import asyncio
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process lock
+    fcntl = None
+
+from config import RATE_LIMITS
+
+RATE_LIMIT_DIR = os.getenv('RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'sloelux-ratelimits'))
+
+# Bucket file layout: current token level, last refill time
+_STATE = struct.Struct('<dd')
+
+class TokenBucket:
+    """Token bucket with burst capacity, shared across processes via a state file"""
+
+    def __init__(self, name: str, rate: float, capacity: float = 1, state_dir: str = RATE_LIMIT_DIR):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.path = os.path.join(state_dir, f"{name}.bucket")
+        os.makedirs(state_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._delayed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens from the bucket and return how long the caller must wait"""
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                now = time.time()
+                raw = os.pread(fd, _STATE.size, 0)
+                level, updated = _STATE.unpack(raw) if len(raw) == _STATE.size else (self.capacity, now)
+
+                # Refill, then reserve; a negative level is a queue of waiting callers
+                level = min(self.capacity, level + (now - updated) * self.rate) - tokens
+                os.pwrite(fd, _STATE.pack(level, now), 0)
+            finally:
+                os.close(fd)  # Closing releases the flock
+
+            wait = max(0.0, -level / self.rate)
+            self._acquired += 1
+            if wait > 0:
+                self._delayed += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            return wait
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait (without blocking the event loop) until tokens are available"""
+        wait = await asyncio.to_thread(self._reserve, tokens)  # flock and file I/O
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def acquire_blocking(self, tokens: float = 1) -> float:
+        """Blocking variant of acquire() for synchronous callers"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """Wait-time metrics for this process"""
+        return {
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'acquired': self._acquired,
+            'delayed': self._delayed,
+            'total_wait_s': round(self._total_wait, 3),
+            'avg_wait_s': round(self._total_wait / self._acquired, 3) if self._acquired else 0.0,
+            'max_wait_s': round(self._max_wait, 3)
+        }
+
+_buckets: Dict[str, TokenBucket] = {}
+
+def get_bucket(name: str) -> TokenBucket:
+    """Return the shared bucket configured under `name` in config.RATE_LIMITS"""
+    if name not in _buckets:
+        rate, capacity = RATE_LIMITS[name]
+        _buckets[name] = TokenBucket(name, rate, capacity)
+    return _buckets[name]
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Wait-time metrics for every bucket used by this process"""
+    return {name: bucket.stats() for name, bucket in _buckets.items()}
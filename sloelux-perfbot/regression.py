@@ -0,0 +1,231 @@
+"""
+Statistical regression detection over per-URL metric history.
+
+A single PSI reading is noisy: the same page can swing by a second of
+LCP between runs. Instead of comparing one reading to the SLA constants,
+each reading is compared to a robust baseline of the same URL's previous
+runs. The baseline is the rolling median, and the spread is the rolling
+MAD (median absolute deviation, scaled to a standard deviation). The
+resulting robust z-score becomes a one-sided confidence through the
+normal CDF. A regression needs high confidence, a practically
+significant change and enough history.
+
+score_history() scores every point of a (url-grouped, time-ordered)
+history in one vectorised pass. RegressionDetector keeps the last
+window of runs per URL in memory, bootstrapped from the columnar archive
+and topped up incrementally from the metrics store, so re-scoring every
+URL after each run costs one small matrix operation.
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from archive import MetricsArchive, metrics_archive
+from config import REGRESSION_CONFIDENCE, REGRESSION_MIN_SAMPLES, REGRESSION_WINDOW
+from metrics_store import MetricsStore, metrics_store
+
+# metric -> (direction in which it gets worse, noise floor, smallest change that matters)
+REGRESSION_METRICS = {
+    'lcp': (1, 0.1, 0.3),                  # seconds
+    'tbt': (1, 20.0, 50.0),                # milliseconds
+    'performance_score': (-1, 2.0, 5.0)    # points
+}
+METRICS = tuple(REGRESSION_METRICS)
+MAD_SCALE = 1.4826  # MAD of a normal distribution -> standard deviation
+
+def normal_cdf(z: np.ndarray) -> np.ndarray:
+    """Vectorised standard normal CDF (Abramowitz & Stegun 7.1.26 erf, |error| < 1.5e-7)"""
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-x * x)
+    return 0.5 * (1 + np.sign(z) * erf)
+
+def _nanmedian(windows: np.ndarray) -> np.ndarray:
+    """Median over the last axis ignoring NaN (NaN if all are); np.nanmedian loops per row on masked windows"""
+    ordered = np.sort(windows, axis=-1)  # NaN sorts last
+    count = (~np.isnan(windows)).sum(axis=-1)
+    lo = np.maximum(count - 1, 0) // 2
+    hi = np.maximum(count // 2, lo)
+    median = 0.5 * (np.take_along_axis(ordered, lo[..., None], -1) + np.take_along_axis(ordered, hi[..., None], -1))[..., 0]
+    return np.where(count > 0, median, np.nan)
+
+def score_history(keys: np.ndarray, values: np.ndarray, window: int = REGRESSION_WINDOW,
+                  chunk: int = 250_000) -> Dict[str, np.ndarray]:
+    """Score every point against the previous `window` points of the same key.
+
+    keys: (N,) group ids, rows grouped by key and time-ordered within a key.
+    values: (N, len(METRICS)) readings, NaN where missing.
+    Returns arrays: baseline and mad (N, M), z and confidence (N, M),
+    samples (N,) and regressed (N, M).
+    """
+    n = len(keys)
+    direction, floor, min_delta = (np.array([REGRESSION_METRICS[m][i] for m in METRICS]) for i in range(3))
+    out = {name: np.full((n, len(METRICS)), np.nan) for name in ('baseline', 'mad', 'z', 'confidence')}
+    out['samples'] = np.zeros(n, dtype=np.int64)
+
+    # Chunked so memory stays bounded on long histories; each chunk sees the `window` rows before it
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        lo = max(0, start - window)
+        pad = window - (start - lo)
+        chunk_keys = np.concatenate([np.full(pad, -1), keys[lo:stop]])
+        chunk_values = np.concatenate([np.full((pad, len(METRICS)), np.nan), values[lo:stop]])
+
+        # Row i's window is the `window` rows before it, masked to the same key
+        key_windows = sliding_window_view(chunk_keys, window)[:stop - start]
+        value_windows = sliding_window_view(chunk_values, window, axis=0)[:stop - start]  # (rows, M, window)
+        current_keys = keys[start:stop]
+        same = key_windows == current_keys[:, None]
+        history = np.where(same[:, None, :], value_windows, np.nan)
+
+        baseline = _nanmedian(history)
+        mad = _nanmedian(np.abs(history - baseline[:, :, None]))
+
+        current = values[start:stop]
+        z = direction * (current - baseline) / (MAD_SCALE * mad + floor)
+        out['baseline'][start:stop] = baseline
+        out['mad'][start:stop] = mad
+        out['z'][start:stop] = z
+        out['confidence'][start:stop] = normal_cdf(z)
+        out['samples'][start:stop] = (same & ~np.isnan(history).all(axis=1)).sum(axis=1)
+
+    change = direction * (values - out['baseline'])
+    out['regressed'] = ((out['samples'][:, None] >= REGRESSION_MIN_SAMPLES)
+                        & (out['confidence'] >= REGRESSION_CONFIDENCE)
+                        & (change >= min_delta))
+    return out
+
+@dataclass
+class Assessment:
+    """The latest run of a URL scored against its baseline"""
+    url: str
+    regressed: bool
+    confidence: float
+    samples: int
+    metrics: Dict[str, Dict[str, Optional[float]]]
+
+    def describe(self) -> str:
+        """Short human-readable summary of the regressed metrics"""
+        parts = [f"{name} {m['value']:g} vs baseline {m['baseline']:g} ({m['confidence']:.1%})"
+                 for name, m in self.metrics.items() if m['regressed']]
+        return ', '.join(parts) or 'no significant change'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'url': self.url, 'regressed': self.regressed, 'confidence': self.confidence,
+                'samples': self.samples, 'metrics': self.metrics}
+
+def _round(value) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), 4)
+
+class RegressionDetector:
+    """Keeps each URL's recent runs and re-scores all URLs in one pass"""
+
+    def __init__(self, store: MetricsStore = metrics_store, archive: MetricsArchive = metrics_archive,
+                 window: int = REGRESSION_WINDOW):
+        self.store = store
+        self.archive = archive
+        self.window = window
+        self._lock = threading.Lock()
+        self._runs: Dict[str, deque] = {}
+        self._position: Optional[int] = None
+
+    def _add(self, url: str, record: Dict[str, Any]):
+        runs = self._runs.setdefault(url, deque(maxlen=self.window + 1))
+        runs.append(tuple(float(record[m]) if isinstance(record.get(m), (int, float)) else np.nan for m in METRICS))
+
+    def _bootstrap(self):
+        """Seed each URL's recent runs from the archive, newest window+1 per URL"""
+        chunks, url_names, _ = self.archive.scan(['url', *METRICS], live=False)
+        self._position = self.archive.last_position()
+        if not chunks:
+            return
+        urls = np.concatenate([c['url'] for c in chunks])
+        values = np.column_stack([np.concatenate([c[m] for c in chunks]) for m in METRICS])
+        order = np.argsort(urls, kind='stable')  # Grouped by URL, still in position order
+        urls, values = urls[order], values[order]
+        group_end = np.r_[np.flatnonzero(np.diff(urls)) + 1, len(urls)]
+        from_end = np.repeat(group_end, np.diff(np.r_[0, group_end])) - np.arange(len(urls))
+        keep = from_end <= self.window + 1
+        for url_id, row in zip(urls[keep], values[keep]):
+            self._runs.setdefault(url_names[url_id], deque(maxlen=self.window + 1)).append(tuple(row))
+
+    def refresh(self):
+        """Pick up runs appended to the store since the last refresh"""
+        with self._lock:
+            if self._position is None:
+                self._bootstrap()
+            newer = []
+            for position, _ in self.store.entries():
+                if position <= self._position:
+                    break
+                newer.append(position)
+            for position in reversed(newer):
+                record = self.store.read(position)
+                if record.get('url'):
+                    self._add(record['url'], record)
+            if newer:
+                self._position = newer[0]
+
+    def _matrix(self, urls: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        keys, rows, last = [], [], []
+        for i, url in enumerate(urls):
+            runs = self._runs[url]
+            keys.extend([i] * len(runs))
+            rows.extend(runs)
+            last.append(len(rows) - 1)
+        return np.array(keys), np.array(rows, dtype=float).reshape(-1, len(METRICS)), np.array(last)
+
+    def assess_all(self) -> Dict[str, Assessment]:
+        """Score every URL's latest run against its own baseline"""
+        self.refresh()
+        with self._lock:
+            urls = list(self._runs)
+        return self._assess(urls)
+
+    def assess(self, url: str) -> Optional[Assessment]:
+        """Assessment of a URL's latest run, or None if it has no history"""
+        self.refresh()
+        with self._lock:
+            urls = [url] if url in self._runs else []
+        return self._assess(urls).get(url)
+
+    def _assess(self, urls: List[str]) -> Dict[str, Assessment]:
+        """Score the given URLs' windows only"""
+        if not urls:
+            return {}
+        with self._lock:
+            keys, values, last = self._matrix(urls)
+        scores = score_history(keys, values, self.window)
+
+        assessments = {}
+        for i, url in enumerate(urls):
+            row = last[i]
+            metrics = {
+                name: {
+                    'value': _round(values[row, j]),
+                    'baseline': _round(scores['baseline'][row, j]),
+                    'mad': _round(scores['mad'][row, j]),
+                    'z': _round(scores['z'][row, j]),
+                    'confidence': _round(scores['confidence'][row, j]),
+                    'regressed': bool(scores['regressed'][row, j])
+                }
+                for j, name in enumerate(METRICS)
+            }
+            regressed = [m['confidence'] for m in metrics.values() if m['regressed']]
+            assessments[url] = Assessment(
+                url=url,
+                regressed=bool(regressed),
+                confidence=max(regressed) if regressed else 0.0,
+                samples=int(scores['samples'][row]),
+                metrics=metrics
+            )
+        return assessments
+
+# Shared detector instance
+regression_detector = RegressionDetector()
@@ -0,0 +1,121 @@
+"""
+Response cache for the dashboard's read endpoints.
+
+The UI polls the read endpoints every few seconds, but their data only
+changes when an audit is stored or an optimisation is applied. Responses
+are therefore cached as ready-to-send JSON bytes per route and query.
+
+Invalidation is by generation: writers (store_metrics, PerfBot,
+optimize_shopify_theme) bump a counter in a small shared file, and a
+cached body is served only while the counter still matches the one it
+was built under. The counter is one 8-byte pread per request, so the
+API workers, MCP server and monitoring processes invalidate each other
+without any messaging. Entries whose content can never change (e.g. a
+/metrics page identified by its ETag) may be stored without a
+generation.
+"""
+
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: generation bumps are only atomic within a process
+    fcntl = None
+
+from config import RESPONSE_CACHE_GENERATION, RESPONSE_CACHE_SIZE
+
+COUNTER = struct.Struct('<Q')
+
+class ResponseCache:
+    """LRU of serialised responses, invalidated by a shared generation counter"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, generation_path: str = RESPONSE_CACHE_GENERATION):
+        self.max_entries = max_entries
+        self.generation_path = generation_path
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> (generation or None, body)
+        self._fd: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._invalidations = 0
+
+    def _counter_fd(self) -> int:
+        if self._fd is None:
+            directory = os.path.dirname(self.generation_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(self.generation_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def generation(self) -> int:
+        """Current write generation shared by every process"""
+        raw = os.pread(self._counter_fd(), COUNTER.size, 0)
+        return COUNTER.unpack(raw)[0] if len(raw) == COUNTER.size else 0
+
+    def invalidate(self):
+        """Publish a write: every generation-bound entry in every process becomes stale"""
+        fd = self._counter_fd()
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            os.pwrite(fd, COUNTER.pack(self.generation() + 1), 0)
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        with self._lock:
+            self._invalidations += 1
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        """Cached body for key, or None if missing or built before the latest write"""
+        generation = self.generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] not in (None, generation):
+                del self._entries[key]
+                self._stale += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple, body: bytes, generation: Optional[int] = None, immutable: bool = False):
+        """Store a body built under `generation` (read it before building), or forever if immutable"""
+        with self._lock:
+            self._entries[key] = (None if immutable else generation, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def serialise(self, key: Tuple, data: Any, generation: Optional[int] = None, immutable: bool = False) -> bytes:
+        """JSON-encode data once and cache the bytes"""
+        body = json.dumps(data, separators=(',', ':')).encode()
+        self.put(key, body, generation, immutable)
+        return body
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit ratio and occupancy, for sizing RESPONSE_CACHE_SIZE"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': sum(len(body) for _, body in self._entries.values()),
+                'hits': self._hits,
+                'misses': self._misses,
+                'stale': self._stale,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else None,
+                'invalidations': self._invalidations,
+                'generation': self.generation()
+            }
+
+# Shared response cache
+response_cache = ResponseCache()
@@ -0,0 +1,209 @@
+"""
+Responsive width variants and srcset rewriting for the theme snapshot.
+
+Hero and product images are served at a single width, so phones download
+desktop-sized files. For each JPEG/PNG/WebP in THEME_DIR/assets, the
+generator decodes the image once and resizes it down a width ladder
+(RESPONSIVE_WIDTHS). Each rung is resized from the previous, larger one,
+so every resize is cheaper than the last. JPEGs are decoded with the DCT
+scaling of Image.draft at no more than the widest rung. Variants sit next
+to their source as `<name>-<width>w.<ext>` and are regenerated only when
+the source is newer.
+
+The Liquid templates are then rewritten. An `<img>` without a srcset
+whose src is built with `img_url` / `image_url: width:` (Shopify's CDN
+resizes those itself) or points at an asset with generated variants
+gains `srcset` and `sizes` attributes. Tags that already have a srcset
+are left alone.
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from config import IMAGE_WORKERS, RESPONSIVE_QUALITY, RESPONSIVE_SIZES, RESPONSIVE_WIDTHS, THEME_DIR
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+TEMPLATE_DIRS = ('layout', 'sections', 'snippets', 'templates')
+VARIANT_NAME = re.compile(r'-(\d+)w\.[^.]+$')
+
+# An <img> tag, allowing Liquid output/tags (which may contain '>') inside it
+IMG_TAG = re.compile(r'<img\b(?:\{\{.*?\}\}|\{%.*?%\}|[^>])*>', re.IGNORECASE | re.DOTALL)
+SRC_ATTR = re.compile(r'(?<![\w-])src\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+HAS_SRCSET = re.compile(r'(?<![\w-])srcset\s*=', re.IGNORECASE)
+HAS_SIZES = re.compile(r'(?<![\w-])sizes\s*=', re.IGNORECASE)
+IMG_URL = re.compile(r'(\|\s*img_url:\s*)(["\'])[^"\']*\2')
+IMAGE_URL_WIDTH = re.compile(r'(\|\s*image_url:\s*width:\s*)\d+')
+ASSET_URL = re.compile(r'^\{\{\s*(["\'])([^"\']+)\1\s*\|\s*asset_url\s*\}\}$')
+
+def variant_name(name: str, width: int) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}-{width}w{ext}"
+
+def _save(image: Image.Image, path: str, quality: int):
+    tmp_path = f"{path}.tmp"
+    fmt = Image.registered_extensions()[os.path.splitext(path)[1].lower()]
+    if fmt == 'JPEG':
+        image.convert('RGB').save(tmp_path, fmt, quality=quality, optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        image.save(tmp_path, fmt, quality=quality, method=4)
+    else:
+        image.save(tmp_path, fmt, optimize=True)
+    os.replace(tmp_path, path)
+
+def _ladder(source: str, widths: Sequence[int], quality: int) -> Dict[int, Tuple[str, int]]:
+    """Worker: decode source once and write every narrower rung; returns {width: (name, bytes)}"""
+    with Image.open(source) as image:
+        original_width, original_height = image.size  # Before draft(), which shrinks image.size
+        rungs = sorted((w for w in widths if w < original_width), reverse=True)
+        if rungs and image.format == 'JPEG':
+            image.draft(image.mode, (rungs[0], rungs[0] * original_height // original_width))
+        image.load()
+        current = image
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            current = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    directory, name = os.path.split(source)
+    written = {}
+    for width in rungs:
+        if width < current.width:  # Otherwise draft() already decoded at exactly this width
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        path = os.path.join(directory, variant_name(name, width))
+        _save(current, path, quality)
+        written[width] = (os.path.basename(path), os.path.getsize(path))
+    written[original_width] = (name, os.path.getsize(source))
+    return written
+
+def _existing_variants(source: str, widths: Sequence[int]) -> Optional[Dict[int, Tuple[str, int]]]:
+    """Variants on disk that are newer than the source, or None if any are missing or stale"""
+    directory, name = os.path.split(source)
+    with Image.open(source) as image:
+        original_width = image.width
+    mtime = os.path.getmtime(source)
+    found = {original_width: (name, os.path.getsize(source))}
+    for width in widths:
+        if width >= original_width:
+            continue
+        path = os.path.join(directory, variant_name(name, width))
+        if not os.path.exists(path) or os.path.getmtime(path) < mtime:
+            return None
+        with Image.open(path) as variant:
+            found[variant.width] = (os.path.basename(path), os.path.getsize(path))
+    return found
+
+def generate_variants(asset_dir: str, widths: Sequence[int] = RESPONSIVE_WIDTHS,
+                      quality: int = RESPONSIVE_QUALITY, workers: Optional[int] = IMAGE_WORKERS) -> Dict[str, Any]:
+    """Write the width ladder for every image in asset_dir; report['variants'] maps name -> {width: name}"""
+    sources = sorted(
+        os.path.join(asset_dir, name) for name in os.listdir(asset_dir)
+        if name.lower().endswith(SOURCE_EXTENSIONS) and not VARIANT_NAME.search(name))
+    report = {'images': len(sources), 'generated': 0, 'cached': 0, 'failed': 0,
+              'variant_bytes': 0, 'variants': {}, 'errors': {}}
+
+    def account(source, ladder):
+        report['variants'][os.path.basename(source)] = {width: name for width, (name, _) in sorted(ladder.items())}
+        report['variant_bytes'] += sum(size for width, (name, size) in ladder.items()
+                                       if name != os.path.basename(source))
+
+    pending = []
+    for source in sources:
+        try:
+            ladder = _existing_variants(source, widths)
+        except OSError as e:
+            report['failed'] += 1
+            report['errors'][source] = str(e)
+            continue
+        if ladder is None:
+            pending.append(source)
+        else:
+            report['cached'] += 1
+            account(source, ladder)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(pending))) as pool:
+            futures = {pool.submit(_ladder, source, widths, quality): source for source in pending}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    ladder = future.result()
+                except Exception as e:
+                    report['failed'] += 1
+                    report['errors'][source] = str(e)
+                    continue
+                report['generated'] += 1
+                account(source, ladder)
+    return report
+
+def _srcset(src: str, variants: Dict[str, Dict[int, str]], widths: Sequence[int]) -> Optional[str]:
+    """srcset candidates for a src attribute value, or None if it cannot be made responsive"""
+    if IMG_URL.search(src):
+        return ', '.join(f"{IMG_URL.sub(lambda m: f'{m.group(1)}{m.group(2)}{w}x{m.group(2)}', src)} {w}w"
+                         for w in widths)
+    if IMAGE_URL_WIDTH.search(src):
+        return ', '.join(f"{IMAGE_URL_WIDTH.sub(lambda m: f'{m.group(1)}{w}', src)} {w}w" for w in widths)
+    asset = ASSET_URL.match(src.strip())
+    if asset and len(variants.get(asset.group(2), {})) > 1:
+        quote = asset.group(1)
+        return ', '.join(f"{{{{ {quote}{name}{quote} | asset_url }}}} {w}w"
+                         for w, name in sorted(variants[asset.group(2)].items()))
+    return None
+
+def rewrite_liquid(text: str, variants: Dict[str, Dict[int, str]], widths: Sequence[int] = RESPONSIVE_WIDTHS,
+                   sizes: str = RESPONSIVE_SIZES) -> Tuple[str, int]:
+    """Add srcset/sizes to the <img> tags in a template; returns (text, tags rewritten)"""
+    rewritten = 0
+
+    def rewrite(match):
+        nonlocal rewritten
+        tag = match.group(0)
+        if HAS_SRCSET.search(tag):
+            return tag
+        src = SRC_ATTR.search(tag)
+        srcset = src and _srcset(src.group(2), variants, widths)
+        if not srcset:
+            return tag
+        quote = src.group(1)
+        attributes = f' srcset={quote}{srcset}{quote}'
+        if not HAS_SIZES.search(tag):
+            attributes += f' sizes={quote}{sizes}{quote}'
+        rewritten += 1
+        return tag[:src.end()] + attributes + tag[src.end():]
+
+    return IMG_TAG.sub(rewrite, text), rewritten
+
+def optimize_theme(theme_dir: str = THEME_DIR, widths: Sequence[int] = RESPONSIVE_WIDTHS,
+                   sizes: str = RESPONSIVE_SIZES) -> Dict[str, Any]:
+    """Generate width variants for the snapshot's assets and add srcset/sizes to its templates"""
+    started = time.perf_counter()
+    asset_dir = os.path.join(theme_dir, 'assets')
+    images = generate_variants(asset_dir, widths) if os.path.isdir(asset_dir) else {'variants': {}}
+
+    templates: List[str] = []
+    tags = 0
+    for directory in TEMPLATE_DIRS:
+        root = os.path.join(theme_dir, directory)
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            if not name.endswith('.liquid'):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            text, count = rewrite_liquid(text, images['variants'], widths, sizes)
+            if not count:
+                continue
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            templates.append(os.path.relpath(path, theme_dir))
+            tags += count
+
+    images.pop('variants')
+    return {**images, 'templates': templates, 'tags': tags, 'seconds': round(time.perf_counter() - started, 3)}
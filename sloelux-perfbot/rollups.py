@@ -0,0 +1,125 @@
+"""
+Hourly and daily rollups of performance_metrics, and the history query
+API on top of them.
+
+Rollup rows hold per-URL p50/p75/p95 of LCP, TBT and INP for each hour
+and day. A statement-level trigger keeps them current as rows arrive:
+it recomputes only the (url, bucket) pairs touched by the inserted
+rows, read from the statement's transition table, so a COPY batch costs
+one refresh per touched bucket rather than one per row. Percentiles
+cannot be merged incrementally, so each touched bucket is recomputed
+from its raw rows through the (url, timestamp) index; that is a few
+dozen rows per bucket at our audit cadence.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from config import HISTORY_MAX_POINTS, HISTORY_RAW_SPAN
+from db import connection
+
+ROLLUP_METRICS = ('lcp', 'tbt', 'inp_ms')
+ROLLUP_PERCENTILES = (50, 75, 95)
+RESOLUTIONS = {'hour': 'performance_rollup_hourly', 'day': 'performance_rollup_daily'}
+
+_COLUMNS = [f"{metric}_p{p}" for metric in ROLLUP_METRICS for p in ROLLUP_PERCENTILES]
+
+def _aggregate_sql(table: str, unit: str, keys: Optional[str]) -> str:
+    """Upsert rollups for `unit` buckets, limited to the (url, bucket) pairs in `keys` if given"""
+    percentiles = ',\n           '.join(
+        f"percentile_cont({p / 100}) WITHIN GROUP (ORDER BY m.{metric})"
+        for metric in ROLLUP_METRICS for p in ROLLUP_PERCENTILES)
+    scope = f"""
+    JOIN (SELECT DISTINCT url, date_trunc('{unit}', timestamp) AS bucket FROM {keys}) k
+      ON m.url = k.url AND m.timestamp >= k.bucket AND m.timestamp < k.bucket + interval '1 {unit}'""" if keys else ''
+    return f"""
+    INSERT INTO {table} (url, bucket, samples, {', '.join(_COLUMNS)})
+    SELECT m.url, date_trunc('{unit}', m.timestamp), count(*),
+           {percentiles}
+    FROM performance_metrics m{scope}
+    GROUP BY m.url, date_trunc('{unit}', m.timestamp)
+    ON CONFLICT (url, bucket) DO UPDATE SET
+        samples = EXCLUDED.samples, {', '.join(f'{c} = EXCLUDED.{c}' for c in _COLUMNS)};
+    """
+
+def _rollup_table_sql(table: str) -> str:
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        url TEXT NOT NULL,
+        bucket TIMESTAMP NOT NULL,
+        samples INTEGER NOT NULL,
+        {', '.join(f'{c} FLOAT' for c in _COLUMNS)},
+        PRIMARY KEY (url, bucket)
+    );
+    CREATE INDEX IF NOT EXISTS {table}_bucket_brin ON {table} USING BRIN (bucket);
+    """
+
+# Indexes, INP column, rollup tables and the trigger that maintains them (idempotent)
+ROLLUP_SCHEMA = f"""
+ALTER TABLE performance_metrics ADD COLUMN IF NOT EXISTS inp_ms FLOAT;
+CREATE INDEX IF NOT EXISTS performance_metrics_url_timestamp ON performance_metrics (url, timestamp);
+CREATE INDEX IF NOT EXISTS performance_metrics_timestamp_brin ON performance_metrics USING BRIN (timestamp);
+CREATE INDEX IF NOT EXISTS optimization_history_url_timestamp ON optimization_history (url, timestamp);
+{_rollup_table_sql(RESOLUTIONS['hour'])}
+{_rollup_table_sql(RESOLUTIONS['day'])}
+CREATE OR REPLACE FUNCTION refresh_performance_rollups() RETURNS trigger AS $$
+BEGIN
+    -- Serialise refreshes so each one sees rows committed by the previous
+    PERFORM pg_advisory_xact_lock(hashtext('performance_rollups'));
+    {_aggregate_sql(RESOLUTIONS['hour'], 'hour', 'new_rows')}
+    {_aggregate_sql(RESOLUTIONS['day'], 'day', 'new_rows')}
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS performance_metrics_rollups ON performance_metrics;
+CREATE TRIGGER performance_metrics_rollups
+    AFTER INSERT ON performance_metrics
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE refresh_performance_rollups();
+"""
+
+# Recompute every rollup from the raw rows (after creating the schema on an existing table)
+ROLLUP_BACKFILL = _aggregate_sql(RESOLUTIONS['hour'], 'hour', None) + _aggregate_sql(RESOLUTIONS['day'], 'day', None)
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def pick_resolution(start: datetime, end: datetime, max_points: int = HISTORY_MAX_POINTS) -> str:
+    """Finest resolution that keeps the series within max_points: 'raw', 'hour' or 'day'"""
+    span = end - start
+    if span <= timedelta(seconds=HISTORY_RAW_SPAN):
+        return 'raw'
+    if span / timedelta(hours=1) <= max_points:
+        return 'hour'
+    return 'day'
+
+def performance_history(url: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        resolution: Optional[str] = None) -> Dict[str, Any]:
+    """LCP/TBT/INP series for a URL between start and end (default: the last 7 days)"""
+    # Naive datetimes are UTC, like the TIMESTAMP columns
+    end = _as_utc(end or datetime.now(timezone.utc))
+    start = _as_utc(start or end - timedelta(days=7))
+    resolution = resolution or pick_resolution(start, end)
+    bounds = (start.replace(tzinfo=None), end.replace(tzinfo=None))
+
+    with connection() as conn, conn.cursor() as cur:
+        if resolution == 'raw':
+            cur.execute("SELECT timestamp, lcp, tbt, inp_ms FROM performance_metrics "
+                        "WHERE url = %s AND timestamp >= %s AND timestamp < %s ORDER BY timestamp",
+                        (url, *bounds))
+            columns = ['timestamp', 'lcp', 'tbt', 'inp_ms']
+        elif resolution in RESOLUTIONS:
+            cur.execute(f"SELECT bucket, samples, {', '.join(_COLUMNS)} FROM {RESOLUTIONS[resolution]} "
+                        "WHERE url = %s AND bucket >= date_trunc(%s, %s::timestamp) AND bucket < %s ORDER BY bucket",
+                        (url, resolution, *bounds))
+            columns = ['bucket', 'samples', *_COLUMNS]
+        else:
+            raise ValueError(f"Unknown resolution {resolution!r}")
+        rows = cur.fetchall()
+
+    points: List[Dict[str, Any]] = [
+        {column: value.isoformat() if isinstance(value, datetime) else value for column, value in zip(columns, row)}
+        for row in rows
+    ]
+    return {'url': url, 'resolution': resolution, 'start': start.isoformat(), 'end': end.isoformat(), 'points': points}
@@ -0,0 +1,206 @@
+"""
+Durable per-URL audit schedule.
+
+Every monitored URL has a row in a small SQLite database with its own
+interval and next run time, so a restart by supervisord resumes the
+schedule instead of resetting it. Workers (the perf_loop worker,
+PerfBot) claim due URLs under a lease rather than sleeping through a
+fixed cycle:
+
+- intervals are per template (SCHEDULE_INTERVALS) with random jitter so
+  URLs do not fall into lock-step;
+- URLs that regress (pass -> fail), lose SCHEDULE_BOOST_SCORE_DROP
+  or more performance-score points since their last audit, or were
+  patched are boosted: they jump the queue and are re-audited at a
+  shorter interval for a while;
+- after downtime, overdue URLs run once each, most overdue first, and
+  leases held by a crashed worker expire and are reclaimed.
+"""
+
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import (
+    SCHEDULE_BOOST_FACTOR,
+    SCHEDULE_BOOST_SCORE_DROP,
+    SCHEDULE_BOOST_WINDOW,
+    SCHEDULE_DB,
+    SCHEDULE_INTERVAL,
+    SCHEDULE_INTERVALS,
+    SCHEDULE_JITTER,
+    SCHEDULE_LEASE,
+    SCHEDULE_RETRY
+)
+from sitemap import template_of
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedule (
+    url TEXT PRIMARY KEY,
+    interval_s REAL NOT NULL,
+    next_run REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    boost_until REAL NOT NULL DEFAULT 0,
+    last_run REAL,
+    last_status TEXT,
+    last_score REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS schedule_due ON schedule (priority DESC, next_run);
+"""
+
+def interval_for(url: str) -> float:
+    """Base audit interval for a URL, by Shopify template"""
+    return SCHEDULE_INTERVALS.get(template_of(url), SCHEDULE_INTERVAL)
+
+class Scheduler:
+    """SQLite-backed schedule shared by every worker process on the host"""
+
+    def __init__(self, path: str = SCHEDULE_DB):
+        self.path = path
+        self._initialised = False
+
+    @contextmanager
+    def _connect(self, write: bool = False):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialised:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self._initialised = True
+            if write:
+                # Take the write lock up front so concurrent claims never interleave
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            else:
+                yield conn
+        finally:
+            conn.close()
+
+    def _next_run(self, now: float, interval: float) -> float:
+        return now + interval * (1 + random.uniform(-SCHEDULE_JITTER, SCHEDULE_JITTER))
+
+    def sync(self, urls: Iterable[str], now: Optional[float] = None) -> Dict[str, int]:
+        """Make the schedule cover exactly `urls`, keeping existing URLs' state.
+
+        New URLs are due immediately; URLs no longer monitored are dropped.
+        """
+        now = time.time() if now is None else now
+        urls = list(dict.fromkeys(urls))
+        with self._connect(write=True) as conn:
+            existing = {row[0] for row in conn.execute("SELECT url FROM schedule")}
+            for url in urls:
+                if url in existing:
+                    conn.execute("UPDATE schedule SET interval_s = ? WHERE url = ?", (interval_for(url), url))
+                else:
+                    conn.execute("INSERT INTO schedule (url, interval_s, next_run) VALUES (?, ?, ?)",
+                                 (url, interval_for(url), now))
+            removed = existing - set(urls)
+            conn.executemany("DELETE FROM schedule WHERE url = ?", ((url,) for url in removed))
+        return {'added': len(set(urls) - existing), 'removed': len(removed), 'total': len(urls)}
+
+    def claim(self, worker: str, limit: int = 1, now: Optional[float] = None) -> List[str]:
+        """Lease up to `limit` due URLs: boosted first, then most overdue"""
+        now = time.time() if now is None else now
+        with self._connect(write=True) as conn:
+            urls = [row[0] for row in conn.execute(
+                "SELECT url FROM schedule WHERE next_run <= ? AND lease_expires <= ? "
+                "ORDER BY priority DESC, next_run LIMIT ?", (now, now, limit))]
+            conn.executemany("UPDATE schedule SET lease_owner = ?, lease_expires = ? WHERE url = ?",
+                             ((worker, now + SCHEDULE_LEASE, url) for url in urls))
+        return urls
+
+    def complete(self, url: str, worker: str, status: str, boost: bool = False,
+                 score: Optional[float] = None, now: Optional[float] = None) -> Optional[float]:
+        """Record an audit outcome ('pass', 'fail' or 'error') and schedule the next run.
+
+        A pass -> fail transition, or a performance score at least
+        SCHEDULE_BOOST_SCORE_DROP points below the previous audit's, boosts
+        the URL automatically; pass boost=True for other reasons (e.g. a
+        patch was applied). Returns the next run time, or None if the URL
+        is no longer scheduled.
+        """
+        now = time.time() if now is None else now
+        with self._connect(write=True) as conn:
+            row = conn.execute(
+                "SELECT interval_s, boost_until, last_status, last_score, failures FROM schedule WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                return None
+            interval, boost_until, last_status, last_score, failures = row
+
+            dropped = score is not None and last_score is not None and last_score - score >= SCHEDULE_BOOST_SCORE_DROP
+            if boost or dropped or (status == 'fail' and last_status == 'pass'):
+                boost_until = now + SCHEDULE_BOOST_WINDOW
+            boosted = boost_until > now
+
+            if status == 'error':
+                # Back off on repeated failures, but never wait longer than the normal interval
+                failures += 1
+                next_run = now + min(interval, SCHEDULE_RETRY * 2 ** (failures - 1))
+                status, score = last_status, last_score
+            else:
+                failures = 0
+                score = last_score if score is None else score
+                next_run = self._next_run(now, interval / SCHEDULE_BOOST_FACTOR if boosted else interval)
+
+            # Keep the lease if it expired and another worker has since claimed the URL
+            conn.execute(
+                "UPDATE schedule SET next_run = ?, priority = ?, boost_until = ?, last_run = ?, last_status = ?, "
+                "last_score = ?, failures = ?, lease_expires = CASE WHEN lease_owner = ? THEN 0 ELSE lease_expires END, "
+                "lease_owner = CASE WHEN lease_owner = ? THEN NULL ELSE lease_owner END WHERE url = ?",
+                (next_run, 1 if boosted else 0, boost_until, now, status, score, failures, worker, worker, url))
+        return next_run
+
+    def boost(self, url: str, now: Optional[float] = None) -> bool:
+        """Move a URL to the front of the queue and shorten its interval for a while"""
+        now = time.time() if now is None else now
+        with self._connect(write=True) as conn:
+            cursor = conn.execute(
+                "UPDATE schedule SET priority = 1, boost_until = ?, next_run = MIN(next_run, ?) WHERE url = ?",
+                (now + SCHEDULE_BOOST_WINDOW, now, url))
+            return cursor.rowcount > 0
+
+    def seconds_until_due(self, now: Optional[float] = None) -> Optional[float]:
+        """Time until the next URL becomes claimable, or None if nothing is scheduled"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            row = conn.execute("SELECT MIN(MAX(next_run, lease_expires)) FROM schedule").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - now)
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Schedule size, due/overdue/leased/boosted counts and time to the next run"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            total, due, overdue, leased, boosted = conn.execute(
+                "SELECT COUNT(*), "
+                "COALESCE(SUM(next_run <= ?), 0), "
+                "COALESCE(SUM(next_run <= ? - interval_s), 0), "
+                "COALESCE(SUM(lease_expires > ?), 0), "
+                "COALESCE(SUM(boost_until > ?), 0) FROM schedule",
+                (now, now, now, now)).fetchone()
+        next_due = self.seconds_until_due(now)
+        return {
+            'urls': total,
+            'due': due,
+            'overdue': overdue,
+            'leased': leased,
+            'boosted': boosted,
+            'next_due_in_s': None if next_due is None else round(next_due, 1)
+        }
+
+# Shared schedule instance
+schedule = Scheduler()
@@ -0,0 +1,352 @@
+"""
+Render-blocking script deferral for the theme snapshot.
+
+Synchronous `<script src>` tags (and `| script_tag` outputs) in
+layout/theme.liquid, sections and snippets stop the parser until they
+download and run. This module plans a patch set that makes them
+non-blocking without breaking the order scripts depend on.
+
+Dependencies are inferred from globals. A script provides the functions,
+classes and variables it declares, anything it assigns to `window.`,
+`self.`, `globalThis.` or `this.`, and the globals of known libraries
+(jQuery, Swiper, ...). A script requires every provided name it
+mentions. Only names used inside an inline DOMContentLoaded/load
+callback count as needed after parsing; when the callback cannot be
+delimited, the whole script is taken to run during parsing. Theme assets
+are read from the snapshot, so their own code is analysed too.
+
+- A theme asset gets `defer` unless something that still runs during
+  parsing needs it: a later inline script (outside a DOMContentLoaded
+  or load handler) or a later script that stays synchronous. A deferred
+  script that appears earlier and uses it also blocks deferral. Deferred
+  scripts keep their relative order, so chains such as
+  jquery -> plugin -> theme can all be deferred together.
+- A third-party script gets `async`, but only if its host is on
+  SCRIPT_ASYNC_ALLOW (independent tags such as analytics) and nothing
+  uses its globals.
+- Anything else, and any script that calls document.write, is left
+  alone and reported.
+
+Each patch carries an estimated TBT reduction. It comes from the
+render-blocking-resources audit items when PSI listed the script, and
+otherwise from the script's size.
+"""
+
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+from config import SCRIPT_ASYNC_ALLOW, THEME_DIR
+
+LONG_TASK_MS = 50  # Only main-thread time beyond this per task counts towards TBT
+MS_PER_KB = 1.0    # Rough mobile parse/compile/run cost of script bytes, when PSI has no figure
+
+# Globals defined by common libraries, keyed by a substring of the script's file name
+KNOWN_GLOBALS = {
+    'jquery': {'jQuery', '$'},
+    'swiper': {'Swiper'},
+    'flickity': {'Flickity'},
+    'lodash': {'_'},
+    'underscore': {'_'},
+    'vue': {'Vue'},
+    'alpine': {'Alpine'},
+    'gsap': {'gsap'},
+    'lazysizes': {'lazySizes'}
+}
+
+SCRIPT = re.compile(r'<script\b((?:\{\{.*?\}\}|\{%.*?%\}|[^>])*)>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+SCRIPT_TAG_FILTER = re.compile(r'\{\{\s*(["\'])([^"\']+\.js)\1\s*\|\s*asset_url\s*\|\s*script_tag\s*\}\}')
+ATTRIBUTE = re.compile(r'([\w:-]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+))?')
+ASSET_SRC = re.compile(r'^\{\{\s*(["\'])([^"\']+\.js)\1\s*\|\s*asset_url\s*\}\}$')
+CONTENT_FOR_LAYOUT = re.compile(r'\{\{\s*content_for_layout\s*\}\}')
+JS_TYPES = ('', 'text/javascript', 'application/javascript')
+TEMPLATE_DIRS = ('sections', 'snippets')
+
+# Declarations (indented ones too) and global-object assignments: what a script provides
+DECLARATION = re.compile(
+    r'^\s*(?:(?:async\s+)?function\s*\*?\s*|class\s+|(?:var|let|const)\s+)([A-Za-z_$][\w$]*)'
+    r'|(?<![\w$.])(?:window|self|globalThis|this)\.([A-Za-z_$][\w$]*)\s*=(?!=)', re.MULTILINE)
+IDENTIFIER = re.compile(
+    r'(?<![\w$.])[A-Za-z_$][\w$]*'
+    r'|(?:(?<=window\.)|(?<=self\.)|(?<=globalThis\.)|(?<=this\.))[A-Za-z_$][\w$]*')
+# A DOMContentLoaded/load handler registration followed by an inline callback: its body runs after parsing
+DEFERRED_HANDLER = re.compile(
+    r'''(?:addEventListener\(\s*(["'])(?:DOMContentLoaded|load)\1\s*,|\bwindow\.onload\s*=)\s*'''
+    r'(?:async\s+)?(?:function\b[^{]*|(?:\([^()]*\)|[A-Za-z_$][\w$]*)\s*=>\s*)\{')
+
+class Script:
+    """One <script> in the theme, in (approximate) execution order"""
+
+    def __init__(self, file: str, start: int, end: int, tag: str, attrs: Dict[str, str], body: str,
+                 from_filter: bool = False):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.tag = tag
+        self.attrs = attrs
+        self.body = body
+        self.order = 0
+        self.from_filter = from_filter
+        src = attrs.get('src', '')
+        asset = ASSET_SRC.match(src.strip())
+        self.src = src
+        self.asset = asset.group(2) if asset else None
+        self.asset_quote = asset.group(1) if asset else "'"
+        self.code = body
+        self.bytes = len(body.encode())
+        self.provides: Set[str] = set()
+        self.requires: Set[str] = set()
+        self.parse_time_requires: Set[str] = set()
+
+    @property
+    def external(self) -> bool:
+        return bool(self.src)
+
+    @property
+    def blocking(self) -> bool:
+        """Runs while the parser waits"""
+        if 'async' in self.attrs or 'defer' in self.attrs:
+            return False
+        return self.attrs.get('type', '').strip().lower() in JS_TYPES
+
+    @property
+    def parse_time_code(self) -> str:
+        """The code that runs while the page is parsed: all of it, less inline DOMContentLoaded/load callbacks"""
+        if self.external:
+            return self.code
+        parts, position = [], 0
+        for match in DEFERRED_HANDLER.finditer(self.code):
+            if match.start() < position:
+                continue  # Nested in a callback already cut out
+            close = _matching_brace(self.code, match.end() - 1)
+            if close is None:
+                return self.code  # Cannot tell where the callback ends: assume it all runs now
+            parts.append(self.code[position:match.end()])
+            position = close
+        return ''.join(parts) + self.code[position:]
+
+    @property
+    def name(self) -> str:
+        return self.asset or self.src or f"inline script in {self.file}"
+
+def _matching_brace(code: str, open_at: int) -> Optional[int]:
+    """Index of the '}' closing the '{' at open_at, skipping strings and comments; None if unbalanced"""
+    depth, i = 0, open_at
+    while i < len(code):
+        char = code[i]
+        if char in '"\'`':
+            i += 1
+            while i < len(code) and code[i] != char:
+                i += 2 if code[i] == '\\' else 1
+        elif code.startswith('//', i):
+            i = code.find('\n', i)
+            if i < 0:
+                return None
+        elif code.startswith('/*', i):
+            i = code.find('*/', i)
+            if i < 0:
+                return None
+            i += 1
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return None
+
+def _attributes(text: str) -> Optional[Dict[str, str]]:
+    if '{%' in text:
+        return None  # Conditional attributes: leave the tag alone
+    attrs = {}
+    for match in ATTRIBUTE.finditer(text):
+        value = match.group(2) or ''
+        attrs[match.group(1).lower()] = value[1:-1] if value[:1] in '"\'' else value
+    return attrs
+
+def _find_scripts(path: str, relpath: str) -> List[Script]:
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    scripts = []
+    for match in SCRIPT.finditer(text):
+        attrs = _attributes(match.group(1))
+        if attrs is not None:
+            scripts.append(Script(relpath, match.start(), match.end(), match.group(0), attrs, match.group(2)))
+    for match in SCRIPT_TAG_FILTER.finditer(text):
+        quote, name = match.group(1), match.group(2)
+        attrs = {'src': f"{{{{ {quote}{name}{quote} | asset_url }}}}"}
+        scripts.append(Script(relpath, match.start(), match.end(), match.group(0), attrs, '', from_filter=True))
+    return sorted(scripts, key=lambda s: s.start)
+
+def collect_scripts(theme_dir: str = THEME_DIR) -> List[Script]:
+    """Scripts of the layout and its sections/snippets, in execution order.
+
+    Sections render where the layout outputs content_for_layout; their
+    relative order is not known, so they are taken alphabetically.
+    """
+    layout = os.path.join(theme_dir, 'layout', 'theme.liquid')
+    layout_scripts = _find_scripts(layout, 'layout/theme.liquid') if os.path.exists(layout) else []
+    content_at = None
+    if os.path.exists(layout):
+        with open(layout, encoding='utf-8') as f:
+            found = CONTENT_FOR_LAYOUT.search(f.read())
+        content_at = found.start() if found else None
+
+    inner = []
+    for directory in TEMPLATE_DIRS:
+        root = os.path.join(theme_dir, directory)
+        if os.path.isdir(root):
+            for name in sorted(n for n in os.listdir(root) if n.endswith('.liquid')):
+                inner.extend(_find_scripts(os.path.join(root, name), f"{directory}/{name}"))
+
+    before = [s for s in layout_scripts if content_at is None or s.start < content_at]
+    after = [s for s in layout_scripts if content_at is not None and s.start >= content_at]
+    scripts = before + inner + after
+    for order, script in enumerate(scripts):
+        script.order = order
+        if script.asset:
+            path = os.path.join(theme_dir, 'assets', script.asset)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    script.code = f.read()
+                script.bytes = os.path.getsize(path)
+    _infer_dependencies(scripts)
+    return scripts
+
+def _infer_dependencies(scripts: Sequence[Script]):
+    for script in scripts:
+        label = (script.asset or urlsplit(script.src).path).lower()
+        for key, names in KNOWN_GLOBALS.items():
+            if key in label:
+                script.provides |= names
+        for match in DECLARATION.finditer(script.code):
+            script.provides.add(match.group(1) or match.group(2))
+    provided = set().union(*(s.provides for s in scripts)) if scripts else set()
+    for script in scripts:
+        script.requires = (set(IDENTIFIER.findall(script.code)) & provided) - script.provides
+        script.parse_time_requires = (set(IDENTIFIER.findall(script.parse_time_code)) & provided) - script.provides
+
+def _allowed_host(src: str, allow: Sequence[str]) -> bool:
+    host = urlsplit(src if '//' in src else '').netloc.lower()
+    return bool(host) and any(host == h or host.endswith('.' + h) for h in allow)
+
+def _blocking_ms(script: Script, items: Iterable[Tuple[str, float, float]]) -> Tuple[float, str]:
+    """(ms the script blocks rendering, source of the figure)"""
+    src = urlsplit(script.src if '//' in script.src else '')
+    for url, wasted_ms, _ in items:
+        resource = urlsplit(url)
+        if script.asset and resource.path.endswith('/' + script.asset):
+            return wasted_ms, 'psi'
+        if src.netloc and resource.netloc.endswith(src.netloc) and resource.path == src.path:
+            return wasted_ms, 'psi'
+    return script.bytes / 1024 * MS_PER_KB, 'size'
+
+def plan(scripts: Sequence[Script], blocking_items: Iterable[Tuple[str, float, float]] = (),
+         allow: Sequence[str] = SCRIPT_ASYNC_ALLOW) -> Dict[str, List[Dict[str, Any]]]:
+    """Patch set making blocking external scripts non-blocking; returns {'patches': [...], 'kept': [...]}"""
+    items = list(blocking_items)
+    candidates = {}
+    kept = []
+    for script in scripts:
+        if not (script.external and script.blocking):
+            continue
+        if 'document.write' in script.code:
+            kept.append((script, 'calls document.write'))
+        elif script.asset:
+            candidates[script.order] = 'defer'
+        elif _allowed_host(script.src, allow):
+            candidates[script.order] = 'async'
+        else:
+            kept.append((script, 'not a theme asset or an allow-listed host'))
+
+    # Drop candidates something synchronous needs, until nothing changes (a kept script's own needs block more)
+    changed = True
+    reasons = {}
+    while changed:
+        changed = False
+        for script in scripts:
+            action = candidates.get(script.order)
+            if action is None:
+                continue
+            for other in scripts:
+                if other is script or not (other.requires & script.provides):
+                    continue
+                if action == 'async':
+                    reason = f"{other.name} uses its globals"
+                elif (other.order > script.order and not other.external and other.blocking
+                      and other.parse_time_requires & script.provides):
+                    reason = f"inline script in {other.file} uses it while the page is parsed"
+                elif other.order > script.order and other.external and other.blocking and other.order not in candidates:
+                    reason = f"{other.name} stays synchronous and uses it"
+                elif other.order < script.order and 'defer' in other.attrs:
+                    reason = f"{other.name} is deferred earlier and uses it"
+                else:
+                    continue
+                del candidates[script.order]
+                reasons[script.order] = reason
+                changed = True
+                break
+    kept += [(s, reasons[s.order]) for s in scripts if s.order in reasons]
+
+    patches = []
+    for script in scripts:
+        action = candidates.get(script.order)
+        if action is None:
+            continue
+        blocking_ms, source = _blocking_ms(script, items)
+        patches.append({
+            'file': script.file,
+            'script': script.name,
+            'action': action,
+            'before': script.tag,
+            'after': _rewrite(script, action),
+            'requires': sorted(script.requires),
+            'estimated_tbt_ms': round(max(blocking_ms - LONG_TASK_MS, 0), 1),
+            'estimate_source': source,
+            '_start': script.start,
+            '_end': script.end
+        })
+    return {
+        'patches': patches,
+        'kept': [{'file': s.file, 'script': s.name, 'reason': reason} for s, reason in kept]
+    }
+
+def _rewrite(script: Script, action: str) -> str:
+    if script.from_filter:
+        quote = script.asset_quote
+        return f'<script src="{{{{ {quote}{script.asset}{quote} | asset_url }}}}" {action}></script>'
+    open_end = SCRIPT.match(script.tag).end(1)
+    return script.tag[:open_end].rstrip() + f" {action}" + script.tag[open_end:]
+
+def apply(theme_dir: str, patches: Sequence[Dict[str, Any]]) -> List[str]:
+    """Write a patch set into the snapshot; returns the files changed"""
+    by_file: Dict[str, List[Dict[str, Any]]] = {}
+    for patch in patches:
+        by_file.setdefault(patch['file'], []).append(patch)
+    for relpath, file_patches in by_file.items():
+        path = os.path.join(theme_dir, relpath)
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        for patch in sorted(file_patches, key=lambda p: p['_start'], reverse=True):
+            if text[patch['_start']:patch['_end']] != patch['before']:
+                raise ValueError(f"{relpath} changed since the patch set was planned")
+            text = text[:patch['_start']] + patch['after'] + text[patch['_end']:]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    return sorted(by_file)
+
+def optimize_theme(theme_dir: str = THEME_DIR, blocking_items: Iterable[Tuple[str, float, float]] = ()) -> Dict[str, Any]:
+    """Plan and apply script deferral in the snapshot; blocking_items are render-blocking-resources audit items"""
+    result = plan(collect_scripts(theme_dir), blocking_items)
+    files = apply(theme_dir, result['patches'])
+    patches = [{k: v for k, v in patch.items() if not k.startswith('_')} for patch in result['patches']]
+    return {
+        'patches': patches,
+        'kept': result['kept'],
+        'files': files,
+        'estimated_tbt_ms': round(sum(p['estimated_tbt_ms'] for p in patches), 1)
+    }
@@ -2,6 +2,7 @@ import os
 import psycopg2
 from psycopg2 import sql
 from dotenv import load_dotenv
+from rollups import ROLLUP_BACKFILL, ROLLUP_SCHEMA
 
 def setup_database():
     load_dotenv()
@@ -63,6 +64,11 @@ def setup_database():
             )
         """)
         
+        # Indexes, rollup tables and the trigger that keeps them current
+        cur.execute(ROLLUP_SCHEMA)
+        cur.execute(ROLLUP_BACKFILL)
+        conn.commit()
+        
         print("Tables created successfully")
         
     except Exception as e:
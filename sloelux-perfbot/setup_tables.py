@@ -1,6 +1,7 @@
 from supabase import create_client
 import os
 from dotenv import load_dotenv
+from rollups import ROLLUP_BACKFILL, ROLLUP_SCHEMA
 
 def setup_tables():
     load_dotenv()
@@ -41,6 +42,10 @@ def setup_tables():
         supabase.query(create_metrics_table).execute()
         supabase.query(create_history_table).execute()
         
+        # Indexes, rollup tables and the trigger that keeps them current
+        supabase.query(ROLLUP_SCHEMA).execute()
+        supabase.query(ROLLUP_BACKFILL).execute()
+        
         print("Tables created successfully!")
         
         # Enable RLS
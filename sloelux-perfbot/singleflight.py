@@ -0,0 +1,91 @@
+"""
+Single-flight de-duplication of in-flight work.
+
+Concurrent callers asking for the same key share one execution: the
+first caller starts the work, later callers await the same result. This
+works across event loops in a process (FastAPI handlers, the HTTP
+client loop used by sync tools and PerfBot). Across processes (API
+workers, MCP server, perf_loop worker), a per-key file lock serialises
+leaders, and `recheck` lets a later leader pick up the result the
+previous one just cached instead of repeating the work.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: de-duplicate within the process only
+    fcntl = None
+
+from config import INFLIGHT_LOCK_DIR
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution"""
+
+    def __init__(self, lock_dir: str = INFLIGHT_LOCK_DIR):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._tasks = set()
+        self._stats = {'executed': 0, 'joined': 0, 'cross_process_hits': 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 recheck: Optional[Callable[[], Any]] = None) -> Any:
+        """Run fn() once for all concurrent callers of key and share its result.
+
+        recheck() is called once the cross-process lock is held; a non-None
+        return value is used instead of running fn().
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = concurrent.futures.Future()
+            else:
+                self._stats['joined'] += 1
+
+        if leader:
+            # Run detached so one caller cancelling does not fail the others
+            task = asyncio.get_running_loop().create_task(self._run(key, future, fn, recheck))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _run(self, key, future, fn, recheck):
+        try:
+            lock_fd = await asyncio.to_thread(self._acquire_file_lock, key)
+            try:
+                result = recheck() if recheck else None
+                if result is None:
+                    self._stats['executed'] += 1
+                    result = await fn()
+                else:
+                    self._stats['cross_process_hits'] += 1
+            finally:
+                if lock_fd is not None:
+                    os.close(lock_fd)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _acquire_file_lock(self, key: str) -> Optional[int]:
+        if fcntl is None:
+            return None
+        os.makedirs(self.lock_dir, exist_ok=True)
+        name = hashlib.sha256(key.encode()).hexdigest()[:32]
+        fd = os.open(os.path.join(self.lock_dir, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def stats(self) -> Dict[str, int]:
+        """Execution and de-duplication counters for this process"""
+        return {**self._stats, 'in_flight': len(self._inflight)}
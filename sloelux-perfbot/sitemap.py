@@ -0,0 +1,244 @@
+"""
+Sitemap-driven expansion of wildcard watchlist entries.
+
+An entry such as `https://sloelux.com/products/*` is expanded by
+streaming the store's sitemap (following Shopify's sitemap index into
+the per-type child sitemaps), grouping the matching URLs by Shopify
+template and drawing a deterministic sample per template. Pages built
+from the same template share almost all of their markup, scripts and
+styles, so a sized sample stands in for the whole cluster: audits stay
+bounded while coverage scales to thousands of products.
+"""
+
+import fnmatch
+import hashlib
+import math
+import statistics
+import zlib
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config import (
+    PERFORMANCE_SLAS,
+    SAMPLE_CONFIDENCE,
+    SAMPLE_MARGIN,
+    SAMPLE_MAX_PER_CLUSTER,
+    SITEMAP_MAX_URLS
+)
+from http_client import http_client
+
+# Shopify path segment -> template name
+TEMPLATES = {'products': 'product', 'collections': 'collection', 'pages': 'page', 'blogs': 'blog'}
+
+# Shopify names child sitemaps after the resource type they list
+_CHILD_SITEMAP_TYPES = {'sitemap_products': 'product', 'sitemap_collections': 'collection',
+                        'sitemap_pages': 'page', 'sitemap_blogs': 'blog'}
+
+def template_of(url: str) -> str:
+    """Shopify template a storefront URL is rendered with"""
+    segments = [s for s in urlsplit(url).path.split('/') if s]
+    if not segments:
+        return 'index'
+    # /collections/<handle>/products/<handle> renders the product template
+    if 'products' in segments[:-1]:
+        return 'product'
+    # Locale prefixes (/fr/products/...) come before the resource segment
+    for segment in segments[:2]:
+        if segment in TEMPLATES:
+            return TEMPLATES[segment]
+    return 'other'
+
+def is_wildcard(entry: str) -> bool:
+    # Only '*': a literal '?' starts a query string
+    return '*' in entry
+
+def sample_size(population: int, margin: float = SAMPLE_MARGIN, confidence: float = SAMPLE_CONFIDENCE,
+                maximum: int = SAMPLE_MAX_PER_CLUSTER) -> int:
+    """Cochran's sample size for a proportion, with finite population correction"""
+    if population <= 0:
+        return 0
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    n0 = z * z * 0.25 / (margin * margin)  # p = 0.5, the worst case
+    n = math.ceil(n0 / (1 + (n0 - 1) / population))
+    return max(1, min(n, maximum, population))
+
+def draw_sample(urls: Iterable[str], size: int, seed: str) -> List[str]:
+    """Deterministic sample: the same seed always picks the same URLs"""
+    ranked = sorted(urls, key=lambda url: hashlib.sha1(f"{seed}:{url}".encode()).digest())
+    return sorted(ranked[:size])
+
+@dataclass
+class Cluster:
+    """URLs matching one watchlist pattern and rendered by one template"""
+    pattern: str
+    template: str
+    urls: List[str] = field(default_factory=list)
+    sample: List[str] = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        """Identifier the cluster's results are stored under"""
+        return f"{self.pattern}#{self.template}"
+
+class _SitemapParser:
+    """Stream consumer for http_client: parses <loc> entries as chunks arrive"""
+
+    def __init__(self, gzipped: bool = False):
+        self.gzipped = gzipped
+        self.reset()
+
+    def reset(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.gzipped else None
+        self._root = None
+        self._loc = None
+        self.pages: List[str] = []
+        self.sitemaps: List[str] = []
+
+    def feed(self, chunk: bytes):
+        if self._inflate is not None:
+            chunk = self._inflate.decompress(chunk)
+        self._parser.feed(chunk)
+        for event, element in self._parser.read_events():
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if self._root is None:
+                    self._root = element
+            elif tag == 'loc':
+                self._loc = (element.text or '').strip()
+            elif tag in ('url', 'sitemap'):
+                if self._loc:
+                    (self.pages if tag == 'url' else self.sitemaps).append(self._loc)
+                self._loc = None
+                # Drop finished entries so memory does not grow with the sitemap
+                self._root.clear()
+
+async def _fetch_sitemap(url: str) -> _SitemapParser:
+    parser = _SitemapParser(gzipped=urlsplit(url).path.endswith('.gz'))
+    response = await http_client.request('GET', url, stream=parser)
+    if not response.ok:
+        raise RuntimeError(f"Sitemap {url} returned HTTP {response.status}")
+    return parser
+
+async def sitemap_urls(sitemap: str, templates: Optional[set] = None,
+                       limit: int = SITEMAP_MAX_URLS) -> List[str]:
+    """Page URLs listed in a sitemap, following sitemap indexes.
+
+    Child sitemaps Shopify names after a template outside `templates`
+    are not fetched.
+    """
+    pending, seen, pages = [sitemap], set(), []
+    while pending and len(pages) < limit:
+        url = pending.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        parser = await _fetch_sitemap(url)
+        pages.extend(parser.pages[:limit - len(pages)])
+        for child in parser.sitemaps:
+            name = urlsplit(child).path.rsplit('/', 1)[-1]
+            kind = next((t for prefix, t in _CHILD_SITEMAP_TYPES.items() if name.startswith(prefix)), None)
+            if templates is None or kind is None or kind in templates:
+                pending.append(child)
+    return pages
+
+def _wanted_templates(pattern: str) -> Optional[set]:
+    """Templates a pattern can match, or None if it is not tied to one"""
+    prefix = pattern.split('*', 1)[0]
+    template = template_of(prefix + 'x')
+    return None if template in ('index', 'other') else {template}
+
+async def expand_pattern(pattern: str, seed: Optional[str] = None) -> List[Cluster]:
+    """Clusters (with their samples) for one wildcard watchlist entry"""
+    parts = urlsplit(pattern)
+    pages = await sitemap_urls(f"{parts.scheme}://{parts.netloc}/sitemap.xml", _wanted_templates(pattern))
+
+    clusters: Dict[str, Cluster] = {}
+    for url in dict.fromkeys(pages):
+        if fnmatch.fnmatchcase(url, pattern.replace('?', '[?]')):
+            template = template_of(url)
+            clusters.setdefault(template, Cluster(pattern, template)).urls.append(url)
+
+    # Rotate the sample daily; within a day cycles re-audit the same URLs
+    seed = seed or datetime.now(timezone.utc).date().isoformat()
+    for cluster in clusters.values():
+        cluster.sample = draw_sample(cluster.urls, sample_size(len(cluster.urls)), seed)
+    return sorted(clusters.values(), key=lambda c: c.template)
+
+async def expand_watchlist(entries: Iterable[str], seed: Optional[str] = None) -> Tuple[List[str], List[Cluster], Dict[str, str]]:
+    """Expand wildcard entries into sampled URLs.
+
+    Returns (urls to audit, clusters, {pattern: error} for patterns whose
+    sitemap could not be read). Literal entries are audited as-is.
+    """
+    urls, clusters, errors = [], [], {}
+    for entry in entries:
+        if not is_wildcard(entry):
+            urls.append(entry)
+            continue
+        try:
+            expanded = await expand_pattern(entry, seed)
+        except Exception as e:
+            errors[entry] = str(e)
+            continue
+        clusters.extend(expanded)
+        for cluster in expanded:
+            urls.extend(cluster.sample)
+    return list(dict.fromkeys(urls)), clusters, errors
+
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+def summarize_cluster(cluster: Cluster, results: Dict[str, Dict[str, Any]],
+                      confidence: float = SAMPLE_CONFIDENCE) -> Dict[str, Any]:
+    """Attribute sampled audit results to the whole cluster.
+
+    `results` maps URL -> audit result (lcp in seconds, tbt in ms,
+    performance_score). The pass rate is against PERFORMANCE_SLAS, with
+    a Wilson score interval corrected for the cluster's finite size (the
+    sample counts as n / fpc draws), which stays open when all or none
+    of the sample pass.
+    """
+    audited = [results[url] for url in cluster.sample if results.get(url, {}).get('status') == 'completed']
+    summary = {
+        'url': cluster.key,
+        'cluster': cluster.template,
+        'pattern': cluster.pattern,
+        'population': len(cluster.urls),
+        'sampled': len(audited)
+    }
+    if not audited:
+        return summary
+
+    lcp = [r.get('lcp', 0) for r in audited]
+    tbt = [r.get('tbt', 0) for r in audited]
+    passed = sum(1 for r in audited
+                 if r.get('lcp', 0) * 1000 < PERFORMANCE_SLAS['LCP'] and r.get('tbt', 0) < PERFORMANCE_SLAS['TBT'])
+    n, population = len(audited), len(cluster.urls)
+    pass_rate = passed / n
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    fpc = (population - n) / (population - 1) if population > 1 else 0
+    if fpc:
+        n_eff = n / fpc
+        shrink = z * z / n_eff
+        centre = (pass_rate + shrink / 2) / (1 + shrink)
+        margin = z / (1 + shrink) * math.sqrt(pass_rate * (1 - pass_rate) / n_eff + shrink / n_eff / 4)
+    else:
+        centre, margin = pass_rate, 0.0  # The whole cluster was audited
+
+    summary.update({
+        'lcp': _percentile(lcp, 0.75),
+        'lcp_p50': _percentile(lcp, 0.5),
+        'tbt': _percentile(tbt, 0.75),
+        'performance_score': round(statistics.mean(r.get('performance_score', 0) for r in audited)),
+        'pass_rate': round(pass_rate, 3),
+        'pass_rate_margin': round(margin, 3),
+        'pass_rate_interval': [round(max(0.0, centre - margin), 3), round(min(1.0, centre + margin), 3)],
+        'estimated_failing': round((1 - pass_rate) * population)
+    })
+    return summary
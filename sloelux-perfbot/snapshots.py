@@ -0,0 +1,198 @@
+"""
+Materialised latest-run snapshot per URL.
+
+Every store_metrics write updates a small table holding each URL's
+latest run, the run before it and the numeric delta between the two.
+Read paths (/status, /metrics/latest, cluster summaries) serve from an
+in-process map instead of walking the metrics history. The latest
+summary of each sampled template cluster is kept in a table of its own,
+so metric read paths never mistake a cluster for a page.
+
+The table lives in SQLite so every process on the host shares it: the
+writer's process updates its map directly, and other processes notice
+new commits through PRAGMA data_version (which changes only when another
+connection commits) and reload just the rows with a newer sequence
+number. A missing or empty table is rebuilt from the metrics store once.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import SNAPSHOT_DB
+from metrics_store import MetricsStore, metrics_store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    url TEXT PRIMARY KEY,
+    latest TEXT NOT NULL,
+    previous TEXT,
+    delta TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_seq ON snapshots (seq);
+CREATE TABLE IF NOT EXISTS cluster_summaries (
+    cluster TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+DELTA_FIELDS = ('lcp', 'tbt', 'inp_ms', 'performance_score')
+
+def delta(latest: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """latest - previous for the numeric metrics both runs have"""
+    if not previous:
+        return {}
+    return {field: round(latest[field] - previous[field], 4) for field in DELTA_FIELDS
+            if isinstance(latest.get(field), (int, float)) and isinstance(previous.get(field), (int, float))}
+
+class SnapshotTable:
+    """Latest, previous and delta per URL, kept in memory and mirrored to SQLite"""
+
+    def __init__(self, path: str = SNAPSHOT_DB, store: MetricsStore = metrics_store):
+        self.path = path
+        self.store = store
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._seq = 0
+        self._data_version = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._rebuild_if_empty()
+        return self._conn
+
+    def _rebuild_if_empty(self):
+        """Seed the table from the newest two runs of every URL in the store"""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM snapshots LIMIT 1").fetchone() is None:
+                runs: Dict[str, List[Dict[str, Any]]] = {}
+                counts: Dict[str, int] = {}
+                for position, entry in self.store.entries():
+                    record = self.store.read(position)
+                    url = record.get('url')
+                    if not isinstance(url, str):
+                        continue
+                    counts[url] = counts.get(url, 0) + 1
+                    if len(runs.setdefault(url, [])) < 2:
+                        runs[url].append(record)
+                now = time.time()
+                conn.executemany(
+                    "INSERT INTO snapshots (url, latest, previous, delta, runs, updated_at, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((url, json.dumps(records[0]), json.dumps(records[1]) if len(records) > 1 else None,
+                      json.dumps(delta(*records) if len(records) > 1 else {}), counts[url], now, seq)
+                     for seq, (url, records) in enumerate(runs.items(), start=1)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _load(self, rows):
+        for url, latest, previous, delta_json, runs, updated_at, seq in rows:
+            self._snapshots[url] = {
+                'url': url,
+                'latest': json.loads(latest),
+                'previous': json.loads(previous) if previous else None,
+                'delta': json.loads(delta_json),
+                'runs': runs,
+                'updated_at': updated_at
+            }
+            self._seq = max(self._seq, seq)
+
+    def _sync(self):
+        """Load rows committed by other processes since the last look"""
+        conn = self._connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._load(conn.execute(
+                "SELECT url, latest, previous, delta, runs, updated_at, seq FROM snapshots WHERE seq > ?",
+                (self._seq,)))
+
+    def update(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Make record the latest run of its URL and return the new snapshot"""
+        url = record.get('url')
+        if not isinstance(url, str):
+            return None
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Catch up under the write lock: a row committed before it would otherwise sit below our
+                # new seq, and the next _sync (which only loads higher seqs) would never see it
+                self._sync()
+                row = conn.execute("SELECT latest, runs FROM snapshots WHERE url = ?", (url,)).fetchone()
+                previous = json.loads(row[0]) if row else None
+                runs = (row[1] if row else 0) + 1
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM snapshots").fetchone()[0]
+                values = (url, json.dumps(record), json.dumps(previous) if previous else None,
+                          json.dumps(delta(record, previous)), runs, time.time(), seq)
+                conn.execute("INSERT OR REPLACE INTO snapshots (url, latest, previous, delta, runs, updated_at, seq) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._load([values])
+            return self._snapshots[url]
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Snapshot for a URL, or None if it has never been audited"""
+        with self._lock:
+            self._sync()
+            return self._snapshots.get(url)
+
+    def latest(self, url: str) -> Optional[Dict[str, Any]]:
+        """The latest run of a URL"""
+        snapshot = self.get(url)
+        return snapshot['latest'] if snapshot else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Every snapshot, most recently updated first"""
+        with self._lock:
+            self._sync()
+            return sorted(self._snapshots.values(), key=lambda s: -s['updated_at'])
+
+    def newest(self) -> Optional[Dict[str, Any]]:
+        """The most recently updated snapshot"""
+        with self._lock:
+            self._sync()
+            return max(self._snapshots.values(), key=lambda s: s['updated_at'], default=None)
+
+    def record_cluster(self, summary: Dict[str, Any]):
+        """Make summary (from sitemap.summarize_cluster) the latest one of its cluster"""
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO cluster_summaries (cluster, summary, updated_at) VALUES (?, ?, ?)",
+                (summary['url'], json.dumps(summary), time.time()))
+
+    def clusters(self) -> List[Dict[str, Any]]:
+        """Latest summary of every sampled cluster"""
+        with self._lock:
+            rows = self._connect().execute("SELECT summary, updated_at FROM cluster_summaries ORDER BY cluster")
+            return [{**json.loads(summary), 'updated_at': updated_at} for summary, updated_at in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._sync()
+            return {'urls': len(self._snapshots), 'seq': self._seq}
+
+# Shared snapshot table
+snapshots = SnapshotTable()
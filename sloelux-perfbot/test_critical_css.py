@@ -0,0 +1,89 @@
+"""
+Pruning and inlining tests for critical_css.
+A one-stylesheet theme is matched against a rendered page whose first
+CRITICAL_SECTIONS Shopify sections are above the fold.
+
+    python -m pytest test_critical_css.py
+"""
+
+import os
+import re
+import tempfile
+
+from config import CRITICAL_SECTIONS
+from critical_css import CRITICAL_BLOCK, optimize_theme
+
+CSS = (".hdr{background:url(bg.png)}\n"
+       ".hero{color:red}\n"
+       ".footer{color:blue}\n"
+       ".unused{color:green}\n"
+       "@media (min-width:750px){.hero{font-size:2rem}.unused{margin:0}}\n")
+LAYOUT = ("<html><head>{{ 'base.css' | asset_url | stylesheet_tag }}</head>"
+          "<body>{{ content_for_layout }}</body></html>")
+SECTIONS = ['<div class="shopify-section"><header class="hdr"></header></div>',
+            '<div class="shopify-section"><div class="hero"></div></div>']
+SECTIONS += ['<div class="shopify-section"></div>'] * (CRITICAL_SECTIONS - len(SECTIONS))
+SECTIONS += ['<div class="shopify-section"><footer class="footer"></footer></div>']
+PAGES = {'https://sloelux.com/': f"<html><body>{''.join(SECTIONS)}</body></html>"}
+
+def make_theme(root):
+    for directory, name, text in (('assets', 'base.css', CSS), ('layout', 'theme.liquid', LAYOUT)):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        with open(os.path.join(root, directory, name), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+def read(root, *path):
+    with open(os.path.join(root, *path), encoding='utf-8') as f:
+        return f.read()
+
+def critical_block(layout):
+    return CRITICAL_BLOCK.search(layout).group(0)
+
+def test_unused_rules_are_pruned():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        report = optimize_theme(root, PAGES)
+        pruned = read(root, 'assets', 'base.pruned.css')
+        assert '.unused' not in pruned
+        assert all(name in pruned for name in ('.hdr', '.hero', '.footer', '@media'))
+        assert report['stylesheets']['base.css'] == {'rules': 6, 'rules_kept': 4, 'rules_critical': 3}
+        assert 'layout/theme.liquid' in report['templates']
+
+def test_only_rules_above_the_fold_are_critical():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        optimize_theme(root, PAGES)
+        block = critical_block(read(root, 'layout', 'theme.liquid'))
+        assert '.hero' in block and '.hdr' in block
+        assert '.footer' not in block and '.unused' not in block
+
+def test_relative_urls_point_at_the_assets():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        optimize_theme(root, PAGES)
+        block = critical_block(read(root, 'layout', 'theme.liquid'))
+        assert '.hdr{background:url("{{ \'bg.png\' | asset_url }}")}' in block
+        assert 'url(bg.png)' in read(root, 'assets', 'base.pruned.css')  # Still next to bg.png
+
+def test_stylesheets_load_without_blocking_with_noscript_fallback():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        optimize_theme(root, PAGES)
+        layout = read(root, 'layout', 'theme.liquid')
+        assert layout.index('<style data-critical-css>') < layout.index('base.pruned.css')
+        assert ('<link rel="stylesheet" href="{{ \'base.pruned.css\' | asset_url }}" media="print" '
+                'onload="this.media=\'all\'">') in layout
+        assert "<noscript>{{ 'base.pruned.css' | asset_url | stylesheet_tag }}</noscript>" in layout
+
+def test_rerun_rewrites_the_layout_in_place():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        optimize_theme(root, PAGES)
+        first = read(root, 'layout', 'theme.liquid')
+        report = optimize_theme(root, PAGES)
+        layout = read(root, 'layout', 'theme.liquid')
+        assert layout == first
+        assert report['templates'] == []
+        assert len(CRITICAL_BLOCK.findall(layout)) == 1
+        assert len(re.findall(r'<noscript>', layout)) == 1
+        assert not os.path.exists(os.path.join(root, 'assets', 'base.pruned.pruned.css'))
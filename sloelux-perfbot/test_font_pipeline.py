@@ -0,0 +1,73 @@
+"""
+Subsetting tests for font_pipeline.
+A theme font is subset to the sampled pages' glyphs; characters the
+sample missed must still be served by the original font.
+
+    python -m pytest test_font_pipeline.py
+"""
+
+import os
+import re
+import tempfile
+
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+from font_pipeline import FALLBACK_MARK, optimize_theme
+
+CHARACTERS = [*range(0x20, 0x7f), 0xe8, 0x100, 0x3a9]  # ASCII, è, Ā and Ω (outside FONT_BASE_TEXT)
+
+def build_font(path):
+    names = ['.notdef'] + [f"uni{c:04X}" for c in CHARACTERS]
+    pen = TTGlyphPen(None)
+    pen.moveTo((0, 0))
+    pen.lineTo((0, 500))
+    pen.lineTo((400, 500))
+    pen.closePath()
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(names)
+    builder.setupCharacterMap({c: f"uni{c:04X}" for c in CHARACTERS})
+    builder.setupGlyf({name: pen.glyph() for name in names})
+    builder.setupHorizontalMetrics({name: (500, 0) for name in names})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({'familyName': 'Test Sans', 'styleName': 'Regular'})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(path)
+
+def make_theme(root):
+    os.makedirs(os.path.join(root, 'assets'))
+    os.makedirs(os.path.join(root, 'layout'))
+    build_font(os.path.join(root, 'assets', 'test-sans.ttf'))
+    with open(os.path.join(root, 'assets', 'base.css'), 'w', encoding='utf-8') as f:
+        f.write("@font-face{font-family:'Test Sans';src:url('test-sans.ttf') format('truetype')}\n"
+                "body{font-family:'Test Sans',sans-serif}")
+    with open(os.path.join(root, 'layout', 'theme.liquid'), 'w', encoding='utf-8') as f:
+        f.write('<html><head>{{ "base.css" | asset_url | stylesheet_tag }}</head><body></body></html>')
+
+def faces(root):
+    with open(os.path.join(root, 'assets', 'base.css'), encoding='utf-8') as f:
+        return re.findall(r'@font-face\s*\{[^{}]*\}', f.read())
+
+PAGES = {'https://example.com/': '<html><body><p>Hello</p></body></html>'}
+
+def test_subset_keeps_latin_and_falls_back_to_original():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        result = optimize_theme(root, PAGES)
+        assert result['fonts']['test-sans.ttf']['bytes_after'] > 0
+        subset_face, fallback_face = faces(root)
+        assert "url('test-sans.subset.woff2') format('woff2')" in subset_face
+        assert 'unicode-range: U+20-7E, U+E8, U+100;' in subset_face
+        assert FALLBACK_MARK in fallback_face
+        assert "url('test-sans.ttf') format('truetype')" in fallback_face
+        assert 'unicode-range: U+3A9;' in fallback_face
+        assert all('font-display: swap' in face for face in (subset_face, fallback_face))
+
+def test_rerun_does_not_duplicate_fallback():
+    with tempfile.TemporaryDirectory() as root:
+        make_theme(root)
+        optimize_theme(root, PAGES)
+        first = faces(root)
+        optimize_theme(root, PAGES)
+        assert faces(root) == first
@@ -0,0 +1,53 @@
+"""
+Conversion tests for image_pipeline and the optimize_image tool.
+Sources are real (noisy, so compressible) images encoded by Pillow.
+
+    python -m pytest test_image_pipeline.py
+"""
+
+import os
+import random
+import tempfile
+
+from PIL import Image
+
+from image_pipeline import optimize_images, supported_formats
+from tools import optimize_image
+
+def make_photo(path, size=(640, 480)):
+    rng = random.Random(path)
+    image = Image.new('RGB', size)
+    image.putdata([(x % 256, y % 256, rng.randrange(64)) for y in range(size[1]) for x in range(size[0])])
+    image.save(path, quality=95)
+
+def test_converts_and_maps_each_source():
+    with tempfile.TemporaryDirectory() as root:
+        assets, output = os.path.join(root, 'assets'), os.path.join(root, 'out')
+        os.makedirs(assets)
+        make_photo(os.path.join(assets, 'hero.jpg'))
+        report = optimize_images(assets, output_dir=output, formats=['webp'], workers=1)
+
+        source = os.path.join(assets, 'hero.jpg')
+        assert (report['processed'], report['failed']) == (1, 0)
+        assert report['bytes_out'] < report['bytes_in']
+        path = report['files'][source]['webp']
+        assert path.startswith(output)
+        with Image.open(path) as converted:
+            assert (converted.format, converted.size) == ('WEBP', (640, 480))
+
+        again = optimize_images(assets, output_dir=output, formats=['webp'], workers=1)
+        assert (again['processed'], again['cached']) == (0, 1)
+        assert again['files'] == report['files']
+
+def test_tool_returns_the_mapping():
+    with tempfile.TemporaryDirectory() as root:
+        make_photo(os.path.join(root, 'hero.jpg'))
+        cwd = os.getcwd()
+        os.chdir(root)  # IMAGE_OUTPUT_DIR is relative
+        try:
+            result = optimize_image.func(root)
+        finally:
+            os.chdir(cwd)
+        outputs = result['files'][os.path.join(root, 'hero.jpg')]
+        assert set(outputs) == set(supported_formats())
+        assert all(os.path.exists(os.path.join(root, path)) for path in outputs.values())
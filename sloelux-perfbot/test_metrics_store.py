@@ -0,0 +1,80 @@
+"""
+Round-trip tests for the segmented metrics store.
+
+    python -m pytest test_metrics_store.py
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from metrics_store import MetricsStore
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+def record(i, epoch=None):
+    return {'url': f"https://sloelux.com/products/{i % 3}", 'lcp': 2.0 + i / 100, 'tbt': 100 + i,
+            'timestamp': iso(1_700_000_000 + i * 60 if epoch is None else epoch),
+            'opportunities': [{'id': 'unused-css-rules', 'savings': i}]}
+
+def test_append_and_read_round_trip():
+    with tempfile.TemporaryDirectory() as root:
+        store = MetricsStore(root, legacy_log=None)
+        records = [record(i) for i in range(10)]
+        positions = store.append_many(records)
+        assert [store.read(p) for p in positions] == records
+        assert store.tail(3) == records[-3:]
+        assert store.history('https://sloelux.com/products/0', 2) == [records[9], records[6]]
+        assert MetricsStore(root, legacy_log=None).latest('https://sloelux.com/products/1') == records[7]
+
+def test_index_holds_the_record_timestamp():
+    with tempfile.TemporaryDirectory() as root:
+        store = MetricsStore(root, legacy_log=None)
+        stamped, unstamped = store.append_many([record(0), {'url': 'https://sloelux.com/'}], timestamp=42.0)
+        assert dict(store.entries())[stamped][3] == 1_700_000_000
+        assert dict(store.entries())[unstamped][3] == 42.0
+
+def test_legacy_import_keeps_each_record_time():
+    with tempfile.TemporaryDirectory() as root:
+        legacy = os.path.join(root, 'performance_log.json')
+        records = [record(i) for i in (2, 0, 1)]  # Out of order
+        with open(legacy, 'w') as f:
+            f.writelines(json.dumps(r) + '\n' for r in records)
+        store = MetricsStore(os.path.join(root, 'store'), legacy_log=legacy)
+        entries = list(store.entries())
+        assert [entry[3] for _, entry in entries] == [1_700_000_120, 1_700_000_060, 1_700_000_000]
+        assert [store.read(p)['tbt'] for p, _ in entries] == [102, 101, 100]
+
+def test_select_filters_on_record_time():
+    with tempfile.TemporaryDirectory() as root:
+        store = MetricsStore(root, legacy_log=None)
+        positions = store.append_many([record(i) for i in range(10)])
+        since, until = 1_700_000_000 + 3 * 60, 1_700_000_000 + 7 * 60
+        assert store.select(since=since, until=until, limit=10) == (positions[6:2:-1], False)
+        assert store.select(since=since, until=until, limit=2) == (positions[6:4:-1], True)
+        assert store.select(since=since, until=until, before=positions[5], limit=10) == (positions[4:2:-1], False)
+        url_positions, _ = store.select('https://sloelux.com/products/0', since=since, limit=10)
+        assert url_positions == [positions[9], positions[6], positions[3]]
+
+def test_late_stamped_record_is_still_selected():
+    with tempfile.TemporaryDirectory() as root:
+        store = MetricsStore(root, legacy_log=None)
+        first, late = store.append_many([record(0, epoch=1_700_000_100), record(1, epoch=1_700_000_050)])
+        assert store.select(since=1_700_000_040, limit=10) == ([late, first], False)
+        assert store.select(until=1_700_000_060, limit=10) == ([late], False)
+
+def test_compacted_segments_read_back_unchanged():
+    with tempfile.TemporaryDirectory() as root:
+        store = MetricsStore(root, segment_bytes=2000, legacy_log=None)
+        records = [record(i) for i in range(60)]
+        positions = store.append_many(records)
+        compacted = store.compact_sealed(block_records=4)
+        assert len(compacted) > 1
+
+        reopened = MetricsStore(root, segment_bytes=2000, legacy_log=None)
+        assert [reopened.read(p) for p in positions] == records
+        assert reopened.history('https://sloelux.com/products/2', 3) == [records[59], records[56], records[53]]
+        since = 1_700_000_000 + 10 * 60
+        assert reopened.select(since=since, until=since + 5 * 60, limit=10) == (positions[14:9:-1], False)
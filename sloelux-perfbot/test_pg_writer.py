@@ -0,0 +1,107 @@
+"""
+Spool tests for the Postgres write-behind writer.
+_write stands in for the database, so no Postgres is needed.
+
+    python -m pytest test_pg_writer.py
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+import psycopg2
+
+from pg_writer import PgWriter
+
+def metric(i):
+    return {'url': f"https://sloelux.com/products/{i}", 'lcp': 2.0, 'tbt': 100, 'inp': 'good', 'inp_ms': 150,
+            'timestamp': '2026-01-01T00:00:00+00:00'}
+
+class FakeWriter(PgWriter):
+    """PgWriter whose database is a shared list, unreachable while `down`"""
+
+    def __init__(self, spool_path, written):
+        super().__init__(spool_path=spool_path)
+        self.written = written
+        self.down = False
+        self.during_write = None
+
+    def _ensure_thread(self):
+        pass  # Tests flush explicitly
+
+    def _write(self, rows):
+        if self.down:
+            raise psycopg2.OperationalError('connection refused')
+        if self.during_write:
+            self.during_write()
+        self.written.extend(r['url'] for r in rows['metrics'])
+
+def spool_outage(writer, ids):
+    """Flush metrics while Postgres is down, so they land in the spool"""
+    writer.down = True
+    for i in ids:
+        writer.add_metric(metric(i))
+    writer.flush()
+    writer.down = False
+
+def test_rows_spooled_during_another_flush_survive():
+    with tempfile.TemporaryDirectory() as root:
+        spool = os.path.join(root, 'pg_writer.jsonl')
+        written = []
+        first, second = FakeWriter(spool, written), FakeWriter(spool, written)
+        spool_outage(first, [0])
+
+        # While the first writer replays the spool, the second spools a row of its own
+        other = threading.Thread(target=spool_outage, args=(second, [1]))
+        def start_other():
+            other.start()
+            time.sleep(0.2)
+        first.during_write = start_other
+        assert first.flush() == 1
+        other.join()
+
+        assert written == [metric(0)['url']]
+        assert second.flush() == 1
+        assert written == [metric(0)['url'], metric(1)['url']]
+
+def test_concurrent_flushes_replay_the_spool_once():
+    with tempfile.TemporaryDirectory() as root:
+        spool = os.path.join(root, 'pg_writer.jsonl')
+        written = []
+        writers = [FakeWriter(spool, written) for _ in range(4)]
+        spool_outage(writers[0], range(100))
+        for writer in writers:
+            writer.during_write = lambda: time.sleep(0.05)
+
+        threads = [threading.Thread(target=writer.flush) for writer in writers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(written) == sorted(metric(i)['url'] for i in range(100))
+
+class PickyWriter(FakeWriter):
+    """Postgres refuses any batch holding a metric without an LCP"""
+
+    def _write(self, rows):
+        if any(r['lcp'] is None for r in rows['metrics']):
+            raise psycopg2.errors.NotNullViolation('null value in column "lcp"')
+        super()._write(rows)
+
+def test_rejected_batch_sets_aside_only_the_offending_rows():
+    with tempfile.TemporaryDirectory() as root:
+        spool = os.path.join(root, 'pg_writer.jsonl')
+        written = []
+        writer = PickyWriter(spool, written)
+        spool_outage(writer, range(10))
+        for i in range(10, 20):
+            writer.add_metric({**metric(i), 'lcp': None} if i in (12, 17) else metric(i))
+
+        assert writer.flush() == 18
+        assert sorted(written) == sorted(metric(i)['url'] for i in range(20) if i not in (12, 17))
+        with open(f"{spool}.rejected") as f:
+            assert [json.loads(line)['row']['url'] for line in f] == [metric(12)['url'], metric(17)['url']]
+        assert not os.path.exists(spool)
+        assert writer.stats()['rows_rejected'] == 2
@@ -0,0 +1,31 @@
+"""
+Width-ladder tests for responsive_images.
+The first (generating) run and later (cached) runs must list the same
+variants, and the source must only ever be listed at its real width.
+
+    python -m pytest test_responsive_images.py
+"""
+
+import tempfile
+
+from PIL import Image
+
+from responsive_images import generate_variants
+
+def ladders(size, widths):
+    """Variants reported by the generating run and by the cached run"""
+    with tempfile.TemporaryDirectory() as asset_dir:
+        Image.new('RGB', size, 'red').save(f"{asset_dir}/big.jpg")
+        first = generate_variants(asset_dir, widths, workers=1)
+        second = generate_variants(asset_dir, widths, workers=1)
+    assert (first['generated'], second['cached']) == (1, 1)
+    return first['variants']['big.jpg'], second['variants']['big.jpg']
+
+def test_source_listed_at_real_width():
+    first, second = ladders((4800, 3200), [400, 800, 1600, 2400])
+    assert first == second == {400: 'big-400w.jpg', 800: 'big-800w.jpg', 1600: 'big-1600w.jpg',
+                                2400: 'big-2400w.jpg', 4800: 'big.jpg'}
+
+def test_drafted_rung_gets_its_own_variant():
+    first, second = ladders((3200, 2000), [1600, 800])
+    assert first == second == {800: 'big-800w.jpg', 1600: 'big-1600w.jpg', 3200: 'big.jpg'}
@@ -0,0 +1,38 @@
+"""
+Boost tests for the durable audit schedule.
+
+    python -m pytest test_scheduler.py
+"""
+
+import os
+import tempfile
+
+from config import SCHEDULE_BOOST_SCORE_DROP
+from scheduler import Scheduler
+
+URL = 'https://sloelux.com/'
+
+def boosted(scheduler, now):
+    return scheduler.stats(now)['boosted'] == 1
+
+def audited(scores, statuses=None):
+    """Whether the URL ends up boosted after audits with these scores"""
+    with tempfile.TemporaryDirectory() as root:
+        scheduler = Scheduler(os.path.join(root, 'schedule.db'))
+        scheduler.sync([URL], now=0)
+        for i, score in enumerate(scores):
+            status = statuses[i] if statuses else 'fail'
+            scheduler.complete(URL, 'test', status, score=score, now=i)
+        return boosted(scheduler, len(scores))
+
+def test_score_drop_boosts():
+    assert audited([90, 90 - SCHEDULE_BOOST_SCORE_DROP])
+
+def test_small_score_drop_does_not_boost():
+    assert not audited([90, 90 - SCHEDULE_BOOST_SCORE_DROP + 1])
+
+def test_errors_keep_the_last_score():
+    assert audited([90, None, 90 - SCHEDULE_BOOST_SCORE_DROP], ['fail', 'error', 'fail'])
+
+def test_pass_to_fail_boosts():
+    assert audited([90, 90], ['pass', 'fail'])
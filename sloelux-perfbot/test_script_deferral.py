@@ -0,0 +1,83 @@
+"""
+Dependency-plan tests for script_deferral.
+Each fixture is a small theme snapshot; the plan must keep a script
+blocking whenever something that runs during parsing uses its globals.
+
+    python -m pytest test_script_deferral.py
+"""
+
+import os
+import tempfile
+
+from script_deferral import collect_scripts, plan
+
+def make_theme(root, layout, assets=None, sections=None):
+    for directory, files in (('layout', {'theme.liquid': layout}), ('assets', assets or {}),
+                             ('sections', sections or {})):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        for name, text in files.items():
+            with open(os.path.join(root, directory, name), 'w', encoding='utf-8') as f:
+                f.write(text)
+    return root
+
+def planned(layout, assets=None, sections=None):
+    """{script name: action} for the deferred scripts and the names of the kept ones"""
+    with tempfile.TemporaryDirectory() as root:
+        result = plan(collect_scripts(make_theme(root, layout, assets, sections)))
+    return {p['script']: p['action'] for p in result['patches']}, {k['script'] for k in result['kept']}
+
+JQUERY = "<script src=\"{{ 'jquery.min.js' | asset_url }}\"></script>\n"
+
+def test_independent_asset_is_deferred():
+    patches, kept = planned(JQUERY + "<script src=\"{{ 'theme.js' | asset_url }}\"></script>",
+                            assets={'jquery.min.js': '/* jQuery */', 'theme.js': "jQuery('.x').show();"})
+    assert patches == {'jquery.min.js': 'defer', 'theme.js': 'defer'}
+    assert not kept
+
+def test_inline_use_during_parsing_keeps_script_blocking():
+    patches, kept = planned(JQUERY + "<script>jQuery('.no-js').removeClass('no-js');</script>",
+                            assets={'jquery.min.js': '/* jQuery */'})
+    assert not patches
+    assert kept == {'jquery.min.js'}
+
+def test_use_inside_domcontentloaded_callback_allows_defer():
+    patches, _ = planned(JQUERY + "<script>\n"
+                         "  document.addEventListener('DOMContentLoaded', function () {\n"
+                         "    jQuery('.slider').show();\n"
+                         "  });\n"
+                         "</script>", assets={'jquery.min.js': '/* jQuery */'})
+    assert patches == {'jquery.min.js': 'defer'}
+
+def test_top_level_code_next_to_handler_keeps_script_blocking():
+    patches, kept = planned(JQUERY + "<script>jQuery('.no-js').removeClass('no-js');\n"
+                            "document.addEventListener('DOMContentLoaded', () => { console.log('ready'); });</script>",
+                            assets={'jquery.min.js': '/* jQuery */'})
+    assert not patches
+    assert kept == {'jquery.min.js'}
+
+def test_handler_without_inline_callback_runs_during_parsing():
+    patches, kept = planned(JQUERY + "<script>window.addEventListener('load', jQuery.noop);</script>",
+                            assets={'jquery.min.js': '/* jQuery */'})
+    assert not patches
+    assert kept == {'jquery.min.js'}
+
+def test_self_assignment_is_provided():
+    patches, kept = planned("<script src=\"{{ 'settings.js' | asset_url }}\"></script>\n"
+                            "<script>document.documentElement.dataset.theme = themeSettings.scheme;</script>",
+                            assets={'settings.js': "self.themeSettings = { scheme: 'light' };"})
+    assert not patches
+    assert kept == {'settings.js'}
+
+def test_global_this_and_indented_declarations_are_provided():
+    for asset in ("globalThis.themeSettings = {};", "(function () {\n  this.themeSettings = {};\n}).call(window);",
+                  "if (!window.themeSettings) {\n    var themeSettings = {};\n}"):
+        patches, kept = planned("<script src=\"{{ 'settings.js' | asset_url }}\"></script>\n"
+                                "<script>console.log(themeSettings);</script>", assets={'settings.js': asset})
+        assert kept == {'settings.js'}, asset
+
+def test_synchronous_consumer_in_section_keeps_chain_blocking():
+    layout = JQUERY + "<script src=\"{{ 'plugin.js' | asset_url }}\"></script>\n{{ content_for_layout }}"
+    patches, kept = planned(layout, assets={'jquery.min.js': '', 'plugin.js': 'function initHero() { jQuery(".hero"); }'},
+                            sections={'hero.liquid': "<script>initHero();</script>"})
+    assert not patches
+    assert kept == {'jquery.min.js', 'plugin.js'}
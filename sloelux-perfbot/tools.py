@@ -1,52 +1,74 @@
 from google.adk.tools import FunctionTool
 import os
 import requests
-import json
-import time
+from datetime import datetime, timezone
 from typing import Dict, List, Any
-from functools import wraps
+from http_client import http_client
+from metrics_store import metrics_store
+from snapshots import snapshots
+from response_cache import response_cache
+from db import db_enabled
+from pg_writer import pg_writer
+from lighthouse import LighthouseReport
+from image_pipeline import optimize_images
+import responsive_images
+import critical_css
+import script_deferral
+import font_pipeline
+from pagespeed import fetch_report
+from config import SLACK_WEBHOOK_URL, THEME_DIR
 
 PSI_KEY = os.getenv("PSI_KEY")
 SHOP_DOMAIN = os.getenv("SHOP_DOMAIN")
 SHOP_TOKEN = os.getenv("SHOP_TOKEN")
 PREVIEW_THEME_ID = os.getenv("PREVIEW_THEME_ID")  # Duplicate theme for testing
 
-def rate_limit(calls_per_second: float = 0.5):
-    """Rate limiting decorator - default 0.5 calls/second (2 seconds between calls)"""
-    min_interval = 1.0 / calls_per_second
-    last_called = [0.0]
-    
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            elapsed = time.time() - last_called[0]
-            left_to_wait = min_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kwargs)
-            last_called[0] = time.time()
-            return ret
-        return wrapper
-    return decorator
+# Mock data returned when no PSI key is configured
+DEMO_PAGESPEED = {
+    'lcp': 2.5,
+    'tbt': 150,
+    'inp': 'good',
+    'performance_score': 75,
+    'opportunities': [
+        {'id': 'unused-css-rules', 'title': 'Remove unused CSS', 'savings': 500},
+        {'id': 'render-blocking-resources', 'title': 'Eliminate render-blocking resources', 'savings': 300}
+    ]
+}
 
-@FunctionTool
-def fetch_pagespeed(url: str) -> Dict[str, Any]:
-    """Fetch PageSpeed Insights data for a given URL."""
-    api_key = os.getenv('PSI_KEY', 'demo_key')
-    
-    # Mock data for demo
+INP_CATEGORIES = {'FAST': 'good', 'AVERAGE': 'needs-improvement', 'SLOW': 'poor'}
+
+def summarize_pagespeed(report: LighthouseReport) -> Dict[str, Any]:
+    """Reduce a Lighthouse report to the metrics the bot tracks."""
     return {
-        'url': url,
-        'lcp': 2.5,
-        'tbt': 150,
-        'inp': 'good',
-        'performance_score': 75,
+        'url': report.url,
+        'lcp': report.numeric('largest-contentful-paint') / 1000,
+        'tbt': report.numeric('total-blocking-time'),
+        'inp': INP_CATEGORIES.get(report.field_inp_category, 'unknown'),
+        'inp_ms': report.field_inp_ms,
+        'performance_score': round((report.performance_score or 0) * 100),
         'opportunities': [
-            {'id': 'unused-css-rules', 'title': 'Remove unused CSS', 'savings': 500},
-            {'id': 'render-blocking-resources', 'title': 'Eliminate render-blocking resources', 'savings': 300}
+            {'id': audit.id, 'title': audit.title, 'savings': audit.savings_ms}
+            for audit in report.opportunities()
         ]
     }
 
+async def fetch_pagespeed_async(url: str, strategy: str = 'mobile') -> Dict[str, Any]:
+    """Fetch PageSpeed Insights data for a URL through the shared PSI client."""
+    if not PSI_KEY:
+        return {'url': url, **DEMO_PAGESPEED}
+    
+    try:
+        report = await fetch_report(url, strategy)
+    except Exception as e:
+        return {'url': url, 'error': str(e)}
+    
+    return summarize_pagespeed(report)
+
+@FunctionTool
+def fetch_pagespeed(url: str) -> Dict[str, Any]:
+    """Fetch PageSpeed Insights data for a given URL."""
+    return http_client.run_sync(fetch_pagespeed_async(url))
+
 @FunctionTool
 def classify_issues(pagespeed_data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Classify PageSpeed issues into actionable categories."""
@@ -56,7 +78,8 @@ def classify_issues(pagespeed_data: Dict[str, Any]) -> List[Dict[str, Any]]:
     priority_map = {
         'unused-css-rules': 'high',
         'render-blocking-resources': 'critical',
-        'unoptimized-images': 'high'
+        'unoptimized-images': 'high',
+        'uses-responsive-images': 'high'
     }
     
     for opp in opportunities:
@@ -73,27 +96,63 @@ def classify_issues(pagespeed_data: Dict[str, Any]) -> List[Dict[str, Any]]:
     
     return issues
 
+# Optimizations applied to the local theme snapshot, by PSI audit id
+THEME_OPTIMIZERS = {
+    'uses-responsive-images': responsive_images.optimize_theme,
+    'unused-css-rules': critical_css.optimize_theme,
+    'render-blocking-resources': script_deferral.optimize_theme,
+    'font-display': font_pipeline.optimize_theme
+}
+
 @FunctionTool
 def optimize_shopify_theme(shop_domain: str, issue_type: str) -> Dict[str, Any]:
     """Apply optimizations to Shopify theme."""
-    return {
+    result = {
         "action": f"Optimized {issue_type}",
         "status": "completed",
         "shop_domain": shop_domain,
         "safety_check": "preview_theme_only"
     }
+    optimizer = THEME_OPTIMIZERS.get(issue_type)
+    if optimizer:
+        if not os.path.isdir(THEME_DIR):
+            return {**result, "status": "skipped", "message": f"No theme snapshot at {THEME_DIR}"}
+        result["report"] = optimizer(THEME_DIR)
+    response_cache.invalidate()
+    return result
+
+@FunctionTool
+def optimize_image(asset_dir: str) -> Dict[str, Any]:
+    """Convert the theme images under asset_dir to WebP/AVIF; report the bytes saved and, under `files`, each source's outputs."""
+    if not os.path.isdir(asset_dir):
+        return {"status": "error", "message": f"No asset directory at {asset_dir}"}
+    
+    report = optimize_images(asset_dir)
+    return {"status": "success" if not report['failed'] else "partial", **report}
 
 @FunctionTool
 def store_metrics(metrics: Dict[str, Any]) -> Dict[str, str]:
     """Store performance metrics."""
-    with open('performance_log.json', 'a') as f:
-        f.write(json.dumps(metrics) + '\n')
+    record = dict(metrics)
+    record.setdefault('timestamp', datetime.now(timezone.utc).isoformat())
+    metrics_store.append(record)
+    snapshots.update(record)
+    if db_enabled():
+        pg_writer.add_metric(record)
+    response_cache.invalidate()
     
     return {"status": "success", "message": "Metrics stored"}
 
 @FunctionTool
 def send_slack_notification(message: str) -> Dict[str, str]:
     """Send Slack notification."""
+    if SLACK_WEBHOOK_URL:
+        response = http_client.request_sync('POST', SLACK_WEBHOOK_URL, json={
+            'text': f"[SLOE LUX Performance] {message}"
+        }, timeout=10)
+        if not response.ok:
+            return {"status": "error", "message": f"Slack returned HTTP {response.status}"}
+    
     return {"status": "success", "message": f"Sent: {message[:50]}..."}
 
  
\ No newline at end of file